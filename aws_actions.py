@@ -1,8 +1,13 @@
-import boto3
-import config
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
 
-credentials = config.CredentialsConfig()
-aws_config = config.AWSConfig()
+import config
+import metrics
 
 
 class InstanceState:
@@ -14,21 +19,92 @@ class InstanceState:
     stopped = 80
 
 
+#
+# A point-in-time view of the instance, taken from a single DescribeInstances.
+# Snapshots compare equal if the instance looks the same, whenever they were taken.
+#
+@dataclass(frozen=True)
+class InstanceSnapshot:
+    state_code: int
+    state_name: str
+    state_reason: str
+    ip_address: Optional[str]
+    taken_at: float = field(compare=False)
+
+
+# Build an InstanceSnapshot from an instance in a DescribeInstances response.
+def snapshot_from_description(instance: dict) -> InstanceSnapshot:
+    return InstanceSnapshot(
+        state_code=instance['State']['Code'],
+        state_name=instance['State']['Name'],
+        state_reason=instance.get('StateTransitionReason', ''),
+        ip_address=instance.get('PublicIpAddress'),
+        taken_at=time.monotonic()
+    )
+
+
+# Create a boto3 session for a region using the configured credentials.
+def create_session(region: str):
+    # boto3 is slow to import, so it's left until the first session is needed.
+    import boto3
+
+    credentials = config.credentials()
+    return boto3.Session(
+        aws_access_key_id=credentials.aws_access_key_id,
+        aws_secret_access_key=credentials.aws_secret_access_key,
+        region_name=region
+    )
+
+
+#
+# Creates one session per region, the first time each one is needed, so that
+# managers in the same region share a session without creating it up front.
+#
+class SessionCache:
+    def __init__(self, factory: Callable = create_session):
+        self._factory = factory
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, region: str):
+        with self._lock:
+            if region not in self._sessions:
+                self._sessions[region] = self._factory(region)
+            return self._sessions[region]
+
+
 class AWSManager:
-    def __init__(self):
-        self._session = boto3.Session(
-            aws_access_key_id=credentials.aws_access_key_id,
-            aws_secret_access_key=credentials.aws_secret_access_key,
-            region_name=aws_config.region
-        )
-        self._ec2 = self._session.resource('ec2')
-        self._instance = self._ec2.Instance(aws_config.instance)
+    # A session can be passed in to point the manager at a stubbed or local EC2,
+    # or a SessionCache to share sessions between managers. Either way the EC2
+    # resource is only created on first use, which is on the AWS threads when
+    # used through AsyncAWSManager, so creating a manager is cheap. Snapshots
+    # of the instance are reused for cache_ttl seconds.
+    def __init__(self, instance_id: str = None, session=None, cache_ttl: float = 0, region: str = None,
+                 sessions: SessionCache = None):
+        if instance_id is None:
+            instance_id = config.aws().instance
+
+        if region is None:
+            region = session.region_name if session is not None else config.aws().region
+
+        self._instance_id = instance_id
+        self._region = region
+        self._session = session
+        self._sessions = sessions or SessionCache()
+        self._ec2 = None
+        self._instance = None
+        self._resource_lock = threading.Lock()
+
+        self._cache_ttl = cache_ttl
+        self._snapshot = None
+        self._describe_lock = threading.Lock()
 
     def start(self) -> tuple:
-        self._refresh()
-        state = self._instance.state['Code']
+        state = self._describe(max_age=0).state_code
         if state == InstanceState.stopped:
-            self._instance.start()
+            with metrics.track(metrics.aws_calls, metrics.aws_latency, call='StartInstances'):
+                self.instance.start()
+            self.invalidate()
             return (True, 'Starting instance...')
         elif state == InstanceState.running:
             return (False, 'The instance is already running.')
@@ -40,10 +116,11 @@ class AWSManager:
             return (False, 'The instance cannot be started from it\'s current state')
 
     def stop(self):
-        self._refresh()
-        state = self._instance.state['Code']
+        state = self._describe(max_age=0).state_code
         if state == InstanceState.running:
-            self._instance.stop()
+            with metrics.track(metrics.aws_calls, metrics.aws_latency, call='StopInstances'):
+                self.instance.stop()
+            self.invalidate()
             return (True, 'Stopping instance...')
         elif state == InstanceState.stopping:
             return (False, 'The instance is already stopping.')
@@ -55,22 +132,168 @@ class AWSManager:
             return (False, 'The instance cannot be stopped from it\'s current state.')
 
     def get_status(self) -> dict:
-        self._refresh()
+        snapshot = self._describe()
         return {
-            'instance_id': aws_config.instance,
-            'state_code': self._instance.state['Code'],
-            'state_name': self._instance.state['Name'],
-            'state_reason': self._instance.state_transition_reason,
-            'ip_address': self._instance.public_ip_address
+            'instance_id': self._instance_id,
+            'state_code': snapshot.state_code,
+            'state_name': snapshot.state_name,
+            'state_reason': snapshot.state_reason,
+            'ip_address': snapshot.ip_address
         }
 
     def get_state(self) -> int:
-        self._refresh()
-        return self._instance.state['Code']
+        return self._describe().state_code
 
     def get_public_ip(self) -> str:
-        self._refresh()
-        return self._instance.public_ip_address
+        return self._describe().ip_address
+
+    def get_snapshot(self) -> InstanceSnapshot:
+        return self._describe()
+
+    @property
+    def instance_id(self) -> str:
+        return self._instance_id
+
+    @property
+    def region(self) -> str:
+        return self._region
+
+    # Create the session, if there isn't one yet, and the EC2 resource now
+    # rather than on first use.
+    def prepare(self):
+        with self._resource_lock:
+            if self._ec2 is None:
+                if self._session is None:
+                    self._session = self._sessions.get(self._region)
+                self._ec2 = self._session.resource('ec2')
+                self._instance = self._ec2.Instance(self._instance_id)
+
+    @property
+    def client(self):
+        if self._ec2 is None:
+            self.prepare()
+        return self._ec2.meta.client
+
+    @property
+    def instance(self):
+        if self._instance is None:
+            self.prepare()
+        return self._instance
+
+    # Store a snapshot described elsewhere, such as by describe_many.
+    def prime(self, snapshot: InstanceSnapshot):
+        with self._describe_lock:
+            self._snapshot = snapshot
+
+    # Drop the cached snapshot so that the next getter describes the instance again.
+    def invalidate(self):
+        with self._describe_lock:
+            self._snapshot = None
+
+    # Get a snapshot that is at most max_age seconds old, defaulting to the
+    # cache TTL. Callers that arrive while a describe is in flight wait for it
+    # and share its result, rather than sending their own.
+    def _describe(self, max_age: float = None) -> InstanceSnapshot:
+        if max_age is None:
+            max_age = self._cache_ttl
+
+        requested_at = time.monotonic()
+
+        with self._describe_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and \
+                    (snapshot.taken_at >= requested_at or requested_at - snapshot.taken_at <= max_age):
+                return snapshot
+
+            with metrics.track(metrics.aws_calls, metrics.aws_latency, call='DescribeInstances'):
+                response = self.client.describe_instances(InstanceIds=[self._instance_id])
+            instance = response['Reservations'][0]['Instances'][0]
+
+            self._snapshot = snapshot_from_description(instance)
+            return self._snapshot
+
+
+# Describe the instances of several managers with one DescribeInstances call
+# per region, prime each manager's cache with the result and return the
+# snapshots by instance ID.
+#
+# The instances are picked with a filter rather than InstanceIds, as EC2 fails
+# the whole call if any of the IDs doesn't exist or is malformed. With the
+# filter those instances are just left out of the result.
+def describe_many(managers: list) -> dict:
+    regions = {}
+    for manager in managers:
+        regions.setdefault(manager.region, []).append(manager)
+
+    snapshots = {}
+    for region_managers in regions.values():
+        client = region_managers[0].client
+        instance_ids = list({manager.instance_id for manager in region_managers})
+        arguments = {'Filters': [{'Name': 'instance-id', 'Values': instance_ids}]}
+
+        while True:
+            with metrics.track(metrics.aws_calls, metrics.aws_latency, call='DescribeInstances'):
+                response = client.describe_instances(**arguments)
+
+            for reservation in response['Reservations']:
+                for instance in reservation['Instances']:
+                    snapshots[instance['InstanceId']] = snapshot_from_description(instance)
+
+            if not response.get('NextToken'):
+                break
+            arguments['NextToken'] = response['NextToken']
+
+        for manager in region_managers:
+            if manager.instance_id in snapshots:
+                manager.prime(snapshots[manager.instance_id])
+
+    return snapshots
+
+
+#
+# Async facade over AWSManager. Every call runs on a bounded thread pool, so
+# that the EC2 round trips don't block the event loop and concurrent callers
+# overlap with each other.
+#
+class AsyncAWSManager:
+    # An executor can be passed in to share one pool between several managers.
+    def __init__(self, aws_manager: AWSManager, max_workers: int = 4, executor: ThreadPoolExecutor = None):
+        self._aws_manager = aws_manager
+        self._owns_executor = executor is None
+
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='aws')
+        self._executor = executor
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def start(self) -> tuple:
+        return await self._run(self._aws_manager.start)
+
+    async def stop(self) -> tuple:
+        return await self._run(self._aws_manager.stop)
+
+    async def get_status(self) -> dict:
+        return await self._run(self._aws_manager.get_status)
+
+    async def get_state(self) -> int:
+        return await self._run(self._aws_manager.get_state)
+
+    async def get_public_ip(self) -> str:
+        return await self._run(self._aws_manager.get_public_ip)
+
+    async def get_snapshot(self) -> InstanceSnapshot:
+        return await self._run(self._aws_manager.get_snapshot)
+
+    async def prepare(self):
+        await self._run(self._aws_manager.prepare)
+
+    @property
+    def manager(self) -> AWSManager:
+        return self._aws_manager
 
-    def _refresh(self):
-        self._instance = self._ec2.Instance(aws_config.instance)
\ No newline at end of file
+    def close(self):
+        if self._owns_executor:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,37 @@
+import argparse
+import asyncio
+
+from bench import commands, observation, startup
+
+
+#
+# Run the benchmarks with `python -m bench [commands|observation|startup|all]`. They
+# run the bot against local stand-ins, so no AWS or Discord credentials are needed.
+#
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the bot against local EC2, Macaw and Discord stand-ins.')
+    parser.add_argument('suite', nargs='?', choices=['commands', 'observation', 'startup', 'all'], default='all')
+    parser.add_argument('--users', type=int, default=20, help='Users sending commands at once.')
+    parser.add_argument('--messages', type=int, default=10, help='Commands sent by each user.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated EC2 round trip in seconds.')
+    parser.add_argument('--boot-time', type=float, default=2, help='Seconds the instance takes to start.')
+    parser.add_argument('--stop-time', type=float, default=2, help='Seconds the instance takes to stop.')
+    parser.add_argument('--servers', type=int, default=1, help='Servers in the config for the startup benchmark.')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+
+    if args.suite in ('commands', 'all'):
+        commands.report(loop.run_until_complete(
+            commands.run(users=args.users, messages=args.messages, latency=args.latency)))
+
+    if args.suite in ('observation', 'all'):
+        observation.report(loop.run_until_complete(
+            observation.run(latency=args.latency, boot_time=args.boot_time, stop_time=args.stop_time)))
+
+    if args.suite in ('startup', 'all'):
+        startup.report(startup.run(servers=args.servers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import asyncio
+import itertools
+import time
+
+import metrics
+from bench.harness import BenchEnvironment, percentile, timed_message
+
+# The commands sent by the benchmark, cycled through by each user. Unknown
+# commands and plain chat are included since the bot sees plenty of both.
+COMMANDS = ['>status', '>players', '>dynmap', '>help', '>status all', '>unknown', 'hello']
+
+
+#
+# Send bursts of commands from many users at once to a running server, and
+# report handling latency per command, event loop lag and the number of
+# EC2 and Macaw calls it took.
+#
+async def run(users: int = 20, messages: int = 10, latency: float = 0.05) -> dict:
+    async with BenchEnvironment({'survival': 'running', 'creative': 'running'}, users=users,
+                                latency=latency) as env:
+        monitor = metrics.LoopLagMonitor(interval=0.01)
+        monitor.start()
+
+        async def user(member, offset):
+            commands = itertools.islice(itertools.cycle(COMMANDS), offset, offset + messages)
+            return [(command, await timed_message(env, member, command)) for command in commands]
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(user(member, i) for i, member in enumerate(env.members)))
+        elapsed = time.perf_counter() - start
+
+        await monitor.stop()
+
+        latencies = {}
+        for command, seconds in itertools.chain.from_iterable(results):
+            latencies.setdefault(command, []).append(seconds)
+
+        total = users * messages
+        return {
+            'messages': total,
+            'elapsed': elapsed,
+            'throughput': total / elapsed,
+            'latencies': latencies,
+            'loop_lag_max': monitor.max,
+            'loop_lag_p99': percentile(monitor.samples, 99),
+            'ec2_calls': sum(env.ec2.calls.values()),
+            'macaw_requests': sum(server.requests['status'] for server in env.macaw.values()),
+            'discord_sends': env.channel.calls['send']
+        }
+
+
+def report(result: dict):
+    print('Commands: {messages} messages in {elapsed:.2f}s ({throughput:.1f}/s)'.format(**result))
+    print('  {:<12} {:>6} {:>9} {:>9} {:>9}'.format('command', 'count', 'p50 ms', 'p95 ms', 'max ms'))
+    for command, values in sorted(result['latencies'].items()):
+        print('  {:<12} {:>6} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+            command, len(values), percentile(values, 50) * 1000, percentile(values, 95) * 1000,
+            max(values) * 1000))
+    print('  Loop lag: max {:.1f}ms, p99 {:.1f}ms'.format(result['loop_lag_max'] * 1000,
+                                                          result['loop_lag_p99'] * 1000))
+    print('  EC2 calls: {} ({:.3f}/message)'.format(result['ec2_calls'],
+                                                   result['ec2_calls'] / result['messages']))
+    print('  Macaw /status requests: {} ({:.3f}/message)'.format(result['macaw_requests'],
+                                                                result['macaw_requests'] / result['messages']))
+    print('  Discord sends: {}'.format(result['discord_sends']))
@@ -0,0 +1,159 @@
+import importlib
+import os
+import tempfile
+import time
+from typing import NamedTuple
+
+import config
+from fakes.discord_objects import FakeChannel, FakeGuild, FakeMember, FakeRole
+from fakes.ec2 import FakeEC2
+from fakes.macaw import FakeMacawServer
+
+MACAW_KEY = 'bench'
+OWNER = 1
+
+CREDENTIALS = '''[default]
+aws_access_key_id = bench
+aws_secret_access_key = bench
+discord_bot_token = bench
+macaw_key = {key}
+'''
+
+SETTINGS = '''[default]
+check_delay=1
+poll_min_delay={poll_min_delay}
+poll_max_delay={poll_max_delay}
+observe_timeout=120
+aws_workers=4
+instance_cache_ttl={instance_cache_ttl}
+macaw_connect_timeout=1
+macaw_read_timeout=1
+macaw_status_ttl=1
+macaw_port={macaw_port}
+members_intent=false
+config_watch_interval=0
+embed_edit_interval={embed_edit_interval}
+presence_tracking=false
+starter_role=macaw-starter
+stopper_role=macaw-stopper
+admin_role=macaw-admin
+trusted_role=macaw-trusted-user
+status_role=macaw-status
+owner={owner}
+dynmap_port=8123
+'''
+
+
+# Write a config directory for the benchmarks into directory, with one server
+# per (name, instance, macaw port) in servers. The first server is the default,
+# and takes its port from the settings.
+def write_config(directory: str, servers: list, poll_min_delay: float = 0.2, poll_max_delay: float = 2,
+                 instance_cache_ttl: float = 2, embed_edit_interval: float = 1):
+    with open(os.path.join(directory, 'credentials.ini'), 'w') as f:
+        f.write(CREDENTIALS.format(key=MACAW_KEY))
+
+    with open(os.path.join(directory, 'settings.ini'), 'w') as f:
+        f.write(SETTINGS.format(poll_min_delay=poll_min_delay, poll_max_delay=poll_max_delay,
+                                instance_cache_ttl=instance_cache_ttl,
+                                embed_edit_interval=embed_edit_interval, owner=OWNER,
+                                macaw_port=servers[0][2]))
+
+    lines = []
+    for i, (name, instance, macaw_port) in enumerate(servers):
+        if i == 0:
+            lines += ['[default]', 'region=local', 'name={}'.format(name), 'instance={}'.format(instance)]
+        else:
+            lines += ['', '[server:{}]'.format(name), 'instance={}'.format(instance),
+                      'macaw_port={}'.format(macaw_port)]
+
+    with open(os.path.join(directory, 'aws_config.ini'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def percentile(values: list, p: float) -> float:
+    if len(values) == 0:
+        return 0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Environment(NamedTuple):
+    bot: object
+    ec2: FakeEC2
+    macaw: dict
+    guild: FakeGuild
+    channel: FakeChannel
+    members: list
+
+
+#
+# Runs the bot against local stand-ins for EC2, the Macaw servers and Discord.
+# The bot is created inside a temporary config directory so the real config
+# is never read. Use it with `async with`.
+#
+class BenchEnvironment:
+    # instances maps server names to the state their instance starts in.
+    # latency is the simulated EC2 round trip, boot_time and stop_time are how
+    # long instances take to start and stop.
+    def __init__(self, instances: dict, users: int = 10, latency: float = 0.05, boot_time: float = 2,
+                 stop_time: float = 2, **settings):
+        self._instances = instances
+        self._users = users
+        self._latency = latency
+        self._boot_time = boot_time
+        self._stop_time = stop_time
+        self._settings = settings
+        self._directory = None
+        self._data_dir = None
+        self.env = None
+
+    async def __aenter__(self) -> Environment:
+        self._directory = tempfile.TemporaryDirectory(prefix='macaw-bench-')
+
+        ec2 = FakeEC2({'i-{}'.format(name): state for name, state in self._instances.items()},
+                      latency=self._latency, boot_time=self._boot_time, stop_time=self._stop_time)
+
+        macaw = {}
+        servers = []
+        for name, state in self._instances.items():
+            instance = 'i-{}'.format(name)
+            server = FakeMacawServer(MACAW_KEY, status='running' if state == 'running' else 'starting',
+                                     on_kill=lambda instance=instance: ec2.shut_down(instance))
+            port = await server.start('127.0.0.1')
+            macaw[name] = server
+            servers.append((name, instance, port))
+
+        write_config(self._directory.name, servers, **self._settings)
+        config.registry = config.ConfigRegistry(self._directory.name)
+
+        # Keep the bot's stores out of the real data directory.
+        self._data_dir = config.DATA_DIR
+        config.DATA_DIR = os.path.join(self._directory.name, 'data')
+
+        # main reads its startup settings on import, so it's only imported
+        # once the config points at the benchmark directory.
+        main = importlib.reload(importlib.import_module('main'))
+        fleet = main.Fleet(config.aws(), config.settings(), session_factory=ec2.session, macaw_scheme='http')
+        bot = main.MacawBot(fleet)
+
+        roles = [FakeRole(name) for name in config.settings().roles.values()]
+        guild = FakeGuild(roles)
+        members = [FakeMember(guild, roles) for _ in range(self._users)]
+
+        self.env = Environment(bot, ec2, macaw, guild, FakeChannel(), members)
+        return self.env
+
+    async def __aexit__(self, *exc):
+        await self.env.bot.close()
+        for server in self.env.macaw.values():
+            await server.stop()
+        config.DATA_DIR = self._data_dir
+        self._directory.cleanup()
+
+
+# Run a command as a member and return how long the bot took to handle it.
+async def timed_message(env: Environment, member, content: str) -> float:
+    start = time.perf_counter()
+    await env.bot.on_message(env.channel.receive(member, content))
+    return time.perf_counter() - start
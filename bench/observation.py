@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+import metrics
+from bench.harness import OWNER, BenchEnvironment, timed_message
+from fakes.discord_objects import FakeMember
+
+
+# Wait until the fake Macaw server should be up, then bring Minecraft up after mc_boot_time.
+async def _boot_minecraft(env, name: str, boot_time: float, mc_boot_time: float):
+    await asyncio.sleep(boot_time + mc_boot_time)
+    env.macaw[name].status = 'running'
+
+
+#
+# Start a stopped server and stop it again, observing both to the end, and
+# report how long each took to be seen, how many EC2 and Macaw calls the
+# observation made and how many embed edits reached Discord.
+#
+async def run(latency: float = 0.05, boot_time: float = 2, stop_time: float = 2,
+              mc_boot_time: float = 1) -> dict:
+    async with BenchEnvironment({'survival': 'stopped'}, users=0, latency=latency, boot_time=boot_time,
+                                stop_time=stop_time) as env:
+        owner = FakeMember(env.guild, member_id=OWNER)
+        monitor = metrics.LoopLagMonitor(interval=0.01)
+        monitor.start()
+        result = {}
+
+        for command, expected in (('>start', boot_time + mc_boot_time), ('>stop', stop_time)):
+            env.ec2.calls.clear()
+            env.macaw['survival'].requests.clear()
+            env.channel.calls.clear()
+
+            if command == '>start':
+                booting = asyncio.ensure_future(_boot_minecraft(env, 'survival', boot_time, mc_boot_time))
+
+            start = time.perf_counter()
+            await timed_message(env, owner, command)
+            await env.bot._jobs.join()
+            elapsed = time.perf_counter() - start
+
+            if command == '>start':
+                await booting
+
+            result[command] = {
+                'elapsed': elapsed,
+                'expected': expected,
+                'ec2_calls': dict(env.ec2.calls),
+                'macaw_requests': dict(env.macaw['survival'].requests),
+                'discord': dict(env.channel.calls),
+                'final_state': env.ec2.get_state('i-survival')
+            }
+
+        await monitor.stop()
+        result['loop_lag_max'] = monitor.max
+        return result
+
+
+def report(result: dict):
+    for command in ('>start', '>stop'):
+        run = result[command]
+        print('Observation {}: {:.2f}s (transition takes {:.2f}s), instance {}'.format(
+            command, run['elapsed'], run['expected'], run['final_state']))
+        print('  EC2 calls: {}'.format(run['ec2_calls']))
+        print('  Macaw requests: {}'.format(run['macaw_requests']))
+        print('  Discord calls: {}'.format(run['discord']))
+    print('  Loop lag: max {:.1f}ms'.format(result['loop_lag_max'] * 1000))
@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Runs in a fresh interpreter, so that nothing is already imported. Prints the
+# measurements as JSON.
+SCRIPT = '''
+import json, resource, sys, time
+
+start = time.perf_counter()
+
+import config
+config.registry = config.ConfigRegistry(sys.argv[1])
+config.DATA_DIR = sys.argv[2]
+
+import main
+imported = time.perf_counter()
+
+bot = main.MacawBot(main.Fleet(config.aws(), config.settings()))
+created = time.perf_counter()
+created_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+boto3_loaded = 'boto3' in sys.modules
+
+# What the first EC2 call would have to set up before it can go out.
+for server in bot._fleet:
+    server.aws.manager.prepare()
+ready = time.perf_counter()
+
+print(json.dumps({
+    'import': imported - start,
+    'create': created - imported,
+    'startup': created - start,
+    'startup_rss': created_rss,
+    'boto3_on_startup': boto3_loaded,
+    'backends': ready - created,
+    'total_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+}))
+'''
+
+
+#
+# Measure how long it takes to import the bot and create it, ready to connect
+# to Discord, and how much memory that takes. Creating the AWS backends is
+# timed separately, as it happens on first use. The bot has no servers to
+# talk to, so nothing goes over the network.
+#
+def run(servers: int = 1, repeat: int = 5) -> dict:
+    from bench.harness import write_config
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix='macaw-startup-') as directory:
+        write_config(directory, [('server{}'.format(i), 'i-{}'.format(i), 8080 + i) for i in range(servers)])
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, '-c', SCRIPT, directory, os.path.join(directory, 'data')],
+                                    cwd=root, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    return {'servers': servers, 'runs': runs}
+
+
+def report(result: dict):
+    runs = result['runs']
+
+    def best(key):
+        return min(run[key] for run in runs)
+
+    print('Startup with {} server(s), best of {} runs:'.format(result['servers'], len(runs)))
+    print('  Import main:      {:7.0f}ms'.format(best('import') * 1000))
+    print('  Create bot:       {:7.0f}ms'.format(best('create') * 1000))
+    print('  Ready to connect: {:7.0f}ms, {:.1f}MB resident'.format(
+        best('startup') * 1000, best('startup_rss') / 1024))
+    print('  boto3 imported on startup: {}'.format('yes' if any(run['boto3_on_startup'] for run in runs) else 'no'))
+    print('  AWS backends on first use: {:7.0f}ms, {:.1f}MB resident after'.format(
+        best('backends') * 1000, best('total_rss') / 1024))
@@ -0,0 +1,176 @@
+import re
+import shlex
+from typing import Callable, NamedTuple
+
+import metrics
+
+# The most Minecraft commands that can be issued at once, so that each result
+# fits in a field of one embed.
+MAX_BATCH = 25
+
+
+#
+# Raised by argument parsers when the arguments given to a command are invalid.
+#
+class CommandError(Exception):
+    pass
+
+
+# Argument parser for commands that don't take any arguments.
+def no_args(text: str) -> tuple:
+    if text != '':
+        raise CommandError('This command doesn\'t take any arguments.')
+    return ()
+
+
+# Argument parser that passes everything after the command name through as-is.
+def rest(text: str) -> tuple:
+    return (text,)
+
+
+# Argument parser that splits the arguments shell-style, respecting quotes.
+def words(text: str) -> tuple:
+    try:
+        return tuple(shlex.split(text))
+    except ValueError as e:
+        raise CommandError(str(e))
+
+
+# Argument parser for commands that take exactly one word.
+def one_word(text: str) -> tuple:
+    args = words(text)
+    if len(args) != 1:
+        raise CommandError('One argument must be given.')
+    return (args[0],)
+
+
+# Argument parser for commands that take an optional server name, which is
+# passed as None when it's left out.
+def optional_target(text: str) -> tuple:
+    args = words(text)
+    if len(args) > 1:
+        raise CommandError('Only one server can be given.')
+    return (args[0] if len(args) == 1 else None,)
+
+
+# Argument parser for commands that take an optional player name, which is
+# passed as None when it's left out.
+def optional_player(text: str) -> tuple:
+    args = words(text)
+    if len(args) > 1:
+        raise CommandError('Only one player can be given.')
+    return (args[0] if len(args) == 1 else None,)
+
+
+# Argument parser for commands that take an optional `@SERVER` followed by
+# free text, for example `>issue @creative time set day`.
+def targeted_rest(text: str) -> tuple:
+    if text.startswith('@'):
+        parts = text[1:].split(maxsplit=1)
+        if len(parts) > 0:
+            return parts[0], parts[1] if len(parts) > 1 else ''
+    return None, text
+
+
+# Split text into Minecraft commands separated by semicolons. A semicolon that
+# is part of a command can be escaped as `\;`.
+def split_commands(text: str) -> list:
+    commands = [part.replace('\\;', ';').strip() for part in re.split(r'(?<!\\);', text)]
+    commands = [command for command in commands if command != '']
+
+    if len(commands) == 0:
+        raise CommandError('No command was given.')
+    elif len(commands) > MAX_BATCH:
+        raise CommandError('At most {} commands can be issued at once.'.format(MAX_BATCH))
+    return commands
+
+
+# Argument parser for commands that take an optional `@SERVER` followed by
+# Minecraft commands, for example `>issue @creative save-all; say Saved!`.
+def targeted_commands(text: str) -> tuple:
+    target, rest = targeted_rest(text)
+    return target, split_commands(rest)
+
+
+class Command(NamedTuple):
+    name: str
+    handler: Callable
+    help: str
+    parser: Callable
+
+
+#
+# Routes messages to command handlers. The prefix and command name are parsed
+# once and the handler is looked up by name, so only the matching command is
+# permission checked and anything else is dropped straight away.
+#
+class CommandRouter:
+    # check is called with (command_name, member, guild) and returns whether
+    # the member is allowed to run the command. on_error is awaited with
+    # (message, command, error) when the arguments can't be parsed. limit is
+    # called with the same arguments as check and returns how many seconds the
+    # member must wait before running the command, in which case on_limited is
+    # awaited with (message, command, args, wait) instead of the handler.
+    def __init__(self, check: Callable, on_error: Callable, prefix: str = '>', limit: Callable = None,
+                 on_limited: Callable = None):
+        self._check = check
+        self._on_error = on_error
+        self._prefix = prefix
+        self._limit = limit
+        self._on_limited = on_limited
+        self._commands = {}
+
+    # Register a handler. The handler is called with the message followed by
+    # the arguments returned by the parser.
+    def register(self, name: str, handler: Callable, help: str, parser: Callable = no_args):
+        self._commands[name] = Command(name, handler, help, parser)
+
+    def get(self, name: str) -> Command:
+        return self._commands.get(name)
+
+    # Split a message into its command name and argument text, or return None
+    # if the message isn't a command.
+    def parse(self, content: str):
+        if not content.startswith(self._prefix):
+            return None
+
+        parts = content[len(self._prefix):].split(maxsplit=1)
+        if len(parts) == 0:
+            return None
+
+        return parts[0], parts[1] if len(parts) > 1 else ''
+
+    # Run the command in the message, if there is one and the author may run it.
+    # Returns whether a command was run.
+    async def dispatch(self, message) -> bool:
+        parsed = self.parse(message.content)
+        if parsed is None:
+            return False
+
+        name, text = parsed
+        command = self._commands.get(name)
+        if command is None or not self._check(name, message.author, message.guild):
+            return False
+
+        try:
+            args = command.parser(text)
+        except CommandError as e:
+            metrics.commands.inc(command=name, outcome='invalid')
+            await self._on_error(message, command, e)
+            return False
+
+        return await self.run(message, command, args)
+
+    # Run a command with arguments that have already been parsed, unless the
+    # author is over the rate limit. Returns whether the handler was run.
+    async def run(self, message, command: Command, args: tuple) -> bool:
+        if self._limit is not None:
+            wait = self._limit(command.name, message.author, message.guild)
+            if wait > 0:
+                metrics.commands.inc(command=command.name, outcome='limited')
+                await self._on_limited(message, command, args, wait)
+                return False
+
+        with metrics.track(metrics.commands, metrics.command_latency, command=command.name):
+            await command.handler(message, *args)
+        return True
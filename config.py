@@ -1,62 +1,348 @@
+import asyncio
 import configparser
+import json
+import os
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Mapping, NamedTuple, Optional
 
+# The config directory next to this file, so that the bot can be run from anywhere.
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config')
+
+# Where the bot keeps the state it needs to survive restarts.
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+# Get the path of a file in the data directory, creating the directory if needed.
+def data_path(file: str) -> str:
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, file)
 
-# 
-# Base config class.
-#
-class Config:
-    def __init__(self):
-        self._parser = configparser.ConfigParser()
-    
-    def _parse(self, file: str) -> None:
-        self._parser.read(file)
+
+# Write data to path as JSON. It's written to a temporary file first so that a
+# crash can't leave a half written file behind.
+def write_json(path: str, data):
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as file:
+        json.dump(data, file)
+    os.replace(temporary_path, path)
 
 
 #
 # Class for various credentials configuration.
 #
-class CredentialsConfig(Config):
-    def __init__(self):
-        super().__init__()
+@dataclass(frozen=True)
+class CredentialsConfig:
+    aws_access_key_id: str
+    aws_secret_access_key: str
+    discord_bot_token: str
+    macaw_key: str
+
+    @classmethod
+    def from_parser(cls, parser: configparser.ConfigParser) -> 'CredentialsConfig':
+        return cls(
+            aws_access_key_id=parser['default']['aws_access_key_id'],
+            aws_secret_access_key=parser['default']['aws_secret_access_key'],
+            discord_bot_token=parser['default']['discord_bot_token'],
+            macaw_key=parser['default']['macaw_key']
+        )
+
+
+#
+# A named Minecraft server and the instance it runs on. The ports fall back to
+# the ones in the settings when they're not given.
+#
+@dataclass(frozen=True)
+class ServerProfile:
+    name: str
+    instance: str
+    region: str
+    macaw_port: Optional[int] = None
+    dynmap_port: Optional[int] = None
+    presence_channel: Optional[int] = None
+    idle_channel: Optional[int] = None
+
 
-        self._parse('./config/credentials.ini')
+# Words that commands take in place of a server name, so servers can't be
+# called them.
+RESERVED_SERVER_NAMES = ('all', 'off')
+
+
+# Check that a server name doesn't clash with a command keyword.
+def check_server_name(name: str) -> str:
+    if name.lower() in RESERVED_SERVER_NAMES:
+        raise ValueError('Server name "{}" is reserved, choose another one in aws_config.ini'.format(name))
+    return name
 
-        self.aws_access_key_id = self._parser['default']['aws_access_key_id']
-        self.aws_secret_access_key = self._parser['default']['aws_secret_access_key']
-        self.discord_bot_token = self._parser['default']['discord_bot_token']
-        self.macaw_key = self._parser['default']['macaw_key']
 
 #
 # Class for non-credential AWS config.
 #
-class AWSConfig(Config):
-    def __init__(self):
-        super().__init__()
+# The instance in the default section is the default server, and any number
+# of other servers can be added as [server:NAME] sections.
+#
+@dataclass(frozen=True)
+class AWSConfig:
+    region: str
+    instance: str
+    default_server: str
+    servers: Mapping[str, ServerProfile]
 
-        self._parse('./config/aws_config.ini')
+    @classmethod
+    def from_parser(cls, parser: configparser.ConfigParser) -> 'AWSConfig':
+        region = parser['default']['region']
+        default_server = check_server_name(parser['default'].get('name', 'default'))
+
+        default = parser['default']
+        servers = {
+            default_server: ServerProfile(
+                name=default_server,
+                instance=default['instance'],
+                region=region,
+                presence_channel=int(default['presence_channel']) if 'presence_channel' in default else None,
+                idle_channel=int(default['idle_channel']) if 'idle_channel' in default else None
+            )
+        }
+
+        for section_name in parser.sections():
+            if not section_name.startswith('server:'):
+                continue
+
+            section = parser[section_name]
+            name = check_server_name(section_name[len('server:'):])
+            servers[name] = ServerProfile(
+                name=name,
+                instance=section['instance'],
+                region=section.get('region', region),
+                macaw_port=int(section['macaw_port']) if 'macaw_port' in section else None,
+                dynmap_port=int(section['dynmap_port']) if 'dynmap_port' in section else None,
+                presence_channel=int(section['presence_channel']) if 'presence_channel' in section else None,
+                idle_channel=int(section['idle_channel']) if 'idle_channel' in section else None
+            )
+
+        return cls(
+            region=region,
+            instance=parser['default']['instance'],
+            default_server=default_server,
+            servers=MappingProxyType(servers)
+        )
+
+
+# Rate limits used for anything missing from the [rate_limits] section, as
+# (requests, seconds) per user or guild for each cost class of command.
+DEFAULT_RATE_LIMITS = {
+    'user_read': (5, 10),
+    'user_write': (3, 60),
+    'guild_read': (20, 10),
+    'guild_write': (10, 60)
+}
+
+
+# Parse the rate limit called name, written as `REQUESTS/SECONDS`, for
+# example `5/10`. At least one request has to be allowed in a period longer
+# than 0 seconds.
+def parse_rate_limit(name: str, text: str) -> tuple:
+    try:
+        requests, seconds = text.split('/')
+        requests, seconds = int(requests), float(seconds)
+    except ValueError:
+        raise ValueError('Rate limit {} should be written as REQUESTS/SECONDS, not "{}"'.format(name, text))
+
+    if requests < 1 or not seconds > 0:
+        raise ValueError('Rate limit {} has to allow at least 1 request in more than 0 seconds, not "{}"'.format(
+            name, text))
+    return requests, seconds
 
-        self.region = self._parser['default']['region']
-        self.instance = self._parser['default']['instance']
 
 #
 # Class for other settings.
 #
-class SettingsConfig(Config):
-    def __init__(self):
-        super().__init__()
+@dataclass(frozen=True)
+class SettingsConfig:
+    check_delay: int
+    poll_min_delay: float
+    poll_max_delay: float
+    observe_timeout: int
+    aws_workers: int
+    instance_cache_ttl: float
+    macaw_connect_timeout: float
+    macaw_read_timeout: float
+    macaw_status_ttl: float
+    macaw_port: int
+    macaw_concurrency: int
+    members_intent: bool
+    slash_commands: bool
+    text_commands: bool
+    config_watch_interval: float
+    embed_edit_interval: float
+    metrics_host: str
+    metrics_port: int
+    loop_lag_interval: float
+    presence_tracking: bool
+    idle_timeout: float
+    idle_warning: float
+    prewarm: bool
+    prewarm_lead: float
+    prewarm_threshold: float
+    prewarm_weeks: int
+    macros: Mapping[str, str]
+    rate_limits: Mapping[str, tuple]
+    roles: Mapping[str, str]
+    owner: int
+    dynmap_port: int
 
-        self._parse('./config/settings.ini')
+    @classmethod
+    def from_parser(cls, parser: configparser.ConfigParser) -> 'SettingsConfig':
+        section = parser['default']
 
-        self.check_delay = int(self._parser['default']['check_delay'])
+        return cls(
+            check_delay=int(section['check_delay']),
+            poll_min_delay=float(section.get('poll_min_delay', 1)),
+            poll_max_delay=float(section.get('poll_max_delay', 30)),
+            observe_timeout=int(section.get('observe_timeout', 900)),
+            aws_workers=int(section.get('aws_workers', 4)),
+            instance_cache_ttl=float(section.get('instance_cache_ttl', 2)),
+            macaw_connect_timeout=float(section.get('macaw_connect_timeout', 3)),
+            macaw_read_timeout=float(section.get('macaw_read_timeout', 3)),
+            macaw_status_ttl=float(section.get('macaw_status_ttl', 1)),
+            macaw_port=int(section.get('macaw_port', 8080)),
+            macaw_concurrency=int(section.get('macaw_concurrency', 8)),
+            members_intent=section.getboolean('members_intent', fallback=False),
+            slash_commands=section.getboolean('slash_commands', fallback=True),
+            text_commands=section.getboolean('text_commands', fallback=True),
+            config_watch_interval=float(section.get('config_watch_interval', 10)),
+            embed_edit_interval=float(section.get('embed_edit_interval', 1)),
+            metrics_host=section.get('metrics_host', '127.0.0.1'),
+            metrics_port=int(section.get('metrics_port', 0)),
+            loop_lag_interval=float(section.get('loop_lag_interval', 0.5)),
+            presence_tracking=section.getboolean('presence_tracking', fallback=True),
+            idle_timeout=float(section.get('idle_timeout', 1800)),
+            idle_warning=float(section.get('idle_warning', 300)),
+            prewarm=section.getboolean('prewarm', fallback=False),
+            prewarm_lead=float(section.get('prewarm_lead', 600)),
+            prewarm_threshold=float(section.get('prewarm_threshold', 0.5)),
+            prewarm_weeks=int(section.get('prewarm_weeks', 4)),
+            macros=MappingProxyType(dict(parser['macros']) if parser.has_section('macros') else {}),
+            rate_limits=MappingProxyType(dict(DEFAULT_RATE_LIMITS, **{
+                name: parse_rate_limit(name, text)
+                for name, text in (parser['rate_limits'].items() if parser.has_section('rate_limits') else ())
+            })),
+            roles=MappingProxyType({
+                'starter': section['starter_role'],
+                'stopper': section['stopper_role'],
+                'admin': section['admin_role'],
+                'status': section['status_role'],
+                'trusted': section['trusted_role']
+            }),
+            owner=int(section['owner']),
+            dynmap_port=int(section['dynmap_port'])
+        )
 
-        self.roles = {
-            'starter': self._parser['default']['starter_role'],
-            'stopper': self._parser['default']['stopper_role'],
-            'admin': self._parser['default']['admin_role'],
-            'status': self._parser['default']['status_role'],
-            'trusted': self._parser['default']['trusted_role']
-        }
 
-        self.owner = int(self._parser['default']['owner'])
+#
+# Every config file, parsed at the same moment.
+#
+class ConfigSnapshot(NamedTuple):
+    credentials: CredentialsConfig
+    aws: AWSConfig
+    settings: SettingsConfig
+
+
+CONFIG_FILES = {
+    'credentials': ('credentials.ini', CredentialsConfig),
+    'aws': ('aws_config.ini', AWSConfig),
+    'settings': ('settings.ini', SettingsConfig)
+}
+
+
+#
+# Loads the config files once and hands out immutable snapshots of them.
+# Reloading parses every file into a new snapshot and swaps it in whole, so
+# readers never see a mix of old and new values. If a file fails to parse the
+# current snapshot is kept.
+#
+# Settings that are read when they're used (the polling delays, observe_timeout,
+# roles, owner, dynmap_port and the Macaw key) take effect on reload. The
+# rest are only read on startup.
+#
+class ConfigRegistry:
+    def __init__(self, directory: str = CONFIG_DIR):
+        self._directory = directory
+        self._snapshot = None
+        self._mtimes = {}
+        self._listeners = []
+
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        if self._snapshot is None:
+            self.reload()
+        return self._snapshot
+
+    # Register a callback that's called with the new snapshot after each reload.
+    def subscribe(self, callback: Callable):
+        self._listeners.append(callback)
+
+    def _paths(self) -> dict:
+        return {name: os.path.join(self._directory, file) for name, (file, _) in CONFIG_FILES.items()}
+
+    def _read_mtimes(self) -> dict:
+        mtimes = {}
+        for path in self._paths().values():
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = None
+        return mtimes
+
+    # Whether any of the files have changed since they were last loaded.
+    def changed(self) -> bool:
+        return self._read_mtimes() != self._mtimes
+
+    # Parse every file into a new snapshot and swap it in.
+    def reload(self) -> ConfigSnapshot:
+        # Remember the modification times up front, so that a broken file isn't
+        # retried until it changes again.
+        self._mtimes = self._read_mtimes()
+        configs = {}
+
+        for name, path in self._paths().items():
+            parser = configparser.ConfigParser()
+            if len(parser.read(path)) == 0:
+                raise FileNotFoundError('Config file not found: {}'.format(path))
+
+            configs[name] = CONFIG_FILES[name][1].from_parser(parser)
+
+        self._snapshot = ConfigSnapshot(**configs)
+
+        for callback in self._listeners:
+            callback(self._snapshot)
+
+        return self._snapshot
+
+    # Poll the files for changes every interval seconds and reload them when
+    # they change.
+    async def watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+
+            if self.changed():
+                try:
+                    self.reload()
+                    print('Config reloaded.')
+                except Exception as e:
+                    print('Failed to reload config: {}'.format(e))
+
+
+registry = ConfigRegistry()
+
+
+def credentials() -> CredentialsConfig:
+    return registry.snapshot.credentials
+
+
+def aws() -> AWSConfig:
+    return registry.snapshot.aws
+
 
-        self.dynmap_port = int(self._parser['default']['dynmap_port'])
+def settings() -> SettingsConfig:
+    return registry.snapshot.settings
@@ -0,0 +1,199 @@
+import asyncio
+import json
+
+import discord
+
+import config
+from embeds import LiveEmbed, STATUS_COLOURS
+from hub import ServerState, cancel_tasks, follow
+from macaw_actions import valid_status
+
+STORE_FILE = 'dashboards.json'
+
+
+#
+# Remembers which message is the dashboard in each channel, so that the
+# dashboards can be picked up again after the bot restarts.
+#
+class DashboardStore:
+    def __init__(self, path: str = None):
+        self._path = path or config.data_path(STORE_FILE)
+
+    # Get the stored dashboards, as {channel_id: (message_id, server_name)}.
+    def load(self) -> dict:
+        try:
+            with open(self._path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        return {int(channel_id): (entry['message_id'], entry['server']) for channel_id, entry in data.items()}
+
+    def save(self, dashboards: dict):
+        data = {str(channel_id): {'message_id': message_id, 'server': server}
+                for channel_id, (message_id, server) in dashboards.items()}
+        config.write_json(self._path, data)
+
+
+# Build the dashboard embed for a server's state.
+def render(server_name: str, state: ServerState, show_name: bool) -> discord.Embed:
+    instance = state.instance
+    embed = discord.Embed(title='Server Dashboard', color=STATUS_COLOURS[instance.state_code])
+
+    embed.add_field(name='EC2 Instance', value=instance.state_name.title())
+    embed.add_field(name='Public IP Address', value=instance.ip_address or 'None')
+
+    status = state.macaw
+    if status is None:
+        macaw, minecraft, players = 'Stopped', 'Stopped', None
+    elif status.error is not None:
+        macaw, minecraft, players = 'Unreachable', 'Unknown', None
+    elif status.status_code == 401:
+        macaw, minecraft, players = 'Wrong API key', 'Unknown', None
+    elif not valid_status(status):
+        macaw, minecraft, players = 'Bad response', 'Unknown', None
+    else:
+        macaw = 'Running'
+        minecraft = status.json['status'].title()
+        players = status.json['players']
+
+    embed.add_field(name='Macaw Server', value=macaw)
+    embed.add_field(name='Minecraft Server', value=minecraft)
+
+    if players is not None:
+        embed.add_field(name='Players ({})'.format(len(players)),
+                        value='\n'.join(players) if len(players) > 0 else 'No-one is online :(',
+                        inline=False)
+
+    if show_name:
+        embed.set_footer(text=server_name)
+
+    return embed
+
+
+#
+# A dashboard message, updated in place whenever the hub sees its server change.
+#
+class Dashboard:
+    def __init__(self, hub, server_name: str, message, show_name: bool):
+        self._hub = hub
+        self._server_name = server_name
+        self._show_name = show_name
+        self._embed = LiveEmbed(message)
+        self._task = None
+
+    @property
+    def message(self):
+        return self._embed.message
+
+    @property
+    def server_name(self) -> str:
+        return self._server_name
+
+    # Whether the message has been deleted.
+    @property
+    def gone(self) -> bool:
+        return self._embed.gone
+
+    # Start updating the message, calling on_done when the updates stop.
+    def start(self, on_done=None):
+        self._task = asyncio.ensure_future(self._run())
+        if on_done is not None:
+            self._task.add_done_callback(lambda task: on_done(self))
+
+    # A state that fails to render is logged by follow, and the dashboard
+    # carries on with the next one.
+    async def _run(self):
+        async def update(state: ServerState):
+            self._embed.update(render(self._server_name, state, self._show_name))
+
+        await follow(self._hub, self._server_name, update, done=lambda: self._embed.gone)
+
+    async def stop(self):
+        if self._task is not None:
+            await cancel_tasks([self._task])
+
+
+#
+# The dashboards in every channel. Their message IDs are stored so that they
+# carry on being updated after a restart.
+#
+class DashboardManager:
+    def __init__(self, client: discord.Client, hub, fleet, store: DashboardStore = None):
+        self._client = client
+        self._hub = hub
+        self._fleet = fleet
+        self._store = store or DashboardStore()
+        self._dashboards = {}
+
+    def _save(self):
+        self._store.save({channel_id: (dashboard.message.id, dashboard.server_name)
+                          for channel_id, dashboard in self._dashboards.items()})
+
+    def _start(self, channel_id: int, server_name: str, message):
+        dashboard = Dashboard(self._hub, server_name, message, len(self._fleet) > 1)
+        self._dashboards[channel_id] = dashboard
+        dashboard.start(on_done=self._stopped)
+
+    # Forget dashboards whose message has been deleted.
+    def _stopped(self, dashboard: Dashboard):
+        channel_id = dashboard.message.channel.id
+        if dashboard.gone and self._dashboards.get(channel_id) is dashboard:
+            del self._dashboards[channel_id]
+            self._save()
+
+    # Post a dashboard for the server in the channel, replacing any dashboard
+    # that's already there.
+    async def enable(self, channel, server_name: str):
+        await self.disable(channel)
+
+        embed = discord.Embed(title='Server Dashboard', description='Waiting for the server status...')
+        message = await channel.send(embed=embed)
+
+        try:
+            await message.pin()
+        except discord.HTTPException:
+            # Pinning needs the Manage Messages permission, the dashboard works without it.
+            pass
+
+        self._start(channel.id, server_name, message)
+        self._save()
+
+    # Stop updating the channel's dashboard. Returns whether there was one.
+    async def disable(self, channel) -> bool:
+        dashboard = self._dashboards.pop(channel.id, None)
+        if dashboard is None:
+            return False
+
+        await dashboard.stop()
+        self._save()
+
+        try:
+            await dashboard.message.unpin()
+        except discord.HTTPException:
+            pass
+
+        return True
+
+    # Pick the stored dashboards back up, dropping any whose message or server is gone.
+    async def restore(self):
+        for channel_id, (message_id, server_name) in self._store.load().items():
+            if channel_id in self._dashboards:
+                continue
+
+            channel = self._client.get_channel(channel_id)
+            if channel is None or self._fleet.get(server_name) is None:
+                continue
+
+            try:
+                message = await channel.fetch_message(message_id)
+            except discord.HTTPException:
+                continue
+
+            self._start(channel_id, server_name, message)
+
+        self._save()
+
+    async def close(self):
+        for dashboard in self._dashboards.values():
+            await dashboard.stop()
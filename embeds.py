@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+import discord
+
+import config
+import metrics
+
+# Embed colours for each instance state code.
+STATUS_COLOURS = {
+    0: 0xb8b9ba,
+    16: 0x04d45b,
+    32: 0xa6003a,
+    48: 0x57001e,
+    64: 0xd18100,
+    80: 0xd11f00
+}
+
+
+class EmbedColours:
+    FAIL = 0xd11f00
+    SUCCESS = 0x04d45b
+
+
+#
+# Spaces out message edits in each channel, so that several live embeds in one
+# channel share Discord's per-channel rate limit instead of running into 429s.
+#
+class ChannelRateLimiter:
+    def __init__(self):
+        self._next_slot = {}
+
+    # Wait for the next free edit slot in the channel.
+    async def wait(self, channel_id: int):
+        interval = config.settings().embed_edit_interval
+        now = time.monotonic()
+
+        slot = max(now, self._next_slot.get(channel_id, 0))
+        self._next_slot[channel_id] = slot + interval
+
+        if slot > now:
+            metrics.embed_rate_limited.inc()
+            metrics.embed_rate_limit_wait.inc(slot - now)
+            await asyncio.sleep(slot - now)
+
+
+edit_limiter = ChannelRateLimiter()
+
+# How many times an edit is tried before its embed is given up on, unless a
+# newer update replaces it first.
+MAX_EDIT_ATTEMPTS = 3
+
+
+#
+# A message whose embed is kept up to date. Updates that render the same as
+# the last embed sent are skipped, and bursts of updates are coalesced into a
+# single edit per rate limit window, so only the latest embed is guaranteed
+# to be sent. An edit that fails is tried again in the next window, up to
+# MAX_EDIT_ATTEMPTS times, unless a newer update has replaced it.
+#
+class LiveEmbed:
+    def __init__(self, message, limiter: ChannelRateLimiter = edit_limiter):
+        self._message = message
+        self._limiter = limiter
+
+        self._sent = message.embeds[0].to_dict() if len(message.embeds) > 0 else None
+        self._pending = None
+        self._task = None
+
+        # Set once the message has been deleted, after which updates are dropped.
+        self.gone = False
+
+    @property
+    def message(self):
+        return self._message
+
+    # Queue an embed to be sent. It replaces any update that hasn't been sent yet.
+    def update(self, embed: discord.Embed):
+        rendered = embed.to_dict()
+        latest = self._pending.to_dict() if self._pending is not None else self._sent
+
+        if rendered == latest or self.gone:
+            metrics.embed_edits.inc(outcome='unchanged')
+            return
+
+        if self._pending is not None:
+            metrics.embed_edits.inc(outcome='coalesced')
+        self._pending = embed
+
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._send_pending())
+
+    async def _send_pending(self):
+        attempts = 0
+        try:
+            while self._pending is not None:
+                await self._limiter.wait(self._message.channel.id)
+
+                embed = self._pending
+                self._pending = None
+
+                if embed.to_dict() == self._sent:
+                    continue
+
+                try:
+                    await self._message.edit(embed=embed)
+                except discord.NotFound:
+                    metrics.embed_edits.inc(outcome='gone')
+                    self.gone = True
+                    self._pending = None
+                    break
+                except discord.HTTPException as e:
+                    metrics.embed_edits.inc(outcome='failed')
+                    attempts += 1
+
+                    if self._pending is not None:
+                        # A newer update replaces the failed one.
+                        attempts = 0
+                    elif attempts < MAX_EDIT_ATTEMPTS:
+                        self._pending = embed
+                    else:
+                        attempts = 0
+                        print('Failed to edit embed: {}'.format(e))
+                    continue
+
+                attempts = 0
+                metrics.embed_edits.inc(outcome='sent')
+                self._sent = embed.to_dict()
+        finally:
+            self._task = None
+
+    # Wait until the latest update has been sent.
+    async def flush(self):
+        while self._task is not None:
+            await asyncio.shield(self._task)
@@ -0,0 +1,70 @@
+import itertools
+from collections import Counter
+
+_ids = itertools.count(1000)
+
+
+#
+# Minimal stand-ins for the discord.py objects the bot handles, recording
+# what the bot sends and edits rather than talking to Discord.
+#
+class FakeRole:
+    def __init__(self, name: str):
+        self.id = next(_ids)
+        self.name = name
+
+
+class FakeGuild:
+    def __init__(self, roles: list):
+        self.id = next(_ids)
+        self.roles = roles
+
+
+class FakeMember:
+    def __init__(self, guild: FakeGuild, roles: list = None, member_id: int = None):
+        self.id = member_id if member_id is not None else next(_ids)
+        self.guild = guild
+        self.roles = roles or []
+
+
+class FakeMessage:
+    def __init__(self, channel: 'FakeChannel', content: str = '', embed=None, author=None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.author = author
+        self.guild = author.guild if author is not None else None
+        self.embeds = [embed] if embed is not None else []
+
+    async def edit(self, embed=None):
+        self.channel.calls['edit'] += 1
+        self.embeds = [embed]
+
+    async def pin(self):
+        self.channel.calls['pin'] += 1
+
+    async def unpin(self):
+        self.channel.calls['unpin'] += 1
+
+
+class FakeChannel:
+    def __init__(self):
+        self.id = next(_ids)
+        self.messages = {}
+
+        # A count of the calls made to each API.
+        self.calls = Counter()
+
+    # Make a message from a member in this channel, for passing to on_message.
+    def receive(self, author: FakeMember, content: str) -> FakeMessage:
+        return FakeMessage(self, content, author=author)
+
+    async def send(self, content: str = None, embed=None) -> FakeMessage:
+        self.calls['send'] += 1
+        message = FakeMessage(self, content or '', embed=embed)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        self.calls['fetch_message'] += 1
+        return self.messages[message_id]
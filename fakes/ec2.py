@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from botocore.exceptions import ClientError
+
+# Instance state codes and names, as returned by DescribeInstances.
+STATES = {
+    'pending': 0,
+    'running': 16,
+    'stopping': 64,
+    'stopped': 80
+}
+
+
+class _Instance:
+    def __init__(self, instance_id: str, state: str, ip_address: str):
+        self.instance_id = instance_id
+        self.state = state
+        self.ip_address = ip_address
+        self.settles_at = 0
+
+
+#
+# A local stand-in for the parts of EC2 the bot uses: DescribeInstances,
+# StartInstances and StopInstances. Instances move through pending and
+# stopping on their own after boot_time and stop_time seconds, and every call
+# blocks for latency seconds like a real round trip would.
+#
+# Use its session method as the Fleet's session_factory.
+#
+class FakeEC2:
+    def __init__(self, instances: dict, latency: float = 0.05, boot_time: float = 5, stop_time: float = 5,
+                 ip_address: str = '127.0.0.1'):
+        self.latency = latency
+        self.boot_time = boot_time
+        self.stop_time = stop_time
+
+        # A count of the calls made to each API.
+        self.calls = Counter()
+
+        self._ip_address = ip_address
+        self._lock = threading.Lock()
+        self._instances = {
+            instance_id: _Instance(instance_id, state, ip_address if state == 'running' else None)
+            for instance_id, state in instances.items()
+        }
+
+    def session(self, region: str):
+        return FakeSession(self, region)
+
+    # Move instances out of pending and stopping once they've had long enough.
+    def _settle(self, instance: _Instance):
+        if instance.state in ('pending', 'stopping') and time.monotonic() >= instance.settles_at:
+            if instance.state == 'pending':
+                instance.state = 'running'
+                instance.ip_address = self._ip_address
+            else:
+                instance.state = 'stopped'
+                instance.ip_address = None
+
+    def _call(self, name: str):
+        time.sleep(self.latency)
+        self.calls[name] += 1
+
+    def get_state(self, instance_id: str) -> str:
+        with self._lock:
+            instance = self._instances[instance_id]
+            self._settle(instance)
+            return instance.state
+
+    # Start stopping an instance, as if it had shut itself down.
+    def shut_down(self, instance_id: str):
+        with self._lock:
+            instance = self._instances[instance_id]
+            instance.state = 'stopping'
+            instance.settles_at = time.monotonic() + self.stop_time
+
+    # Like EC2, asking for an unknown instance by ID fails the whole call,
+    # while an instance-id filter leaves unknown instances out.
+    def describe_instances(self, InstanceIds: list = None, Filters: list = None) -> dict:
+        self._call('DescribeInstances')
+
+        with self._lock:
+            if InstanceIds is not None:
+                missing = [instance_id for instance_id in InstanceIds if instance_id not in self._instances]
+                if len(missing) > 0:
+                    raise ClientError({'Error': {
+                        'Code': 'InvalidInstanceID.NotFound',
+                        'Message': 'The instance IDs \'{}\' do not exist'.format(', '.join(missing))
+                    }}, 'DescribeInstances')
+                instance_ids = InstanceIds
+            else:
+                instance_ids = list(self._instances)
+
+            for instance_filter in Filters or []:
+                if instance_filter['Name'] == 'instance-id':
+                    instance_ids = [instance_id for instance_id in instance_ids
+                                    if instance_id in instance_filter['Values']]
+
+            descriptions = []
+            for instance_id in instance_ids:
+                instance = self._instances[instance_id]
+                self._settle(instance)
+
+                description = {
+                    'InstanceId': instance_id,
+                    'State': {'Code': STATES[instance.state], 'Name': instance.state},
+                    'StateTransitionReason': ''
+                }
+                if instance.ip_address is not None:
+                    description['PublicIpAddress'] = instance.ip_address
+
+                descriptions.append(description)
+
+        return {'Reservations': [{'Instances': descriptions}]}
+
+    def start_instances(self, InstanceIds: list) -> dict:
+        self._call('StartInstances')
+
+        with self._lock:
+            for instance_id in InstanceIds:
+                instance = self._instances[instance_id]
+                instance.state = 'pending'
+                instance.settles_at = time.monotonic() + self.boot_time
+
+        return {'StartingInstances': []}
+
+    def stop_instances(self, InstanceIds: list) -> dict:
+        self._call('StopInstances')
+
+        for instance_id in InstanceIds:
+            self.shut_down(instance_id)
+
+        return {'StoppingInstances': []}
+
+
+#
+# Stands in for a boto3 session, handing out an EC2 resource backed by a FakeEC2.
+#
+class FakeSession:
+    def __init__(self, ec2: FakeEC2, region: str):
+        self._ec2 = ec2
+        self.region_name = region
+
+    def resource(self, service: str):
+        return FakeResource(self._ec2)
+
+
+class FakeResource:
+    def __init__(self, ec2: FakeEC2):
+        self._ec2 = ec2
+        self.meta = SimpleNamespace(client=ec2)
+
+    def Instance(self, instance_id: str):
+        return FakeInstanceResource(self._ec2, instance_id)
+
+
+class FakeInstanceResource:
+    def __init__(self, ec2: FakeEC2, instance_id: str):
+        self._ec2 = ec2
+        self.id = instance_id
+
+    def start(self):
+        return self._ec2.start_instances(InstanceIds=[self.id])
+
+    def stop(self):
+        return self._ec2.stop_instances(InstanceIds=[self.id])
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+from collections import Counter
+from typing import Callable
+
+from aiohttp import web
+
+
+#
+# A local stand-in for the Macaw HTTP API, implementing /status, /issue and
+# /kill. Useful for exercising MacawManager without a real instance:
+#
+#     MacawManager(aws, port=port, scheme='http')
+#
+# Run it standalone with `python -m fakes.macaw`.
+#
+class FakeMacawServer:
+    # on_kill is called when /kill is requested, to let the caller stop the instance.
+    def __init__(self, key: str, status: str = 'running', players: list = None, delay: float = 0,
+                 on_kill: Callable = None):
+        self.key = key
+        self.status = status
+        self.players = list(players or [])
+        self.delay = delay
+        self.on_kill = on_kill
+
+        # Every command received on /issue, and a count of requests per endpoint.
+        self.issued = []
+        self.requests = Counter()
+
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get('/status', self._status)
+        self.app.router.add_post('/issue', self._issue)
+        self.app.router.add_get('/kill', self._kill)
+
+    # Start serving and return the port that was bound.
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> int:
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _begin(self, request: web.Request, endpoint: str) -> bool:
+        self.requests[endpoint] += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return request.query.get('key') == self.key
+
+    async def _status(self, request: web.Request) -> web.Response:
+        if not await self._begin(request, 'status'):
+            return web.json_response({'error': 'unauthorised'}, status=401)
+
+        return web.json_response({'status': self.status, 'players': self.players})
+
+    async def _issue(self, request: web.Request) -> web.Response:
+        if not await self._begin(request, 'issue'):
+            return web.json_response({'error': 'unauthorised'}, status=401)
+
+        if self.status != 'running':
+            return web.json_response({'error': 'server not running'}, status=503)
+
+        body = await request.json()
+        self.issued.append(body['command'])
+        return web.json_response({})
+
+    async def _kill(self, request: web.Request) -> web.Response:
+        if not await self._begin(request, 'kill'):
+            return web.json_response({'error': 'unauthorised'}, status=401)
+
+        self.status = 'stopping'
+        if self.on_kill is not None:
+            self.on_kill()
+        return web.json_response({})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake Macaw server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--key', required=True)
+    parser.add_argument('--status', default='running', choices=['stopped', 'starting', 'running', 'stopping'])
+    parser.add_argument('--player', action='append', dest='players', default=[])
+    args = parser.parse_args()
+
+    server = FakeMacawServer(args.key, status=args.status, players=args.players)
+    web.run_app(server.app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
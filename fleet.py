@@ -0,0 +1,123 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional
+
+import config
+from aws_actions import AWSManager, AsyncAWSManager, InstanceSnapshot, SessionCache, create_session, describe_many
+from macaw_actions import MacawManager
+
+
+#
+# A Minecraft server from the config, with the managers for its instance and
+# Macaw server.
+#
+class Server(NamedTuple):
+    profile: config.ServerProfile
+    aws: AsyncAWSManager
+    macaw: MacawManager
+
+    @property
+    def name(self) -> str:
+        return self.profile.name
+
+    @property
+    def dynmap_port(self) -> int:
+        if self.profile.dynmap_port is not None:
+            return self.profile.dynmap_port
+        return config.settings().dynmap_port
+
+
+#
+# The status of a server as part of a fleet-wide status.
+#
+class ServerStatus(NamedTuple):
+    server: Server
+    snapshot: Optional[InstanceSnapshot]
+    macaw_state: Optional[int]
+
+
+#
+# Every configured server. The AWS managers share one session per region and
+# one bounded thread pool, and the Macaw managers share a limit on requests in
+# flight, so that fleet-wide operations stay within the same limits as single
+# server ones.
+#
+# Sessions and EC2 resources are created on first use, or by prepare(), so
+# creating a fleet doesn't import boto3.
+#
+class Fleet:
+    # session_factory creates the boto3 session for a region and macaw_scheme
+    # is the scheme of the Macaw servers, both can be replaced to run against
+    # local stand-ins.
+    def __init__(self, aws_config: config.AWSConfig, settings: config.SettingsConfig,
+                 session_factory: Callable = create_session, macaw_scheme: str = 'https'):
+        self._default = aws_config.default_server
+        self._executor = ThreadPoolExecutor(max_workers=settings.aws_workers, thread_name_prefix='aws')
+        self._macaw_limiter = asyncio.Semaphore(settings.macaw_concurrency)
+        self._servers = {}
+
+        sessions = SessionCache(session_factory)
+        for name, profile in aws_config.servers.items():
+            aws_manager = AWSManager(profile.instance, region=profile.region, sessions=sessions,
+                                     cache_ttl=settings.instance_cache_ttl)
+            aws = AsyncAWSManager(aws_manager, executor=self._executor)
+            macaw = MacawManager(aws,
+                                 connect_timeout=settings.macaw_connect_timeout,
+                                 read_timeout=settings.macaw_read_timeout,
+                                 status_ttl=settings.macaw_status_ttl,
+                                 port=profile.macaw_port or settings.macaw_port,
+                                 scheme=macaw_scheme,
+                                 limiter=self._macaw_limiter)
+
+            self._servers[name] = Server(profile, aws, macaw)
+
+    def __len__(self) -> int:
+        return len(self._servers)
+
+    def __iter__(self):
+        return iter(self._servers.values())
+
+    def names(self) -> list:
+        return list(self._servers.keys())
+
+    # Get a server by name, or the default server if no name is given.
+    # Returns None if there is no server with that name.
+    def get(self, name: str = None) -> Server:
+        if name is None:
+            name = self._default
+        return self._servers.get(name)
+
+    # Describe every instance at once, with one DescribeInstances per region.
+    # Instances missing from the response, such as terminated ones, map to None.
+    async def describe_all(self) -> dict:
+        managers = [server.aws.manager for server in self]
+        loop = asyncio.get_event_loop()
+        snapshots = await loop.run_in_executor(self._executor, describe_many, managers)
+
+        return {server.name: snapshots.get(server.profile.instance) for server in self}
+
+    # Get the status of every server. The instances are described in one batch
+    # and the Macaw servers are all asked for their status concurrently. The
+    # snapshot and Macaw state are None for instances that couldn't be found.
+    async def status_all(self) -> list:
+        snapshots = await self.describe_all()
+        servers = list(self)
+
+        async def macaw_state(server):
+            snapshot = snapshots[server.name]
+            return await server.macaw.get_state(snapshot=snapshot) if snapshot is not None else None
+
+        macaw_states = await asyncio.gather(*[macaw_state(server) for server in servers])
+
+        return [ServerStatus(server, snapshots[server.name], macaw_state)
+                for server, macaw_state in zip(servers, macaw_states)]
+
+    # Create every server's AWS backend in the background, so that the first
+    # command doesn't wait for it.
+    async def prepare(self):
+        await asyncio.gather(*(server.aws.prepare() for server in self))
+
+    async def close(self):
+        for server in self:
+            await server.macaw.close()
+        self._executor.shutdown(wait=False)
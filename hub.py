@@ -0,0 +1,270 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+import config
+from aws_actions import InstanceSnapshot, InstanceState
+from macaw_actions import MacawState, MacawStatus, state_from_status
+from tracking import StateTracker
+
+# Roughly how long, in seconds, each transitional state lasts. The pollers
+# poll quickly around these times and back off otherwise.
+INSTANCE_TRANSITION_TIMES = {
+    InstanceState.pending: 30,
+    InstanceState.stopping: 60
+}
+
+MACAW_TRANSITION_TIMES = {
+    MacawState.macaw_starting: 30,
+    MacawState.starting: 60,
+    MacawState.stopping: 20,
+    MacawState.macaw_stopping: 20
+}
+
+# How long, in seconds, a snapshot from before the bot restarted is used
+# instead of asking EC2, until the instance has been polled.
+SEED_MAX_AGE = 60
+
+
+#
+# The latest known state of a server. macaw is None while the instance isn't
+# running.
+#
+class ServerState(NamedTuple):
+    instance: Optional[InstanceSnapshot]
+    macaw: Optional[MacawStatus]
+
+
+#
+# A subscriber's view of a server's state. Changes are coalesced, so a slow
+# subscriber only sees the latest state rather than every one in between.
+#
+class Subscription:
+    def __init__(self, hub: 'StateHub', name: str):
+        self._hub = hub
+        self._name = name
+        self._latest = None
+        self._changed = asyncio.Event()
+
+    def _push(self, state: ServerState):
+        self._latest = state
+        self._changed.set()
+
+    # Wait for the next change and return the new state.
+    async def next(self) -> ServerState:
+        await self._changed.wait()
+        self._changed.clear()
+        return self._latest
+
+    # Wait until predicate(state) is true and return the final state.
+    # on_change is awaited with the current state and every change after it.
+    async def wait_for(self, predicate: Callable, on_change: Callable = None) -> ServerState:
+        state = self._latest if self._latest is not None else await self.next()
+
+        while True:
+            if on_change is not None:
+                await on_change(state)
+
+            if predicate(state):
+                return state
+
+            state = await self.next()
+
+    def close(self):
+        self._hub._unsubscribe(self._name, self)
+
+
+# Subscribe to a server's state and await callback(state) with every change,
+# until done() is true or the task is cancelled. A callback that fails is
+# logged, and the next change is passed on as usual.
+async def follow(hub: 'StateHub', name: str, callback: Callable[[ServerState], Awaitable],
+                 done: Callable[[], bool] = lambda: False):
+    watch = hub.subscribe(name)
+    try:
+        while not done():
+            state = await watch.next()
+            try:
+                await callback(state)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print('Failed to follow {}: {}'.format(name, e))
+    finally:
+        watch.close()
+
+
+# Cancel tasks and wait for them to finish.
+async def cancel_tasks(tasks: list):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+#
+# The pollers and subscribers of a single server.
+#
+class _Watch:
+    def __init__(self):
+        self.subscribers = set()
+        self.trackers = []
+        self.tasks = []
+        self.ready = False
+
+
+#
+# Owns one poll loop per instance and one per Macaw server, and shares the
+# results with everything watching them. The loops run while anything is
+# subscribed to the server, so the number of requests doesn't depend on how
+# many observers, embeds or commands are watching.
+#
+# Commands that only need the current state read it from memory while the
+# loops are running, and fall back to the managers' caches otherwise.
+#
+class StateHub:
+    def __init__(self, fleet):
+        self._fleet = fleet
+        self._states = {server.name: ServerState(None, None) for server in fleet}
+        self._watches = {}
+        self._seeded = {}
+
+    def latest(self, name: str) -> ServerState:
+        return self._states[name]
+
+    # Use an instance snapshot from before the bot restarted until the
+    # instance has been polled, so that it can be shown straight away.
+    def seed(self, name: str, snapshot: InstanceSnapshot):
+        if self._states[name].instance is None:
+            self._states[name] = self._states[name]._replace(instance=snapshot)
+            self._seeded[name] = snapshot
+
+    def polling(self, name: str) -> bool:
+        watch = self._watches.get(name)
+        return watch is not None and watch.ready
+
+    # Subscribe to changes of a server's state, starting its poll loops if
+    # they're not already running.
+    def subscribe(self, name: str) -> Subscription:
+        subscription = Subscription(self, name)
+        watch = self._watches.get(name)
+
+        if watch is None:
+            watch = self._start(name)
+        elif watch.ready:
+            subscription._push(self._states[name])
+
+        watch.subscribers.add(subscription)
+        return subscription
+
+    def _unsubscribe(self, name: str, subscription: Subscription):
+        watch = self._watches.get(name)
+        if watch is None:
+            return
+
+        watch.subscribers.discard(subscription)
+        if len(watch.subscribers) == 0:
+            self._stop(name)
+
+    # Make the server's loops poll straight away, for example after it has
+    # been told to start or stop.
+    def wake(self, name: str):
+        watch = self._watches.get(name)
+        if watch is not None:
+            for tracker in watch.trackers:
+                tracker.wake()
+
+    def _start(self, name: str) -> _Watch:
+        server = self._fleet.get(name)
+        watch = _Watch()
+
+        async def poll_instance():
+            return await server.aws.get_snapshot()
+
+        async def poll_macaw():
+            return await server.macaw.probe(self._states[name].instance)
+
+        instance_tracker = StateTracker(poll_instance, INSTANCE_TRANSITION_TIMES,
+                                        phase=lambda snapshot: snapshot.state_code)
+        macaw_tracker = StateTracker(poll_macaw, MACAW_TRANSITION_TIMES,
+                                     phase=lambda status: state_from_status(status))
+
+        async def instance_changed(snapshot: InstanceSnapshot):
+            self._seeded.pop(name, None)
+            previous = self._states[name].instance
+            self._set(name, self._states[name]._replace(instance=snapshot))
+
+            if len(watch.tasks) == 1:
+                # Start polling the Macaw server now that it's known where to find it.
+                watch.tasks.append(asyncio.ensure_future(self._run(macaw_tracker, macaw_changed)))
+            elif previous is None or previous.state_code != snapshot.state_code:
+                # The Macaw server can only be reached once the instance is running.
+                macaw_tracker.wake()
+
+        async def macaw_changed(status: Optional[MacawStatus]):
+            watch.ready = True
+            self._set(name, self._states[name]._replace(macaw=status))
+
+        watch.trackers = [instance_tracker, macaw_tracker]
+        watch.tasks = [asyncio.ensure_future(self._run(instance_tracker, instance_changed))]
+
+        self._watches[name] = watch
+        return watch
+
+    # Run a poll loop, restarting it if polling fails.
+    async def _run(self, tracker: StateTracker, on_change: Callable):
+        while True:
+            try:
+                await tracker.run(on_change)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print('Polling failed: {}'.format(e))
+                await asyncio.sleep(config.settings().poll_max_delay)
+
+    def _stop(self, name: str):
+        watch = self._watches.pop(name, None)
+        if watch is not None:
+            for task in watch.tasks:
+                task.cancel()
+
+    # Store a new state and pass it on to the subscribers once both parts of
+    # it are known.
+    def _set(self, name: str, state: ServerState):
+        self._states[name] = state
+
+        watch = self._watches.get(name)
+        if watch is not None and watch.ready:
+            for subscription in watch.subscribers:
+                subscription._push(state)
+
+    # Get the instance's snapshot, from memory while it's being polled or
+    # while a seeded snapshot is at most SEED_MAX_AGE seconds old.
+    async def instance(self, name: str) -> InstanceSnapshot:
+        if self.polling(name):
+            return self._states[name].instance
+
+        seeded = self._seeded.get(name)
+        if seeded is not None and time.monotonic() - seeded.taken_at <= SEED_MAX_AGE:
+            return seeded
+
+        self._seeded.pop(name, None)
+        snapshot = await self._fleet.get(name).aws.get_snapshot()
+        self._states[name] = self._states[name]._replace(instance=snapshot)
+        return snapshot
+
+    # Get the Macaw server's status, from memory while it's being polled.
+    async def macaw(self, name: str) -> Optional[MacawStatus]:
+        if self.polling(name):
+            return self._states[name].macaw
+
+        snapshot = await self.instance(name)
+        status = await self._fleet.get(name).macaw.probe(snapshot)
+        self._states[name] = self._states[name]._replace(macaw=status)
+        return status
+
+    async def close(self):
+        tasks = []
+        for name in list(self._watches.keys()):
+            tasks.extend(self._watches[name].tasks)
+            self._stop(name)
+
+        await asyncio.gather(*tasks, return_exceptions=True)
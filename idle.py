@@ -0,0 +1,182 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+import discord
+
+import config
+from embeds import ChannelRateLimiter, EmbedColours, edit_limiter
+from hub import ServerState, cancel_tasks, follow
+from macaw_actions import MacawState, state_from_status, valid_status
+from presence import format_duration
+
+
+# Whether no-one is on the server, or None if it isn't known. A server whose
+# instance isn't running isn't idle, as there's nothing to stop, and one
+# that's already stopping doesn't count either way.
+def is_idle(state: ServerState) -> Optional[bool]:
+    status = state.macaw
+    if status is None:
+        return False
+
+    if not valid_status(status):
+        return None
+
+    if state_from_status(status) == MacawState.stopping:
+        return None
+
+    return len(status.json['players']) == 0
+
+
+#
+# The countdown to stopping an idle server, and the warning posted before it
+# stops.
+#
+class _Countdown:
+    def __init__(self):
+        self.task = None
+        self.warning = None
+
+        # The task sending the warning. It isn't cancelled with the countdown,
+        # so that a warning that was on its way can still be edited.
+        self.sending = None
+
+
+#
+# Stops servers that have had no players for idle_timeout seconds, posting a
+# warning to the server's idle channel idle_warning seconds beforehand. The
+# shutdown is cancelled if a player joins or someone runs >stay, and only
+# servers with an idle channel are ever stopped.
+#
+# Player counts come from the StateHub's /status results, so this doesn't
+# make any requests of its own and polls back off while nothing changes. The
+# countdowns themselves are timers rather than polls.
+#
+class IdleShutdown:
+    # stop is a coroutine function taking the server and the warning message,
+    # which runs the usual stop path and replies to the warning.
+    def __init__(self, client: discord.Client, hub, fleet, stop: Callable[..., Awaitable],
+                 limiter: ChannelRateLimiter = edit_limiter):
+        self._client = client
+        self._hub = hub
+        self._fleet = fleet
+        self._stop = stop
+        self._limiter = limiter
+        self._countdowns = {}
+        self._tasks = {}
+
+    def start(self):
+        for server in self._fleet:
+            if server.profile.idle_channel is not None:
+                self._tasks[server.name] = asyncio.ensure_future(self._run(server.name))
+
+    # Whether the server is stopped when it's idle.
+    def watching(self, name: str) -> bool:
+        return name in self._tasks
+
+    # Whether a shutdown of the server is counting down.
+    def pending(self, name: str) -> bool:
+        return name in self._countdowns
+
+    async def _run(self, name: str):
+        await follow(self._hub, name, lambda state: self._update(name, state))
+
+    async def _update(self, name: str, state: ServerState):
+        idle = is_idle(state)
+        if idle is None:
+            # Nothing is known about the players, leave any countdown running.
+            return
+
+        if idle and config.settings().idle_timeout > 0:
+            if name not in self._countdowns:
+                self._begin(name)
+        else:
+            reason = 'Someone joined the server.' if state.macaw is not None else 'The server has stopped.'
+            await self.cancel(name, reason)
+
+    def _begin(self, name: str):
+        countdown = _Countdown()
+        countdown.task = asyncio.ensure_future(self._count_down(name, countdown))
+        self._countdowns[name] = countdown
+
+    async def _count_down(self, name: str, countdown: _Countdown):
+        settings = config.settings()
+        warning = min(settings.idle_warning, settings.idle_timeout)
+
+        await asyncio.sleep(settings.idle_timeout - warning)
+        countdown.sending = asyncio.ensure_future(self._warn(name, settings.idle_timeout - warning, warning))
+        countdown.warning = await asyncio.shield(countdown.sending)
+        await asyncio.sleep(warning)
+
+        # The shutdown can't be cancelled from here on.
+        del self._countdowns[name]
+
+        if countdown.warning is None:
+            # No-one could be warned, so leave the server running.
+            return
+
+        try:
+            await self._stop(self._fleet.get(name), countdown.warning)
+        except Exception as e:
+            print('Failed to stop idle server {}: {}'.format(name, e))
+
+    def _channel(self, name: str):
+        return self._client.get_channel(self._fleet.get(name).profile.idle_channel)
+
+    async def _warn(self, name: str, idle: float, warning: float):
+        channel = self._channel(name)
+        if channel is None:
+            return None
+
+        embed = discord.Embed(
+            title='Stopping Soon', color=EmbedColours.FAIL,
+            description='No-one has been on {} for {}, so it will stop in {}. '
+                        'Join the server or use `>stay {}` to keep it running.'.format(
+                            name, format_duration(idle), format_duration(warning), name))
+
+        await self._limiter.wait(channel.id)
+        try:
+            return await channel.send(embed=embed)
+        except discord.HTTPException as e:
+            print('Failed to warn about idle shutdown: {}'.format(e))
+            return None
+
+    # Cancel the server's countdown, if it has one, and say why on its warning.
+    # Returns whether there was a countdown.
+    async def cancel(self, name: str, reason: str = None) -> bool:
+        countdown = self._countdowns.pop(name, None)
+        if countdown is None:
+            return False
+
+        await cancel_tasks([countdown.task])
+
+        if countdown.sending is not None:
+            # Wait for a warning that's still being sent, so that it's edited too.
+            countdown.warning = await countdown.sending
+
+        if countdown.warning is not None:
+            embed = discord.Embed(title='Shutdown Cancelled', color=EmbedColours.SUCCESS, description=reason)
+            await self._limiter.wait(countdown.warning.channel.id)
+            try:
+                await countdown.warning.edit(embed=embed)
+            except discord.HTTPException as e:
+                print('Failed to cancel idle shutdown: {}'.format(e))
+
+        return True
+
+    # Cancel the server's countdown and start the idle period again.
+    # Returns whether there was a countdown.
+    async def postpone(self, name: str, reason: str = None) -> bool:
+        cancelled = await self.cancel(name, reason)
+        if cancelled:
+            self._begin(name)
+        return cancelled
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        for countdown in self._countdowns.values():
+            tasks.append(countdown.task)
+            if countdown.sending is not None:
+                tasks.append(countdown.sending)
+        self._tasks = {}
+        self._countdowns = {}
+        await cancel_tasks(tasks)
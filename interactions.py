@@ -0,0 +1,169 @@
+from typing import NamedTuple
+
+import discord
+from discord.http import Route
+
+from commands import split_commands
+
+
+# Interactions are only in later versions of the API than the one discord.py
+# 1.7 uses, so their routes point at a newer one.
+class InteractionRoute(Route):
+    BASE = 'https://discord.com/api/v10'
+
+
+class InteractionType:
+    ping = 1
+    application_command = 2
+
+
+class ResponseType:
+    deferred_channel_message = 5
+
+
+class OptionType:
+    string = 3
+
+
+_SERVER_OPTION = {
+    'name': 'server',
+    'description': 'The server to use, if there\'s more than one.',
+    'type': OptionType.string,
+    'required': False
+}
+
+# The slash commands registered in each guild. Each one runs the text command
+# of the same name.
+SLASH_COMMANDS = [
+    {'name': 'start', 'description': 'Start the servers and instance.', 'options': [_SERVER_OPTION]},
+    {'name': 'stop', 'description': 'Stop the servers and instance.', 'options': [_SERVER_OPTION]},
+    {'name': 'status', 'description': 'Get the current status of the instance.', 'options': [_SERVER_OPTION]},
+    {'name': 'players', 'description': 'Get a list of currently online players.', 'options': [_SERVER_OPTION]},
+    {'name': 'dynmap', 'description': 'Get the current dynmap address.', 'options': [_SERVER_OPTION]},
+    {
+        'name': 'issue',
+        'description': 'Issue commands to the Minecraft server, separated by semicolons.',
+        'options': [
+            {'name': 'command', 'description': 'The command to issue.', 'type': OptionType.string, 'required': True},
+            _SERVER_OPTION
+        ]
+    }
+]
+
+
+# Get the arguments for the text command's handler from a slash command's options.
+def command_args(name: str, options: list) -> tuple:
+    values = {option['name']: option['value'] for option in options}
+
+    if name == 'issue':
+        return values.get('server'), split_commands(values.get('command', ''))
+    return (values.get('server'),)
+
+
+# Replace the slash commands in a guild with the bot's ones.
+async def register(http, application_id: int, guild_id: int):
+    route = InteractionRoute('PUT', '/applications/{application_id}/guilds/{guild_id}/commands',
+                             application_id=application_id, guild_id=guild_id)
+    await http.request(route, json=SLASH_COMMANDS)
+
+
+class _Role(NamedTuple):
+    id: int
+
+
+#
+# The member who used a slash command, with just enough of discord.Member for
+# the permission checks.
+#
+class InteractionMember(NamedTuple):
+    id: int
+    guild: discord.Guild
+    roles: list
+
+
+#
+# A response to an interaction, which is edited through the interaction's
+# webhook rather than the channel. The deferred response is '@original'.
+#
+class InteractionMessage:
+    def __init__(self, context: 'InteractionContext', message_id: str, embed: discord.Embed = None):
+        self._context = context
+        self._message_id = message_id
+        self.embeds = [embed] if embed is not None else []
+
+    @property
+    def id(self) -> str:
+        return self._message_id
+
+    @property
+    def channel(self) -> 'InteractionChannel':
+        return self._context.channel
+
+    async def edit(self, content: str = None, embed: discord.Embed = None):
+        route = InteractionRoute('PATCH', '/webhooks/{application_id}/{token}/messages/{message_id}',
+                                 application_id=self._context.application_id, token=self._context.token,
+                                 message_id=self._message_id)
+        await self._context.http.request(route, json=_message_json(content, embed))
+        self.embeds = [embed] if embed is not None else []
+
+
+#
+# Stands in for the channel of a slash command. The first message sent fills
+# in the deferred response and any more are sent as follow ups.
+#
+class InteractionChannel:
+    def __init__(self, context: 'InteractionContext', channel_id: int):
+        self._context = context
+        self.id = channel_id
+
+    async def send(self, content: str = None, embed: discord.Embed = None) -> InteractionMessage:
+        context = self._context
+
+        if not context.responded:
+            context.responded = True
+            message = InteractionMessage(context, '@original')
+            await message.edit(content=content, embed=embed)
+            return message
+
+        route = InteractionRoute('POST', '/webhooks/{application_id}/{token}',
+                                 application_id=context.application_id, token=context.token)
+        data = await context.http.request(route, json=_message_json(content, embed))
+        return InteractionMessage(context, data['id'], embed)
+
+
+#
+# Stands in for the message of a text command, so that slash commands run
+# through the same handlers. The handlers reply with channel.send as usual.
+#
+class InteractionContext:
+    def __init__(self, client: discord.Client, application_id: int, interaction: dict):
+        self.http = client.http
+        self.application_id = application_id
+        self.id = int(interaction['id'])
+        self.token = interaction['token']
+        self.content = ''
+        self.responded = False
+
+        self.guild = client.get_guild(int(interaction['guild_id'])) if 'guild_id' in interaction else None
+        self.channel = InteractionChannel(self, int(interaction['channel_id']))
+
+        if 'member' in interaction:
+            member = interaction['member']
+            self.author = InteractionMember(int(member['user']['id']), self.guild,
+                                            [_Role(int(role_id)) for role_id in member['roles']])
+        else:
+            self.author = InteractionMember(int(interaction['user']['id']), None, [])
+
+    # Acknowledge the interaction straight away, showing that the bot is
+    # thinking until the first message is sent.
+    async def defer(self):
+        route = InteractionRoute('POST', '/interactions/{interaction_id}/{token}/callback',
+                                 interaction_id=self.id, token=self.token)
+        await self.http.request(route, json={'type': ResponseType.deferred_channel_message})
+
+
+def _message_json(content: str, embed: discord.Embed) -> dict:
+    return {
+        'content': content or '',
+        'embeds': [embed.to_dict()] if embed is not None else []
+    }
@@ -0,0 +1,133 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+
+# What happened to a job when it was submitted.
+class JobState:
+    # The job is running now.
+    started = 'started'
+    # The same operation was already running or queued, and that job was returned instead.
+    merged = 'merged'
+    # A different operation is running on the server, so the job will run after it.
+    queued = 'queued'
+    # A different operation is already queued on the server, so the job was dropped.
+    busy = 'busy'
+
+
+#
+# A lifecycle operation on a server, such as starting or stopping it. The
+# operation may hand back an observer, which is watched until it finishes.
+#
+class Job:
+    def __init__(self, name: str, kind: str, run: Callable[[], Awaitable], timeout: float = None):
+        self.name = name
+        self.kind = kind
+        self.observer = None
+        self.task = None
+
+        # How long the observation may take, if not the usual timeout.
+        self.timeout = timeout
+
+        self._run = run
+
+        # Set once the operation has been tried, whether or not it was started.
+        self.observing = asyncio.Event()
+
+
+#
+# The running and queued jobs of a single server.
+#
+class _Lane:
+    def __init__(self):
+        self.running = None
+        self.queued = None
+
+
+#
+# Runs lifecycle operations one at a time per server. Running an operation
+# that's already running or queued joins the existing job, and running a
+# different one queues it behind the current job. Only one job is queued
+# per server, anything else is turned away until it has run.
+#
+# Observations are run through the ObservationScheduler, so they still time out.
+#
+class JobScheduler:
+    def __init__(self, observations, timeout: Callable[[], float]):
+        self._observations = observations
+        self._timeout = timeout
+        self._lanes = {}
+
+    # The job running on the server, if there is one.
+    def running(self, name: str) -> Optional[Job]:
+        lane = self._lanes.get(name)
+        return lane.running if lane is not None else None
+
+    # Submit an operation. run is a coroutine function that performs it and
+    # returns an observer to watch, or None if the operation didn't happen.
+    # Returns the state of the job and the job itself, which is an existing
+    # one if the job was merged or turned away.
+    def submit(self, name: str, kind: str, run: Callable[[], Awaitable], timeout: float = None) -> tuple:
+        lane = self._lanes.setdefault(name, _Lane())
+
+        if lane.queued is not None:
+            if lane.queued.kind == kind:
+                return JobState.merged, lane.queued
+            return JobState.busy, lane.queued
+
+        if lane.running is not None:
+            if lane.running.kind == kind:
+                return JobState.merged, lane.running
+
+            lane.queued = Job(name, kind, run, timeout)
+            return JobState.queued, lane.queued
+
+        job = Job(name, kind, run, timeout)
+        self._start(lane, job)
+        return JobState.started, job
+
+    def _start(self, lane: _Lane, job: Job):
+        lane.running = job
+        job.task = asyncio.ensure_future(self._run(lane, job))
+
+    async def _run(self, lane: _Lane, job: Job):
+        try:
+            job.observer = await job._run()
+            job.observing.set()
+
+            if job.observer is not None:
+                timeout = job.timeout if job.timeout is not None else self._timeout()
+                await self._observations.schedule(job.observer, timeout=timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print('Job {} on {} failed: {}'.format(job.kind, job.name, e))
+        finally:
+            job.observing.set()
+            lane.running = None
+
+        if lane.queued is not None:
+            queued = lane.queued
+            lane.queued = None
+            self._start(lane, queued)
+
+    # Wait for every job to finish, queued ones included.
+    async def join(self):
+        while True:
+            tasks = [lane.running.task for lane in self._lanes.values() if lane.running is not None]
+            if len(tasks) == 0:
+                return
+
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Cancel every job, queued ones included.
+    async def close(self):
+        tasks = []
+        for lane in self._lanes.values():
+            lane.queued = None
+            if lane.running is not None:
+                tasks.append(lane.running.task)
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,10 +1,13 @@
-import requests
-from requests.exceptions import Timeout
-import config
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Optional
 
-from aws_actions import InstanceState
+import aiohttp
+import config
+import metrics
 
-credentials = config.CredentialsConfig()
+from aws_actions import InstanceSnapshot, InstanceState
 
 
 class MacawState:
@@ -26,88 +29,233 @@ JSON_REPONSE_MAP = {
 }
 
 
+# Why the Macaw server couldn't be reached.
+class MacawError:
+    timeout = 'timeout'
+    unreachable = 'unreachable'
+
+
+#
+# The outcome of asking the Macaw server for its /status. Either the response
+# or the reason the request failed is set. Statuses compare equal if they say
+# the same thing, whenever they were fetched.
+#
+@dataclass(frozen=True)
+class MacawStatus:
+    status_code: Optional[int] = None
+    json: Optional[dict] = None
+    error: Optional[str] = None
+    fetched_at: float = field(default=0, compare=False)
+
+
+# Whether a status holds a usable /status response, with the Minecraft
+# server's status and its list of players.
+def valid_status(status: Optional[MacawStatus]) -> bool:
+    return status is not None and status.error is None and status.status_code == 200 and \
+        isinstance(status.json, dict) and status.json.get('status') in JSON_REPONSE_MAP and \
+        isinstance(status.json.get('players'), list)
+
+
+# Get the MacawState from a status, or from None if the instance isn't running.
+# Failed requests mean different things depending on whether the servers are
+# starting or stopping. A response that can't be used, like a 401 or a body
+# without a status, counts as a failed request.
+def state_from_status(status: Optional[MacawStatus], starting=True) -> int:
+    if status is None:
+        return MacawState.instance_stopped
+
+    if status.error == MacawError.timeout:
+        if starting:
+            return MacawState.macaw_starting
+        else:
+            return MacawState.macaw_stopped
+    elif not valid_status(status):
+        if starting:
+            return MacawState.macaw_starting
+        else:
+            return MacawState.macaw_stopping
+
+    return JSON_REPONSE_MAP[status.json['status']]
+
+
+# Get the online players from a status, as a (success, message) tuple.
+def players_from_status(status: Optional[MacawStatus]) -> tuple:
+    if status is None:
+        return False, 'Instance is not running.'
+
+    if status.error is not None:
+        return False, 'Macaw server is not running.'
+
+    if status.status_code == 401:
+        return False, 'The Macaw API key is not correct, check the config.'
+    elif not valid_status(status):
+        return False, 'The Macaw server sent an unexpected response.'
+    else:
+        players = status.json['players']
+        if len(players) < 1:
+            return True, 'No-one is online :('
+        else:
+            return True, '\n'.join(players)
+
+
 class MacawManager:
-    def __init__(self, aws_manager):
+    # aws_manager is an AsyncAWSManager. Responses from /status are shared
+    # between callers for status_ttl seconds. A semaphore can be passed in as
+    # limiter to bound the number of requests in flight across managers.
+    def __init__(self, aws_manager, connect_timeout: float = 3, read_timeout: float = 3,
+                 status_ttl: float = 1, port: int = 8080, scheme: str = 'https',
+                 limiter: asyncio.Semaphore = None):
         self._aws_manager = aws_manager
+        self._limiter = limiter
+        self._timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._port = port
+        self._scheme = scheme
+
+        self._session = None
+        self._session_ip = None
+
+        self._status_ttl = status_ttl
+        self._status = None
+        self._status_task = None
+
+    # Get a keep-alive session for the Macaw server at the given address. The
+    # session is rebuilt whenever the instance comes back with a new public IP.
+    async def _get_session(self, ip_address: str) -> aiohttp.ClientSession:
+        if self._session is None or self._session_ip != ip_address:
+            if self._session is not None:
+                await self._session.close()
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(ssl=False, limit=4),
+                timeout=self._timeout)
+            self._session_ip = ip_address
+            self._status = None
+
+        return self._session
 
-    def get_state(self, starting=True) -> int:
+    # Make a request within the concurrency limit.
+    async def _request(self, method: str, ip_address: str, endpoint: str, **kwargs) -> tuple:
+        if self._limiter is None:
+            return await self._send(method, ip_address, endpoint, **kwargs)
+
+        async with self._limiter:
+            return await self._send(method, ip_address, endpoint, **kwargs)
+
+    async def _send(self, method: str, ip_address: str, endpoint: str, **kwargs) -> tuple:
+        session = await self._get_session(ip_address)
+        url = '{}://{}:{}/{}'.format(self._scheme, ip_address, self._port, endpoint)
+
+        with metrics.track(metrics.macaw_requests, metrics.macaw_latency, endpoint=endpoint):
+            async with session.request(method, url, params={'key': config.credentials().macaw_key},
+                                       **kwargs) as res:
+                try:
+                    json = await res.json(content_type=None)
+                except ValueError:
+                    json = None
+
+                return res.status, json
+
+    # Get the response from /status, either from the cache or from a single
+    # request shared with any other callers waiting on it.
+    async def _get_status(self, ip_address: str) -> MacawStatus:
+        status = self._status
+        if status is not None and self._session_ip == ip_address and \
+                time.monotonic() - status.fetched_at <= self._status_ttl:
+            return status
+
+        if self._status_task is None:
+            self._status_task = asyncio.ensure_future(self._fetch_status(ip_address))
+            self._status_task.add_done_callback(self._status_fetched)
+
+        # Shielded so that a cancelled caller doesn't cancel the request for everyone else.
+        return await asyncio.shield(self._status_task)
+
+    async def _fetch_status(self, ip_address: str) -> MacawStatus:
+        status_code, json = await self._request('GET', ip_address, 'status')
+        self._status = MacawStatus(status_code=status_code, json=json, fetched_at=time.monotonic())
+        return self._status
+
+    def _status_fetched(self, task: asyncio.Task):
+        self._status_task = None
+        if not task.cancelled():
+            # Mark the exception as retrieved, callers get it through the shield.
+            task.exception()
+
+    # Get the address of the Macaw server, or None if the instance isn't running.
+    # A snapshot that was already taken can be passed in to avoid describing the
+    # instance again.
+    async def _get_address(self, snapshot: InstanceSnapshot = None) -> Optional[str]:
+        if snapshot is None:
+            snapshot = await self._aws_manager.get_snapshot()
+
+        if snapshot.state_code == InstanceState.running:
+            return snapshot.ip_address
+        return None
+
+    # Ask the Macaw server for its status. Returns None if the instance isn't
+    # running, and a status with the error set if the request fails.
+    async def probe(self, snapshot: InstanceSnapshot = None) -> Optional[MacawStatus]:
         # Check that the instance is running.
-        if self._aws_manager.get_state() == InstanceState.running:
-            try:
-                res = requests.get('https://{}:8080/status?key={}'.format(self._aws_manager.get_public_ip(),
-                                   credentials.macaw_key), timeout=3,
-                                   verify=False)
-            except Timeout:
-                if starting:
-                    return MacawState.macaw_starting
-                else:
-                    return MacawState.macaw_stopped
-            except:
-                if starting:
-                    return MacawState.macaw_starting
-                else:
-                    return MacawState.macaw_stopping
-
-            json = res.json()
-
-            return JSON_REPONSE_MAP[json['status']]
-        return MacawState.instance_stopped
+        ip_address = await self._get_address(snapshot)
+        if ip_address is None:
+            return None
+
+        try:
+            return await self._get_status(ip_address)
+        except asyncio.TimeoutError:
+            return MacawStatus(error=MacawError.timeout, fetched_at=time.monotonic())
+        except Exception:
+            return MacawStatus(error=MacawError.unreachable, fetched_at=time.monotonic())
 
-    def shutdown(self):
+    async def get_state(self, starting=True, snapshot: InstanceSnapshot = None) -> int:
+        return state_from_status(await self.probe(snapshot), starting)
+
+    async def shutdown(self):
         # Check that the instance is running.
-        if self._aws_manager.get_state() == InstanceState.running:
+        ip_address = await self._get_address()
+        if ip_address is not None:
             try:
-                res = requests.get('https://{}:8080/kill?key={}'.format(self._aws_manager.get_public_ip(),
-                                   credentials.macaw_key), timeout=3,
-                                   verify=False)
+                await self._request('GET', ip_address, 'kill')
                 return True, 'Shutting system down...'
-            except Timeout:
+            except (asyncio.TimeoutError, aiohttp.ClientError):
                 return False, 'Failed to contact the Macaw server.'
 
         return False, 'The instance is not running!'
 
-    def issue(self, command: str) -> tuple:
+    # Issue several commands with a single check that the instance is running.
+    # The commands are sent in order over the same keep-alive connection, and
+    # a (success, message) tuple is returned for each of them.
+    async def issue_many(self, commands: list) -> list:
         # Check that the instance is running.
-        if self._aws_manager.get_state() == InstanceState.running:
-            try:
-                res = requests.post(
-                    'https://{}:8080/issue?key={}'.format(self._aws_manager.get_public_ip(), credentials.macaw_key),
-                    json={'command': command},
-                    timeout=3,
-                    verify=False)
-            except Timeout:
-                return False, 'Macaw server is not running.'
+        ip_address = await self._get_address()
+        if ip_address is None:
+            return [(False, 'Instance is not running.')] * len(commands)
 
-            status = res.status_code
+        results = []
+        for command in commands:
+            try:
+                status, _ = await self._request('POST', ip_address, 'issue', json={'command': command})
+            except (asyncio.TimeoutError, aiohttp.ClientError):
+                # The rest of the commands won't get through either.
+                results.extend([(False, 'Macaw server is not running.')] * (len(commands) - len(results)))
+                break
 
             if status == 401:
-                return False, 'The Macaw API key is not correct, check the config.'
+                results.append((False, 'The Macaw API key is not correct, check the config.'))
             elif status == 503:
-                return False, 'The Minecraft server is not running yet.'
+                results.append((False, 'The Minecraft server is not running yet.'))
             else:
-                return True, 'Command issued!'
+                results.append((True, 'Command issued!'))
 
-        return False, 'Instance is not running.'
+        return results
 
-    def get_online_players(self) -> tuple:
-        # Check that the instance is running.
-        if self._aws_manager.get_state() == InstanceState.running:
-            try:
-                res = requests.get('https://{}:8080/status?key={}'.format(self._aws_manager.get_public_ip(),
-                                   credentials.macaw_key), timeout=3,
-                                   verify=False)
-            except:
-                return False, 'Macaw server is not running.'
+    async def issue(self, command: str) -> tuple:
+        return (await self.issue_many([command]))[0]
 
-            status = res.status_code
-            json = res.json()
+    async def get_online_players(self) -> tuple:
+        return players_from_status(await self.probe())
 
-            if status == 401:
-                return False, 'The Macaw API key is not correct, check the config.'
-            else:
-                players = json['players']
-                if len(players) < 1:
-                    return True, 'No-one is online :('
-                else:
-                    return True, '\n'.join(players)
-        return False, 'Instance is not running.'
\ No newline at end of file
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
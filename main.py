@@ -1,165 +1,742 @@
 import re
+import time
 
 import discord
 
 import config
+import interactions
+import metrics
 import observers
-from permissions import allowed_commands, can_run, Action
-from aws_actions import AWSManager
-from macaw_actions import MacawManager
-
-credentials = config.CredentialsConfig()
-aws_config = config.AWSConfig()
-settings = config.SettingsConfig()
-
-aws = AWSManager()
-macaw = MacawManager(aws)
-
-STATUS_COLOURS = {
-    0: 0xb8b9ba,
-    16: 0x04d45b,
-    32: 0xa6003a,
-    48: 0x57001e,
-    64: 0xd18100,
-    80: 0xd11f00
+from commands import CommandError, CommandRouter, one_word, optional_player, optional_target, split_commands, \
+    targeted_commands, targeted_rest
+import permissions
+from permissions import allowed_commands, can_run, is_admin, Action
+from prewarm import Prewarmer
+from presence import PresenceTracker, format_duration
+from dashboard import DashboardManager
+from embeds import STATUS_COLOURS, EmbedColours
+from fleet import Fleet
+from hub import StateHub
+from idle import IdleShutdown
+from jobs import JobScheduler, JobState
+from macaw_actions import players_from_status
+from ratelimit import RateLimiter
+
+# Settings that are only read on startup.
+settings = config.settings()
+
+# Commands that can be answered with the last known state when they're rate limited.
+CACHED_COMMANDS = ('status', 'players', 'dynmap')
+
+# How far back >playtime looks, in seconds.
+PLAYTIME_PERIOD = 7 * 24 * 60 * 60
+
+# What the server is doing during each kind of job.
+JOB_DESCRIPTIONS = {
+    'start': 'starting',
+    'stop': 'stopping'
 }
 
-class EmbedColours:
-    FAIL = 0xd11f00
-    SUCCESS = 0x04d45b
+
+def _players_embed(result):
+    if result[0]:
+        return discord.Embed(title='Online Players', color=EmbedColours.SUCCESS, description=result[1])
+    else:
+        return discord.Embed(title='Cannot get players', color=EmbedColours.FAIL, description=result[1])
+
+
+def _dynmap_embed(server, ip_address):
+    if ip_address is not None:
+        return discord.Embed(title='Dynmap', color=EmbedColours.SUCCESS, description='{}:{}'.format(ip_address, server.dynmap_port))
+    else:
+        return discord.Embed(title='Failed', color=EmbedColours.FAIL, description='Can\'t get the dynmap address if the instance isn\'t running!')
+
+
+# The embed shown when the servers start starting, before anything has been observed.
+def _starting_embed():
+    embed = discord.Embed(title='Starting...', color=0xd11f00, description='No public IP address yet...')
+    embed.add_field(name='EC2 Instance', value=':red_square: Stopped')
+    embed.add_field(name='Macaw Server', value=':red_square: Stopped')
+    embed.add_field(name='Minecraft Server', value=':red_square: Stopped')
+    return embed
+
+
+# The embed shown when the servers start stopping, before anything has been observed.
+def _stopping_embed():
+    embed = discord.Embed(title='Stopping...', color=0xd11f00)
+    embed.add_field(name='EC2 Instance', value=':green_square: Running')
+    embed.add_field(name='Macaw Server', value=':green_square: Running')
+    embed.add_field(name='Minecraft Server', value=':green_square: Running')
+    return embed
+
+
+# A job that picks up an observer that's already running rather than
+# starting anything.
+def _resumed(observer):
+    async def run():
+        return observer
+    return run
 
 
 class MacawBot(discord.Client):
-    def __init__(self):
-        super().__init__()
-
-        self._commands = {
-            'help': (self._cmd_help, '`>help`: Display this help message.'),
-            'start': (self._cmd_start, '`>start`: Start the servers and instance.'),
-            'stop': (self._cmd_stop, '`>stop`: Stop the servers and instance.'),
-            'status': (self._cmd_status, '`>status`: Get the current status of the instance.'),
-            'issue': (self._cmd_issue, '`>issue [COMMAND]`: Issue a command to the Minecraft server.'),
-            'players': (self._cmd_players, '`>players`: Get a list of currently online players.'),
-            'dynmap': (self._cmd_dynmap, '`>dynmap`: Get the current dynmap address.')
-        }
+    def __init__(self, fleet: Fleet):
+        # Member updates are only delivered with the privileged members intent,
+        # so member permissions are only cached when it's enabled.
+        intents = discord.Intents.default()
+        intents.members = settings.members_intent
+
+        # Without text commands the bot has no use for messages, so it doesn't
+        # ask for them and only hears about slash commands.
+        intents.guild_messages = settings.text_commands
+        intents.dm_messages = settings.text_commands
+        super().__init__(intents=intents)
+
+        permissions.index.cache_members = settings.members_intent
+
+        self._fleet = fleet
+        self._hub = StateHub(fleet)
+        self._observations = observers.ObservationScheduler(store=observers.ObservationStore())
+        self._jobs = JobScheduler(self._observations, lambda: config.settings().observe_timeout)
+        self._dashboards = DashboardManager(self, self._hub, fleet)
+        self._presence = PresenceTracker(self, self._hub, fleet) if settings.presence_tracking else None
+        self._idle = IdleShutdown(self, self._hub, fleet, self._idle_stop)
+        self._prewarm = None
+        if settings.prewarm:
+            self._prewarm = Prewarmer(self, self._hub, fleet, self._idle, self._prewarm_start)
+        self._config_watcher = None
+        self._restored = False
+        self._application_id = None
+
+        self._loop_lag = metrics.LoopLagMonitor(settings.loop_lag_interval)
+        self._metrics_server = None
+        if settings.metrics_port > 0:
+            self._metrics_server = metrics.MetricsServer(settings.metrics_host, settings.metrics_port)
+
+        # Role names may have changed, so rebuild permission indexes as they're next needed.
+        config.registry.subscribe(lambda snapshot: permissions.index.clear())
+
+        self._rate_limiter = RateLimiter()
+        self._limited_until = {}
+
+        self._commands = CommandRouter(can_run, self._invalid_arguments, limit=self._limit,
+                                       on_limited=self._rate_limited)
+        self._commands.register('help', self._cmd_help, '`>help`: Display this help message.')
+        self._commands.register('start', self._cmd_start,
+                                '`>start [SERVER]`: Start the servers and instance.', parser=optional_target)
+        self._commands.register('stop', self._cmd_stop,
+                                '`>stop [SERVER]`: Stop the servers and instance.', parser=optional_target)
+        self._commands.register('stay', self._cmd_stay,
+                                '`>stay [SERVER]`: Keep an idle server running for a while longer.',
+                                parser=optional_target)
+        self._commands.register('status', self._cmd_status,
+                                '`>status [SERVER|all]`: Get the current status of the instance.',
+                                parser=optional_target)
+        self._commands.register('issue', self._cmd_issue,
+                                '`>issue [@SERVER] COMMAND[; COMMAND...]`: Issue commands to the Minecraft server.',
+                                parser=targeted_commands)
+        self._commands.register('macro', self._cmd_macro,
+                                '`>macro [@SERVER] [NAME]`: Run a macro from the config, or list them.',
+                                parser=targeted_rest)
+        self._commands.register('players', self._cmd_players,
+                                '`>players [SERVER]`: Get a list of currently online players.',
+                                parser=optional_target)
+        self._commands.register('seen', self._cmd_seen,
+                                '`>seen PLAYER`: Find out when a player was last online.', parser=one_word)
+        self._commands.register('playtime', self._cmd_playtime,
+                                '`>playtime [PLAYER]`: Get the time played this week.', parser=optional_player)
+        self._commands.register('dynmap', self._cmd_dynmap,
+                                '`>dynmap [SERVER]`: Get the current dynmap address.', parser=optional_target)
+        self._commands.register('reload', self._cmd_reload, '`>reload`: Reload the config files.')
+        self._commands.register('dashboard', self._cmd_dashboard,
+                                '`>dashboard [SERVER|off]`: Keep a live status message in this channel.',
+                                parser=optional_target)
+        self._commands.register('metrics', self._cmd_metrics, '`>metrics`: Show call counts, latencies and event loop lag.')
 
     async def on_ready(self):
+        for guild in self.guilds:
+            permissions.index.rebuild_guild(guild)
+
+        if self._config_watcher is None and settings.config_watch_interval > 0:
+            self._config_watcher = self.loop.create_task(config.registry.watch(settings.config_watch_interval))
+
+        # on_ready is called again after reconnecting, only restore state the first time.
+        if not self._restored:
+            self._restored = True
+
+            # Registering overwrites the guild's commands, so it's done once
+            # here and for guilds joined later in on_guild_join.
+            if settings.slash_commands:
+                await self._register_slash_commands(self.guilds)
+
+            # The AWS backends are created on first use, get them ready now
+            # that the bot is connected rather than holding up the first command.
+            self.loop.create_task(self._fleet.prepare())
+
+            self._loop_lag.start()
+            if self._metrics_server is not None:
+                await self._metrics_server.start()
+            await self._resume_observations()
+            await self._dashboards.restore()
+            if self._presence is not None:
+                self._presence.start()
+            self._idle.start()
+            if self._prewarm is not None:
+                self._prewarm.start()
+
         print('Bot started.')
 
+    async def on_guild_join(self, guild):
+        permissions.index.rebuild_guild(guild)
+
+        if settings.slash_commands:
+            await self._register_slash_commands([guild])
+
+    async def _register_slash_commands(self, guilds):
+        if self._application_id is None:
+            self._application_id = (await self.application_info()).id
+
+        for guild in guilds:
+            try:
+                await interactions.register(self.http, self._application_id, guild.id)
+            except discord.HTTPException as e:
+                # The bot needs to be invited with the applications.commands scope.
+                print('Failed to register slash commands in {}: {}'.format(guild.name, e))
+
+    # discord.py 1.7 doesn't know about interactions, so slash commands are
+    # picked out of the raw gateway events.
+    async def on_socket_response(self, payload):
+        if payload.get('t') != 'INTERACTION_CREATE' or self._application_id is None:
+            return
+
+        interaction = payload['d']
+        if interaction['type'] == interactions.InteractionType.application_command:
+            await self._on_slash_command(interaction)
+
+    async def _on_slash_command(self, interaction):
+        context = interactions.InteractionContext(self, self._application_id, interaction)
+
+        # Interactions have to be acknowledged within 3 seconds, the handler
+        # fills in the response once it's done.
+        await context.defer()
+
+        name = interaction['data']['name']
+        command = self._commands.get(name)
+
+        try:
+            if command is None or not can_run(name, context.author, context.guild):
+                embed = discord.Embed(title='Not allowed', color=EmbedColours.FAIL,
+                                      description='You don\'t have permission to use this command.')
+                await context.channel.send(embed=embed)
+                return
+
+            try:
+                args = interactions.command_args(name, interaction['data'].get('options', []))
+            except CommandError as e:
+                await self._invalid_arguments(context, command, e)
+                return
+
+            await self._commands.run(context, command, args)
+        except Exception:
+            if not context.responded:
+                embed = discord.Embed(title='Something went wrong', color=EmbedColours.FAIL)
+                await context.channel.send(embed=embed)
+            raise
+
+        # Every interaction needs a response, even if the handler didn't send one.
+        if not context.responded:
+            embed = discord.Embed(title='Done', color=EmbedColours.SUCCESS)
+            await context.channel.send(embed=embed)
+
+    async def on_guild_remove(self, guild):
+        permissions.index.forget_guild(guild)
+
+    async def on_guild_role_create(self, role):
+        permissions.index.rebuild_guild(role.guild)
+
+    async def on_guild_role_delete(self, role):
+        permissions.index.rebuild_guild(role.guild)
+
+    async def on_guild_role_update(self, before, after):
+        permissions.index.rebuild_guild(after.guild)
+
+    async def on_member_update(self, before, after):
+        permissions.index.invalidate_member(after)
+
+    async def on_member_remove(self, member):
+        permissions.index.invalidate_member(member)
+
+    async def close(self):
+        if self._config_watcher is not None:
+            self._config_watcher.cancel()
+
+        await self._loop_lag.stop()
+        if self._metrics_server is not None:
+            await self._metrics_server.stop()
+
+        if self._prewarm is not None:
+            await self._prewarm.close()
+        await self._idle.close()
+        await self._jobs.close()
+        await self._observations.close()
+        await self._dashboards.close()
+        if self._presence is not None:
+            await self._presence.close()
+        await self._hub.close()
+        await self._fleet.close()
+        await super().close()
+
     async def on_message(self, message):
-        if message.author == self.user:
+        if message.author == self.user or not settings.text_commands:
             return
 
-        if not message.content.startswith('>'):
+        await self._commands.dispatch(message)
+
+    # Carry on with the starts and stops that were being observed when the bot
+    # last stopped, editing the same messages. The observations only get what
+    # was left of their timeout.
+    async def _resume_observations(self):
+        for observation_id, entry in self._observations.unfinished().items():
+            server = self._fleet.get(entry['server'])
+            messages = await self._fetch_messages(entry['messages'])
+            if server is None or len(messages) == 0:
+                self._observations.forget(observation_id)
+                continue
+
+            observer = await observers.restore_observer(self._hub, observation_id, entry, messages)
+            if observer.snapshot is not None:
+                self._hub.seed(server.name, observer.snapshot)
+
+            remaining = config.settings().observe_timeout - (time.time() - observer.started_at)
+            self._jobs.submit(server.name, observer.kind, _resumed(observer), timeout=max(0, remaining))
+
+    # Fetch messages from their [channel_id, message_id] pairs, skipping any
+    # that have been deleted.
+    async def _fetch_messages(self, ids):
+        messages = []
+        for channel_id, message_id in ids:
+            channel = self.get_channel(channel_id)
+            if channel is None:
+                continue
+
+            try:
+                messages.append(await channel.fetch_message(message_id))
+            except discord.HTTPException:
+                continue
+
+        return messages
+
+    # How long the member has to wait to run the command. The owner and admins
+    # are never limited.
+    def _limit(self, command, member, guild):
+        if is_admin(member, guild):
+            return 0
+        return self._rate_limiter.check(command, member, guild)
+
+    # Reply to a command that's over the rate limit without calling EC2 or
+    # Macaw. Commands that show the server's state get the last known one if
+    # there is one, anything else is told to slow down once per wait.
+    async def _rate_limited(self, message, command, args, wait):
+        server = self._fleet.get(args[0]) if command.name in CACHED_COMMANDS else None
+
+        if server is not None:
+            state = self._hub.latest(server.name)
+            if state.instance is not None:
+                if command.name == 'status':
+                    embed = self._status_embed(server, state.instance)
+                elif command.name == 'players':
+                    embed = _players_embed(players_from_status(state.macaw))
+                else:
+                    embed = _dynmap_embed(server, state.instance.ip_address)
+
+                embed.set_footer(text='Rate limited, this may be out of date.')
+                await message.channel.send(embed=embed)
+                return
+
+        # Slash commands always need a response, the rest only need telling once.
+        now = time.monotonic()
+        slash_command = isinstance(message, interactions.InteractionContext)
+        if self._limited_until.get(message.author.id, 0) > now and not slash_command:
             return
 
-        commands = self._commands.keys()
-        for command_name in commands:
-            if can_run(command_name, message.author, message.guild):
-                await self._commands[command_name][0](message)
+        self._limited_until = {user: until for user, until in self._limited_until.items() if until > now}
+        self._limited_until[message.author.id] = now + wait
 
-    async def _cmd_start(self, message):
-        if message.content == '>start':
-            result = aws.start()
-            
-            if result[0]:
-                embed = discord.Embed(title='Starting...', color=0xd11f00, description='No public IP address yet...')
-                embed.add_field(name='EC2 Instance', value=':red_square: Stopped')
-                embed.add_field(name='Macaw Server', value=':red_square: Stopped')
-                embed.add_field(name='Minecraft Server', value=':red_square: Stopped')
+        embed = discord.Embed(title='Slow down', color=EmbedColours.FAIL,
+                              description='Try again in {:.0f} seconds.'.format(max(1, wait)))
+        await message.channel.send(embed=embed)
 
-                message = await message.channel.send(embed=embed)
+    async def _invalid_arguments(self, message, command, error):
+        embed = discord.Embed(title='Invalid arguments', color=EmbedColours.FAIL,
+                              description='{}\nUsage: {}'.format(error, command.help))
+        await message.channel.send(embed=embed)
 
-                observer = observers.StartObserver(aws, macaw, message)
-                await observer.dispatch()
-            else:
-                embed = discord.Embed(title='Cannot Start Instance!', color=0xd11f00, description=result[1])
-                await message.channel.send(embed=embed)
+    # Look up the server a command is aimed at, telling the user if it doesn't exist.
+    async def _get_server(self, message, target):
+        server = self._fleet.get(target)
 
-    async def _cmd_stop(self, message):
-        if message.content == '>stop':
-            # result = aws.stop()
-            result = macaw.shutdown()
-            
-            if result[0]:
-                embed = discord.Embed(title='Stopping...', color=0xd11f00)
-                embed.add_field(name='EC2 Instance', value=':green_square: Running')
-                embed.add_field(name='Macaw Server', value=':green_square: Running')
-                embed.add_field(name='Minecraft Server', value=':green_square: Running')
-
-                message = await message.channel.send(embed=embed)
-
-                observer = observers.StopObserver(aws, macaw, message)
-                await observer.dispatch()
-            else:
-                embed = discord.Embed(title='Cannot Stop Instance!', color=0xd11f00, description=result[1])
-                await message.channel.send(embed=embed)
+        if server is None:
+            embed = discord.Embed(title='Unknown server', color=EmbedColours.FAIL,
+                                  description='Servers: {}'.format(', '.join(self._fleet.names())))
+            await message.channel.send(embed=embed)
 
-    async def _cmd_status(self, message):
-        if message.content == '>status':
-            status = aws.get_status()
-            embed = discord.Embed(
-                title='Instance Status',
-                color=STATUS_COLOURS[status['state_code']]
-            )
-            embed.add_field(name='Instance ID', value=status['instance_id'], inline=False)
-            embed.add_field(name='Status', value=status['state_name'].title(), inline=False)
+        return server
 
-            if status['state_reason'] != '':
-                embed.add_field(name='Reason', value=status['state_reason'], inline=False)
+    # The name to show on embeds, which is only needed when there's more than one server.
+    def _display_name(self, server):
+        return server.name if len(self._fleet) > 1 else None
+
+    async def _cmd_start(self, message, target):
+        server = await self._get_server(message, target)
+        if server is None:
+            return
 
-            if status['ip_address'] is not None:
-                embed.add_field(name='Public IP Address', value=status['ip_address'], inline=False)
+        if self._prewarm is not None:
+            self._prewarm.record_start(server.name)
 
+        await self._submit(message, server, 'start')
+
+    # Start a server ahead of when it's usually wanted, replying to the notice about it.
+    async def _prewarm_start(self, server, notice):
+        await self._submit(notice, server, 'start')
+
+    async def _cmd_stop(self, message, target):
+        server = await self._get_server(message, target)
+        if server is None:
+            return
+
+        await self._submit(message, server, 'stop')
+
+    # Stop a server that nobody is on, replying to the warning about it.
+    async def _idle_stop(self, server, warning):
+        await self._submit(warning, server, 'stop')
+
+    async def _cmd_stay(self, message, target):
+        server = await self._get_server(message, target)
+        if server is None:
+            return
+
+        if not self._idle.watching(server.name):
+            embed = discord.Embed(title='Not stopping', color=EmbedColours.SUCCESS,
+                                  description='{} isn\'t stopped when it\'s idle.'.format(server.name))
+        elif await self._idle.postpone(server.name, 'Kept running by <@{}>.'.format(message.author.id)):
+            embed = discord.Embed(title='Staying', color=EmbedColours.SUCCESS,
+                                  description='{} will keep running for another {}.'.format(
+                                      server.name, format_duration(config.settings().idle_timeout)))
+        else:
+            embed = discord.Embed(title='Not stopping', color=EmbedColours.SUCCESS,
+                                  description='{} isn\'t about to stop.'.format(server.name))
+
+        await message.channel.send(embed=embed)
+
+    # Run a start or stop through the job scheduler, and tell the user if it
+    # was joined with one that's already happening or has to wait for one.
+    async def _submit(self, message, server, kind):
+        run, initial_embed = {
+            'start': (self._start, _starting_embed),
+            'stop': (self._stop, _stopping_embed)
+        }[kind]
+
+        while True:
+            state, job = self._jobs.submit(server.name, kind, lambda: run(message, server))
+            if state != JobState.merged or job.task is None:
+                break
+
+            # Follow the observation that's already running with a message of its own.
+            await job.observing.wait()
+            if job.observer is not None:
+                job.observer.attach(await message.channel.send(embed=initial_embed()))
+                return
+
+            # The other request didn't get anywhere, so try again for this one.
+
+        if state == JobState.queued:
+            running = self._jobs.running(server.name)
+            embed = discord.Embed(title='Queued', color=EmbedColours.SUCCESS,
+                                  description='The server will {} once it has finished {}.'.format(
+                                      kind, JOB_DESCRIPTIONS[running.kind] if running else 'its current job'))
+            await message.channel.send(embed=embed)
+        elif state == JobState.merged:
+            embed = discord.Embed(title='Already queued', color=EmbedColours.SUCCESS,
+                                  description='The server will {} once it has finished its current job.'.format(kind))
+            await message.channel.send(embed=embed)
+        elif state == JobState.busy:
+            embed = discord.Embed(title='Busy', color=EmbedColours.FAIL,
+                                  description='The server is already waiting to {}, try again later.'.format(job.kind))
+            await message.channel.send(embed=embed)
+        elif state == JobState.started and isinstance(message, interactions.InteractionContext):
+            # The job's first message is the slash command's response, so wait for it.
+            await job.observing.wait()
+
+    async def _start(self, message, server):
+        result = await server.aws.start()
+
+        if result[0]:
+            self._hub.wake(server.name)
+            message = await message.channel.send(embed=_starting_embed())
+            return observers.StartObserver(self._hub, server.name, message, self._display_name(server))
+        else:
+            embed = discord.Embed(title='Cannot Start Instance!', color=0xd11f00, description=result[1])
             await message.channel.send(embed=embed)
 
-    async def _cmd_issue(self, message):
-        if message.content.startswith('>issue'):
-            result = macaw.issue(message.content[7:])
+    async def _stop(self, message, server):
+        # result = await server.aws.stop()
+        result = await server.macaw.shutdown()
 
-            if result[0]:
-                embed = discord.Embed(title='Success', color=EmbedColours.SUCCESS, description=result[1])
-                await message.channel.send(embed=embed)
-            else:
-                embed = discord.Embed(title='Command not issued', color=EmbedColours.FAIL, description=result[1])
-                await message.channel.send(embed=embed)
+        if result[0]:
+            self._hub.wake(server.name)
+            message = await message.channel.send(embed=_stopping_embed())
+            return observers.StopObserver(self._hub, server.name, message, self._display_name(server))
+        else:
+            embed = discord.Embed(title='Cannot Stop Instance!', color=0xd11f00, description=result[1])
+            await message.channel.send(embed=embed)
 
-    async def _cmd_players(self, message):
-        if message.content == '>players':
-            result = macaw.get_online_players()
+    async def _cmd_status(self, message, target):
+        if target == 'all':
+            await self._status_all(message)
+            return
 
-            if result[0]:
-                embed = discord.Embed(title='Online Players', color=EmbedColours.SUCCESS, description=result[1])
-                await message.channel.send(embed=embed)
-            else:
-                embed = discord.Embed(title='Cannot get players', color=EmbedColours.FAIL, description=result[1])
-                await message.channel.send(embed=embed)
+        server = await self._get_server(message, target)
+        if server is None:
+            return
 
-    async def _cmd_dynmap(self, message):
-        if message.content == '>dynmap':
-            ip_address = aws.get_public_ip()
+        snapshot = await self._hub.instance(server.name)
+        await message.channel.send(embed=self._status_embed(server, snapshot))
 
-            if ip_address is not None:
-                embed = discord.Embed(title='Dynmap', color=EmbedColours.SUCCESS, description='{}:{}'.format(ip_address, settings.dynmap_port))
-                await message.channel.send(embed=embed)
+    def _status_embed(self, server, snapshot):
+        embed = discord.Embed(
+            title='Instance Status',
+            color=STATUS_COLOURS[snapshot.state_code]
+        )
+        embed.add_field(name='Instance ID', value=server.profile.instance, inline=False)
+        embed.add_field(name='Status', value=snapshot.state_name.title(), inline=False)
+
+        if snapshot.state_reason != '':
+            embed.add_field(name='Reason', value=snapshot.state_reason, inline=False)
+
+        if snapshot.ip_address is not None:
+            embed.add_field(name='Public IP Address', value=snapshot.ip_address, inline=False)
+
+        if len(self._fleet) > 1:
+            embed.set_footer(text=server.name)
+
+        return embed
+
+    async def _status_all(self, message):
+        statuses = await self._fleet.status_all()
+        embed = discord.Embed(title='Fleet Status', color=EmbedColours.SUCCESS)
+
+        for status in statuses:
+            if status.snapshot is None:
+                embed.add_field(name=status.server.name, value='Instance: Unknown (not found)', inline=False)
+                continue
+
+            general_state = observers.macaw_state_map[status.macaw_state]
+            lines = [
+                'Instance: {}'.format(status.snapshot.state_name.title()),
+                'Minecraft: {}'.format(observers.STATE_DISPLAY_NAMES[general_state])
+            ]
+
+            if status.snapshot.ip_address is not None:
+                lines.append('IP: {}'.format(status.snapshot.ip_address))
+
+            embed.add_field(name=status.server.name, value='\n'.join(lines), inline=False)
+
+        await message.channel.send(embed=embed)
+
+    async def _cmd_issue(self, message, target, commands):
+        server = await self._get_server(message, target)
+        if server is None:
+            return
+
+        await self._issue(message, server, commands)
+
+    async def _cmd_macro(self, message, target, name):
+        macros = config.settings().macros
+
+        if name == '':
+            description = '\n'.join('`{}`: {}'.format(name, text) for name, text in macros.items())
+            embed = discord.Embed(title='Macros', color=EmbedColours.SUCCESS,
+                                  description=description or 'There aren\'t any macros in the config.')
+            await message.channel.send(embed=embed)
+            return
+
+        # Macro names are case insensitive, like every key in the config.
+        text = macros.get(name.lower())
+        if text is None:
+            embed = discord.Embed(title='Unknown macro', color=EmbedColours.FAIL,
+                                  description='Macros: {}'.format(', '.join(macros.keys()) or 'none'))
+            await message.channel.send(embed=embed)
+            return
+
+        try:
+            commands = split_commands(text)
+        except CommandError as e:
+            embed = discord.Embed(title='Invalid macro', color=EmbedColours.FAIL, description=str(e))
+            await message.channel.send(embed=embed)
+            return
+
+        server = await self._get_server(message, target)
+        if server is None:
+            return
+
+        await self._issue(message, server, commands)
+
+    # Issue a batch of commands to a server and reply with the result of each one.
+    async def _issue(self, message, server, commands):
+        results = await server.macaw.issue_many(commands)
+
+        if len(results) == 1:
+            if results[0][0]:
+                embed = discord.Embed(title='Success', color=EmbedColours.SUCCESS, description=results[0][1])
             else:
-                embed = discord.Embed(title='Failed', color=EmbedColours.FAIL, description='Can\'t get the dynmap address if the instance isn\'t running!')
-                await message.channel.send(embed=embed)
+                embed = discord.Embed(title='Command not issued', color=EmbedColours.FAIL, description=results[0][1])
+        else:
+            issued = sum(1 for success, _ in results if success)
+            embed = discord.Embed(title='Issued {} of {} commands'.format(issued, len(results)),
+                                  color=EmbedColours.SUCCESS if issued == len(results) else EmbedColours.FAIL)
+
+            for command, (success, result) in zip(commands, results):
+                embed.add_field(name='/{}'.format(command)[:256], inline=False,
+                                value=':{}: {}'.format('white_check_mark' if success else 'x', result))
+
+        await message.channel.send(embed=embed)
+
+    async def _cmd_players(self, message, target):
+        server = await self._get_server(message, target)
+        if server is None:
+            return
+
+        result = players_from_status(await self._hub.macaw(server.name))
+        await message.channel.send(embed=_players_embed(result))
+
+    async def _cmd_dynmap(self, message, target):
+        server = await self._get_server(message, target)
+        if server is None:
+            return
+
+        ip_address = (await self._hub.instance(server.name)).ip_address
+        await message.channel.send(embed=_dynmap_embed(server, ip_address))
+
+    # Tell the user that a command needs presence tracking, if it's turned off.
+    async def _needs_presence(self, message) -> bool:
+        if self._presence is not None:
+            return True
+
+        embed = discord.Embed(title='Not available', color=EmbedColours.FAIL,
+                              description='Player tracking is turned off in the settings.')
+        await message.channel.send(embed=embed)
+        return False
+
+    async def _cmd_seen(self, message, player):
+        if not await self._needs_presence(message):
+            return
+
+        session = self._presence.store.last_session(player)
+        if session is None:
+            description = '{} has never been seen.'.format(player)
+        elif session.left is None:
+            description = '{} has been online for {}.'.format(
+                session.player, format_duration(time.time() - session.joined))
+        else:
+            description = '{} was last online {} ago.'.format(
+                session.player, format_duration(time.time() - session.left))
+
+        if session is not None and len(self._fleet) > 1:
+            description += '\nServer: {}'.format(session.server)
+
+        embed = discord.Embed(title='Last Seen', color=EmbedColours.SUCCESS, description=description)
+        await message.channel.send(embed=embed)
+
+    async def _cmd_playtime(self, message, player):
+        if not await self._needs_presence(message):
+            return
+
+        played = self._presence.store.playtime(since=time.time() - PLAYTIME_PERIOD, player=player)
+        if len(played) == 0:
+            description = 'No-one has played this week :(' if player is None else \
+                '{} hasn\'t played this week.'.format(player)
+        else:
+            description = '\n'.join('{}: {}'.format(name, format_duration(seconds)) for name, seconds in played)
+
+        embed = discord.Embed(title='Playtime This Week', color=EmbedColours.SUCCESS, description=description)
+        await message.channel.send(embed=embed)
 
     async def _cmd_help(self, message):
-        if message.content == '>help':
-            commands = allowed_commands(message.author, message.guild)
-            content = 'You don\'t have permission to use any commands'
-            
-            if len(commands) != 0:
-                lines = []
-                for command in commands:
-                    lines.append(self._commands[command][1])
-                content = '\n'.join(lines)
-
-            embed = discord.Embed(title='Commands', color=EmbedColours.SUCCESS, description=content)
+        commands = allowed_commands(message.author, message.guild)
+        content = 'You don\'t have permission to use any commands'
+        
+        if len(commands) != 0:
+            lines = []
+            for command in commands:
+                lines.append(self._commands.get(command).help)
+            content = '\n'.join(lines)
+
+        embed = discord.Embed(title='Commands', color=EmbedColours.SUCCESS, description=content)
+        await message.channel.send(embed=embed)
+
+
+    async def _cmd_reload(self, message):
+        try:
+            config.registry.reload()
+        except Exception as e:
+            embed = discord.Embed(title='Config not reloaded', color=EmbedColours.FAIL, description=str(e))
+            await message.channel.send(embed=embed)
+            return
+
+        embed = discord.Embed(title='Success', color=EmbedColours.SUCCESS, description='Config reloaded!')
+        await message.channel.send(embed=embed)
+
+
+    async def _cmd_dashboard(self, message, target):
+        if target == 'off':
+            if await self._dashboards.disable(message.channel):
+                embed = discord.Embed(title='Success', color=EmbedColours.SUCCESS, description='Dashboard removed.')
+            else:
+                embed = discord.Embed(title='Failed', color=EmbedColours.FAIL,
+                                      description='There isn\'t a dashboard in this channel.')
             await message.channel.send(embed=embed)
+            return
+
+        server = await self._get_server(message, target)
+        if server is None:
+            return
+
+        await self._dashboards.enable(message.channel, server.name)
+
+    async def _cmd_metrics(self, message):
+        embed = discord.Embed(title='Metrics', color=EmbedColours.SUCCESS)
+
+        sections = [
+            ('Commands', metrics.commands, metrics.command_latency, 'command'),
+            ('EC2 Calls', metrics.aws_calls, metrics.aws_latency, 'call'),
+            ('Macaw Requests', metrics.macaw_requests, metrics.macaw_latency, 'endpoint')
+        ]
+
+        for title, counter, histogram, label in sections:
+            lines = []
+            for labels in sorted(histogram.keys(), key=lambda labels: labels[label]):
+                failed = sum(counter.value(outcome=outcome, **labels) for outcome in ('error', 'timeout'))
+                lines.append('{}: {} ({} failed), avg {:.0f}ms, p95 <{:.0f}ms'.format(
+                    labels[label], histogram.count(**labels), int(failed),
+                    histogram.mean(**labels) * 1000, histogram.quantile(0.95, **labels) * 1000))
+
+            embed.add_field(name=title, value='\n'.join(lines) or 'None yet', inline=False)
+
+        edits = ', '.join('{} {}'.format(int(metrics.embed_edits.value(**labels)), labels['outcome'])
+                          for labels in metrics.embed_edits.keys())
+        embed.add_field(name='Embed Edits', inline=False, value='{}\nRate limited {} times, waited {:.1f}s'.format(
+            edits or 'None yet', int(metrics.embed_rate_limited.value()), metrics.embed_rate_limit_wait.value()))
+
+        embed.add_field(name='Observations', inline=False, value='{} running, {} finished'.format(
+            int(metrics.observations_running.value()),
+            int(sum(metrics.observations.value(**labels) for labels in metrics.observations.keys()))))
+
+        embed.add_field(name='Event Loop Lag', inline=False, value='avg {:.1f}ms, max {:.1f}ms'.format(
+            metrics.loop_lag.mean() * 1000, metrics.loop_lag_max.value() * 1000))
+
+        await message.channel.send(embed=embed)
 
 
-client = MacawBot()
-client.run(credentials.discord_bot_token)
\ No newline at end of file
+if __name__ == '__main__':
+    client = MacawBot(Fleet(config.aws(), settings))
+    client.run(config.credentials().discord_bot_token)
\ No newline at end of file
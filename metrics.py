@@ -0,0 +1,304 @@
+import asyncio
+import bisect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# Latency buckets, in seconds, for calls to EC2, Macaw and Discord.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Buckets for whole observations, which take minutes rather than milliseconds.
+OBSERVATION_BUCKETS = (5, 10, 30, 60, 120, 180, 300, 600, 900)
+
+# Buckets for event loop lag. Anything over 100ms is noticeable to users.
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+
+def _format_labels(labels: dict) -> str:
+    if len(labels) == 0:
+        return ''
+
+    pairs = ['{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+             for name, value in labels.items()]
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+#
+# A metric with a value per combination of labels. The labels must be given by
+# keyword every time the metric is changed. Metrics are updated from the AWS
+# worker threads as well as the event loop, so every update takes a lock.
+#
+class _Metric(ABC):
+    type = 'untyped'
+
+    def __init__(self, name: str, description: str, labels: tuple = ()):
+        self.name = name
+        self.description = description
+        self._label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self._label_names):
+            raise ValueError('{} takes the labels {}'.format(self.name, ', '.join(self._label_names)))
+        return tuple(str(labels[name]) for name in self._label_names)
+
+    def _labels(self, key: tuple) -> dict:
+        return dict(zip(self._label_names, key))
+
+    # Every set of label values that has been recorded.
+    def keys(self) -> list:
+        with self._lock:
+            return [self._labels(key) for key in self._values]
+
+    # Yield a (name, labels, value) tuple for every sample in the exposition.
+    @abstractmethod
+    def samples(self):
+        pass
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            for key, value in self._values.items():
+                yield self.name, self._labels(key), value
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, description, labels)
+        self._buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    # Values are stored as (bucket counts, sum, count).
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self._buckets), 0, 0)
+            counts[bisect.bisect_left(self._buckets, value)] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    # Time the body of the with statement.
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            values = self._values.get(self._key(labels))
+            return values[2] if values is not None else 0
+
+    def mean(self, **labels) -> float:
+        with self._lock:
+            values = self._values.get(self._key(labels))
+            return values[1] / values[2] if values is not None else 0
+
+    # Estimate a quantile as the upper bound of the bucket it falls in.
+    def quantile(self, q: float, **labels) -> float:
+        with self._lock:
+            values = self._values.get(self._key(labels))
+            if values is None:
+                return 0
+
+            counts, _, count = values
+            target = q * count
+            seen = 0
+            for bound, bucket_count in zip(self._buckets, counts):
+                seen += bucket_count
+                if seen >= target:
+                    return bound
+            return math.inf
+
+    def samples(self):
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self._buckets, counts):
+                    cumulative += bucket_count
+                    yield self.name + '_bucket', dict(labels, le=_format_value(bound)), cumulative
+                yield self.name + '_sum', labels, total
+                yield self.name + '_count', labels, count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    # Render every metric in the Prometheus text format.
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.description))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for name, labels, value in metric.samples():
+                lines.append('{}{} {}'.format(name, _format_labels(labels), _format_value(value)))
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+aws_calls = registry.register(Counter(
+    'macaw_bot_aws_calls_total', 'EC2 API calls made, by call and outcome.', ('call', 'outcome')))
+aws_latency = registry.register(Histogram(
+    'macaw_bot_aws_call_seconds', 'Time taken by EC2 API calls.', ('call',)))
+
+macaw_requests = registry.register(Counter(
+    'macaw_bot_macaw_requests_total', 'Requests made to Macaw servers, by endpoint and outcome.',
+    ('endpoint', 'outcome')))
+macaw_latency = registry.register(Histogram(
+    'macaw_bot_macaw_request_seconds', 'Time taken by requests to Macaw servers.', ('endpoint',)))
+
+commands = registry.register(Counter(
+    'macaw_bot_commands_total', 'Commands handled, by command and outcome.', ('command', 'outcome')))
+command_latency = registry.register(Histogram(
+    'macaw_bot_command_seconds', 'Time taken to handle commands.', ('command',)))
+
+observations = registry.register(Counter(
+    'macaw_bot_observations_total', 'Observations finished, by kind and outcome.', ('kind', 'outcome')))
+observation_duration = registry.register(Histogram(
+    'macaw_bot_observation_seconds', 'Time taken by observations.', ('kind',), buckets=OBSERVATION_BUCKETS))
+observations_running = registry.register(Gauge(
+    'macaw_bot_observations_running', 'Observations currently running.'))
+
+embed_edits = registry.register(Counter(
+    'macaw_bot_embed_edits_total', 'Live embed updates, by outcome.', ('outcome',)))
+embed_rate_limited = registry.register(Counter(
+    'macaw_bot_embed_rate_limited_total', 'Embed edits that had to wait for the channel rate limit.'))
+embed_rate_limit_wait = registry.register(Counter(
+    'macaw_bot_embed_rate_limit_wait_seconds_total', 'Time spent waiting for the channel rate limit.'))
+
+loop_lag = registry.register(Histogram(
+    'macaw_bot_event_loop_lag_seconds', 'How late the event loop ran a scheduled callback.', buckets=LAG_BUCKETS))
+loop_lag_max = registry.register(Gauge(
+    'macaw_bot_event_loop_lag_max_seconds', 'The longest event loop lag seen.'))
+
+
+# Count a call and time it, recording whether it succeeded, timed out or failed.
+@contextmanager
+def track(counter: Counter, histogram: Histogram, **labels):
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    except asyncio.TimeoutError:
+        outcome = 'timeout'
+        raise
+    except asyncio.CancelledError:
+        outcome = 'cancelled'
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+        counter.inc(outcome=outcome, **labels)
+
+
+#
+# Measures how late the event loop runs a callback that should run every
+# interval seconds, which is how long something held the loop up. The most
+# recent samples are kept for reporting as well as being recorded as metrics.
+#
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.5, keep: int = 10000):
+        self._interval = interval
+        self._task = None
+        self.samples = deque(maxlen=keep)
+        self.max = 0
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+
+            lag = max(0, loop.time() - expected)
+            self.samples.append(lag)
+            loop_lag.observe(lag)
+
+            if lag > self.max:
+                self.max = lag
+                loop_lag_max.set(lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+#
+# Serves the registry at /metrics, for Prometheus to scrape.
+#
+class MetricsServer:
+    def __init__(self, host: str = '127.0.0.1', port: int = 9100, metrics: Registry = registry):
+        self._host = host
+        self._port = port
+        self._registry = metrics
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get('/metrics', self._metrics)
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self._registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
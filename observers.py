@@ -1,12 +1,16 @@
+import asyncio
+import json
 import time
+import uuid
 
 import discord
 
 import config
-from aws_actions import InstanceState
-from macaw_actions import MacawState
-
-settings = config.SettingsConfig()
+from aws_actions import InstanceSnapshot, InstanceState
+from embeds import LiveEmbed
+from hub import ServerState
+import metrics
+from macaw_actions import MacawState, state_from_status
 
 
 class GeneralState:
@@ -45,21 +49,51 @@ STATE_EMOJIS = ['red_square', 'orange_square', 'green_square', 'orange_square',
 # The names for the states that will be used in the embeds.
 STATE_DISPLAY_NAMES = ['Stopped', 'Starting', 'Running', 'Stopping', 'Invalid State']
 
+STORE_FILE = 'observations.json'
+
+
+# What an observer is waiting for.
+class Phase:
+    instance = 'instance'
+    macaw = 'macaw'
+
 
 #
 # Observe the server starting up and edit an embed accordingly.
-# This class will block the bot from accepting commands until all servers have started.
+# The states come from a subscription to the StateHub, and the observer is run
+# through an ObservationScheduler so that the bot keeps handling commands meanwhile.
 #
 class StartObserver:
-    def __init__(self, aws_manager, macaw_manager, message):
-        self._aws_manager = aws_manager
-        self._macaw_manager = macaw_manager
-        self._message = message
-
-    # Edits the message in self._message to a new embed, constructed using the
-    # states of the various servers.
-    async def _setEmbed(self, instance_state: int, macaw_state: int, mc_state: int):
-        if instance_state == GeneralState.stopped and \
+    kind = 'start'
+
+    # The name of the server is shown in the embed if one is given.
+    def __init__(self, hub, server_name: str, message, name: str = None):
+        self._hub = hub
+        self._server_name = server_name
+        self._ip_address = None
+        self._embeds = [LiveEmbed(message)]
+        self._latest = None
+        self._name = name
+        self._states = (GeneralState.stopped, GeneralState.stopped, GeneralState.stopped)
+
+        self.id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.phase = Phase.instance
+        self.snapshot = None
+
+        # Called with the observer whenever its state changes, so it can be saved.
+        self.on_change = None
+
+    # Updates the live embed to a new embed, constructed using the states of
+    # the various servers.
+    async def _setEmbed(self, instance_state: int, macaw_state: int, mc_state: int, timed_out=False):
+        self._states = (instance_state, macaw_state, mc_state)
+
+        if timed_out:
+            # The servers didn't start in time, black embed.
+            colour = 0x000000
+            title = 'Start Timed Out'
+        elif instance_state == GeneralState.stopped and \
                 macaw_state == GeneralState.stopped and \
                 mc_state == GeneralState.stopped:
             # All processes are stopped, red embed.
@@ -83,7 +117,7 @@ class StartObserver:
             title = 'Starting...'
 
         if instance_state == GeneralState.running:
-            description = self._aws_manager.get_public_ip()
+            description = self._ip_address
         else:
             description = 'No public IP address yet...'
 
@@ -93,71 +127,116 @@ class StartObserver:
         embed.add_field(name='Macaw Server', value=':{}: {}'.format(STATE_EMOJIS[macaw_state], STATE_DISPLAY_NAMES[macaw_state]))
         embed.add_field(name='Minecraft Server', value=':{}: {}'.format(STATE_EMOJIS[mc_state], STATE_DISPLAY_NAMES[mc_state]))
 
-        # Update the message with the new embed.
-        await self._message.edit(embed=embed) 
+        if self._name is not None:
+            embed.set_footer(text=self._name)
+
+        # Queue the new embed, it's only sent if it has changed.
+        self._latest = embed
+        for live_embed in self._embeds:
+            live_embed.update(embed)
+
+        if self.on_change is not None:
+            self.on_change(self)
+
+    # The Macaw state while starting. The instance is running but the Macaw
+    # server hasn't been asked for its status yet if there isn't one.
+    def _macaw_state(self, state: ServerState) -> int:
+        if state.macaw is None:
+            return MacawState.macaw_starting
+        return state_from_status(state.macaw, starting=True)
+
+    async def _instance_changed(self, state: ServerState):
+        self._ip_address = state.instance.ip_address
+        self.snapshot = state.instance
+        await self._setEmbed(instance_state_map[state.instance.state_code], GeneralState.stopped, GeneralState.stopped)
+
+    async def _macaw_changed(self, state: ServerState):
+        macaw_state = self._macaw_state(state)
+        if macaw_state == MacawState.macaw_starting:
+            await self._setEmbed(GeneralState.running, macaw_state_map[macaw_state], GeneralState.stopped)
+        else:
+            await self._setEmbed(GeneralState.running, GeneralState.running, macaw_state_map[macaw_state])
 
-    # Blocks until the instance is in the 'running' state.
+    # Waits until the instance is in the 'running' state.
     # Updates the embed when the instance state changes.
-    async def _wait_for_instance(self):
-        prev_state = None
-        state = self._aws_manager.get_state()
-
-        await self._setEmbed(instance_state_map[state], GeneralState.stopped, GeneralState.stopped)
-
-        while state != InstanceState.running:
-            time.sleep(settings.check_delay)
-
-            if state != prev_state:
-                await self._setEmbed(instance_state_map[state], GeneralState.stopped, GeneralState.stopped)
-
-            prev_state = state
-            state = self._aws_manager.get_state()
-        
-        await self._setEmbed(instance_state_map[state], GeneralState.stopped, GeneralState.stopped)
+    async def _wait_for_instance(self, watch):
+        await watch.wait_for(lambda state: state.instance.state_code == InstanceState.running,
+                             self._instance_changed)
 
-    # Blocks until the Minecraft and Macaw servers are in the 'running' state.
+    # Waits until the Minecraft and Macaw servers are in the 'running' state.
     # Updates the embed when the server state changes.
-    async def _wait_for_macaw(self):
-        prev_state = None
-        state = self._macaw_manager.get_state()
+    async def _wait_for_macaw(self, watch):
+        await watch.wait_for(lambda state: self._macaw_state(state) == MacawState.running, self._macaw_changed)
 
-        while state != MacawState.running:
-            if state != prev_state:
-                if state == MacawState.macaw_starting:
-                    await self._setEmbed(GeneralState.running, macaw_state_map[state], GeneralState.stopped)
-                else:
-                    await self._setEmbed(GeneralState.running, GeneralState.running, macaw_state_map[state])
+    # Start observing server states.
+    async def dispatch(self):
+        watch = self._hub.subscribe(self._server_name)
+        try:
+            # A resumed observation carries on from the phase it was in.
+            if self.phase == Phase.instance:
+                await self._wait_for_instance(watch)
+                self.phase = Phase.macaw
+            await self._wait_for_macaw(watch)
+        finally:
+            watch.close()
 
-            time.sleep(settings.check_delay)
+        await self._flush()
 
-            prev_state = state
-            state = self._macaw_manager.get_state()
+    # Keep another message up to date with the observation as well, for
+    # someone who asked for the same thing while it was already happening.
+    def attach(self, message):
+        live_embed = LiveEmbed(message)
+        if self._latest is not None:
+            live_embed.update(self._latest)
+        self._embeds.append(live_embed)
 
-        if state == MacawState.macaw_starting:
-            await self._setEmbed(GeneralState.running, macaw_state_map[state], GeneralState.stopped)
-        else:
-            await self._setEmbed(GeneralState.running, GeneralState.running, macaw_state_map[state])
+        if self.on_change is not None:
+            self.on_change(self)
 
-    # Start observing server states.
-    async def dispatch(self):
-        await self._wait_for_instance()
-        await self._wait_for_macaw()
+    async def _flush(self):
+        await asyncio.gather(*(live_embed.flush() for live_embed in self._embeds))
+
+    # Called by the scheduler when the observation takes too long.
+    async def timed_out(self):
+        await self._setEmbed(*self._states, timed_out=True)
+        await self._flush()
 
 
 #
 # Observe the servers shutting down and edit an embed accordingly.
-# This class will block the bot from accepting commands until all servers have stopped.
+# The states come from a subscription to the StateHub, and the observer is run
+# through an ObservationScheduler so that the bot keeps handling commands meanwhile.
 #
 class StopObserver:
-    def __init__(self, aws_manager, macaw_manager, message):
-        self._aws_manager = aws_manager
-        self._macaw_manager = macaw_manager
-        self._message = message
-
-    # Edits the message in self._message to a new embed, constructed using the
-    # states of the various servers.
-    async def _set_embed(self, instance_state: int, macaw_state: int, mc_state: int):
-        if instance_state == GeneralState.stopped and \
+    kind = 'stop'
+
+    # The name of the server is shown in the embed if one is given.
+    def __init__(self, hub, server_name: str, message, name: str = None):
+        self._hub = hub
+        self._server_name = server_name
+        self._embeds = [LiveEmbed(message)]
+        self._latest = None
+        self._name = name
+        self._states = (GeneralState.running, GeneralState.running, GeneralState.running)
+
+        self.id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.phase = Phase.macaw
+        self.snapshot = None
+
+        # Called with the observer whenever its state changes, so it can be saved.
+        self.on_change = None
+
+    # Updates the live embed to a new embed, constructed using the states of
+    # the various servers.
+    async def _set_embed(self, instance_state: int, macaw_state: int, mc_state: int, timed_out=False):
+        self._states = (instance_state, macaw_state, mc_state)
+
+        if timed_out:
+            # The servers didn't stop in time, black embed.
+            colour = 0x000000
+            title = 'Stop Timed Out'
+        elif instance_state == GeneralState.stopped and \
                 macaw_state == GeneralState.stopped and \
                 mc_state == GeneralState.stopped:
             # All processes are stopped, red embed.
@@ -190,61 +269,251 @@ class StopObserver:
         embed.add_field(name='Minecraft Server',
                         value=':{}: {}'.format(STATE_EMOJIS[mc_state], STATE_DISPLAY_NAMES[mc_state]))
 
-        # Update the message with the new embed.
-        await self._message.edit(embed=embed)
+        if self._name is not None:
+            embed.set_footer(text=self._name)
 
-    # Blocks until the instance is in the 'running' state.
-    # Updates the embed when the instance state changes.
-    async def _wait_for_instance(self):
-        prev_state = None
-        state = self._aws_manager.get_state()
+        # Queue the new embed, it's only sent if it has changed.
+        self._latest = embed
+        for live_embed in self._embeds:
+            live_embed.update(embed)
 
-        await self._set_embed(instance_state_map[state], GeneralState.stopped, GeneralState.stopped)
+        if self.on_change is not None:
+            self.on_change(self)
 
-        while state != InstanceState.stopped:
-            time.sleep(settings.check_delay)
+    # The Macaw state while stopping. The Macaw server has gone with the
+    # instance if there isn't a status.
+    def _macaw_state(self, state: ServerState) -> int:
+        if state.macaw is None:
+            return MacawState.macaw_stopped
+        return state_from_status(state.macaw, starting=False)
 
-            if state != prev_state:
-                await self._set_embed(instance_state_map[state], GeneralState.stopped, GeneralState.stopped)
+    async def _instance_changed(self, state: ServerState):
+        self.snapshot = state.instance
+        instance_state = instance_state_map[state.instance.state_code]
+        await self._set_embed(instance_state, GeneralState.stopped, GeneralState.stopped)
 
-            if instance_state_map[state] == GeneralState.invalid:
-                raise Exception('Invalid state!')
+        if instance_state == GeneralState.invalid:
+            raise Exception('Invalid state!')
 
-            prev_state = state
-            state = self._aws_manager.get_state()
+    async def _macaw_changed(self, state: ServerState):
+        macaw_state = self._macaw_state(state)
+        if macaw_state == MacawState.macaw_stopping or macaw_state == MacawState.macaw_stopped:
+            await self._set_embed(GeneralState.running, macaw_state_map[macaw_state], GeneralState.stopped)
+        else:
+            await self._set_embed(GeneralState.running, GeneralState.running, macaw_state_map[macaw_state])
+
+        if macaw_state_map[macaw_state] == GeneralState.invalid:
+            raise Exception('Invalid state!')
 
-        await self._set_embed(instance_state_map[state], GeneralState.stopped, GeneralState.stopped)
+    # Waits until the instance is in the 'stopped' state.
+    # Updates the embed when the instance state changes.
+    async def _wait_for_instance(self, watch):
+        await watch.wait_for(lambda state: state.instance.state_code == InstanceState.stopped,
+                             self._instance_changed)
 
-    # Blocks until the Minecraft and Macaw servers are in the 'running' state.
+    # Waits until the Minecraft and Macaw servers have stopped.
     # Updates the embed when the server state changes.
-    async def _wait_for_macaw(self):
-        prev_state = None
-        state = self._macaw_manager.get_state(starting=False)
+    async def _wait_for_macaw(self, watch):
+        await watch.wait_for(lambda state: self._macaw_state(state) == MacawState.macaw_stopped,
+                             self._macaw_changed)
 
-        while state != MacawState.macaw_stopped:
-            if state != prev_state:
-                if state == MacawState.macaw_stopping or state == MacawState.macaw_stopped:
-                    await self._set_embed(GeneralState.running, macaw_state_map[state], GeneralState.stopped)
-                else:
-                    await self._set_embed(GeneralState.running, GeneralState.running, macaw_state_map[state])
+    # Start observing server states.
+    async def dispatch(self):
+        watch = self._hub.subscribe(self._server_name)
+        try:
+            # A resumed observation carries on from the phase it was in.
+            if self.phase == Phase.macaw:
+                await self._wait_for_macaw(watch)
+                self.phase = Phase.instance
+            await self._wait_for_instance(watch)
+        except Exception:
+            pass
+        finally:
+            watch.close()
+
+        await self._flush()
+
+    # Keep another message up to date with the observation as well, for
+    # someone who asked for the same thing while it was already happening.
+    def attach(self, message):
+        live_embed = LiveEmbed(message)
+        if self._latest is not None:
+            live_embed.update(self._latest)
+        self._embeds.append(live_embed)
+
+        if self.on_change is not None:
+            self.on_change(self)
+
+    async def _flush(self):
+        await asyncio.gather(*(live_embed.flush() for live_embed in self._embeds))
+
+    # Called by the scheduler when the observation takes too long.
+    async def timed_out(self):
+        await self._set_embed(*self._states, timed_out=True)
+        await self._flush()
+
+
+OBSERVER_TYPES = {
+    StartObserver.kind: StartObserver,
+    StopObserver.kind: StopObserver
+}
 
-            if macaw_state_map[state] == GeneralState.invalid:
-                raise Exception('Invalid state!')
 
-            time.sleep(settings.check_delay)
+# Describe an observation as JSON, so that it can be picked up again after a
+# restart. Messages that can't be fetched again, like slash command
+# responses, are left out.
+def observation_entry(observer) -> dict:
+    snapshot = observer.snapshot
+    if snapshot is not None:
+        # Snapshots are timed with the monotonic clock, which doesn't carry
+        # across restarts, so store when they were taken in wall clock time.
+        snapshot = {
+            'state_code': snapshot.state_code,
+            'state_name': snapshot.state_name,
+            'state_reason': snapshot.state_reason,
+            'ip_address': snapshot.ip_address,
+            'taken_at': time.time() - (time.monotonic() - snapshot.taken_at)
+        }
+
+    return {
+        'kind': observer.kind,
+        'server': observer._server_name,
+        'name': observer._name,
+        'messages': [[live_embed.message.channel.id, live_embed.message.id] for live_embed in observer._embeds
+                     if isinstance(live_embed.message.id, int)],
+        'started_at': observer.started_at,
+        'phase': observer.phase,
+        'states': list(observer._states),
+        'snapshot': snapshot
+    }
+
+
+# Rebuild an observer from its entry, editing the given messages. Its embed is
+# shown as it was last seen straight away.
+async def restore_observer(hub, observation_id: str, entry: dict, messages: list):
+    observer = OBSERVER_TYPES[entry['kind']](hub, entry['server'], messages[0], entry['name'])
+    for message in messages[1:]:
+        observer.attach(message)
+
+    observer.id = observation_id
+    observer.started_at = entry['started_at']
+    observer.phase = entry['phase']
+
+    snapshot = entry['snapshot']
+    if snapshot is not None:
+        observer.snapshot = InstanceSnapshot(
+            state_code=snapshot['state_code'],
+            state_name=snapshot['state_name'],
+            state_reason=snapshot['state_reason'],
+            ip_address=snapshot['ip_address'],
+            taken_at=time.monotonic() - max(0, time.time() - snapshot['taken_at'])
+        )
+        if isinstance(observer, StartObserver):
+            observer._ip_address = snapshot['ip_address']
+
+    if isinstance(observer, StartObserver):
+        await observer._setEmbed(*entry['states'])
+    else:
+        await observer._set_embed(*entry['states'])
+    return observer
 
-            prev_state = state
-            state = self._macaw_manager.get_state(starting=False)
 
-        if state == MacawState.macaw_stopping or state == MacawState.macaw_stopped:
-            await self._set_embed(GeneralState.running, macaw_state_map[state], GeneralState.stopped)
-        else:
-            await self._set_embed(GeneralState.running, GeneralState.running, macaw_state_map[state])
+#
+# Remembers the observations that are running, so that they can carry on
+# after the bot restarts or crashes.
+#
+class ObservationStore:
+    def __init__(self, path: str = None):
+        self._path = path or config.data_path(STORE_FILE)
 
-    # Start observing server states.
-    async def dispatch(self):
+    # Get the stored observations, as {observation_id: entry}.
+    def load(self) -> dict:
+        try:
+            with open(self._path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, observations: dict):
+        config.write_json(self._path, observations)
+
+
+#
+# Runs observers as background tasks, so that several observations can happen
+# at once without holding up on_message. Observations that run for longer than
+# the timeout are cancelled.
+#
+# With a store, every running observation is saved whenever it changes, and
+# is only forgotten once it has finished. Ones that were cancelled by the bot
+# closing, or never finished because it crashed, are left in the store to be
+# resumed.
+#
+class ObservationScheduler:
+    def __init__(self, timeout: float = None, store: ObservationStore = None):
+        self._timeout = timeout
+        self._tasks = set()
+        self._store = store
+        self._entries = store.load() if store is not None else {}
+
+    # The observations left over from before the bot restarted, as
+    # {observation_id: entry}.
+    def unfinished(self) -> dict:
+        return dict(self._entries)
+
+    # Drop a stored observation without resuming it.
+    def forget(self, observation_id: str):
+        if self._entries.pop(observation_id, None) is not None:
+            self._store.save(self._entries)
+
+    def _save(self, observer):
+        self._entries[observer.id] = observation_entry(observer)
+        self._store.save(self._entries)
+
+    # Start an observer in the background and return its task. The timeout
+    # defaults to the one given to the scheduler.
+    def schedule(self, observer, timeout: float = None) -> asyncio.Task:
+        if timeout is None:
+            timeout = self._timeout
+
+        if self._store is not None:
+            observer.on_change = self._save
+            self._save(observer)
+
+        task = asyncio.ensure_future(self._run(observer, timeout))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, observer, timeout: float):
+        start = time.monotonic()
+        outcome = 'error'
+        metrics.observations_running.inc()
         try:
-            await self._wait_for_macaw()
-            await self._wait_for_instance()
-        except:
-            return
+            await asyncio.wait_for(observer.dispatch(), timeout=timeout)
+            outcome = 'done'
+        except asyncio.TimeoutError:
+            outcome = 'timed_out'
+            await observer.timed_out()
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            raise
+        finally:
+            metrics.observations_running.dec()
+            metrics.observations.inc(kind=observer.kind, outcome=outcome)
+            metrics.observation_duration.observe(time.monotonic() - start, kind=observer.kind)
+
+            if outcome != 'cancelled':
+                observer.on_change = None
+                self.forget(observer.id)
+
+    # Wait for every running observation to finish.
+    async def join(self):
+        await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    # Cancel every running observation and wait for them to finish.
+    async def close(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
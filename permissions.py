@@ -1,7 +1,5 @@
 import config
 
-settings = config.SettingsConfig()
-
 
 class Action:
     STOP = 0
@@ -10,6 +8,9 @@ class Action:
     ISSUE = 3
     VIEW_PLAYERS = 4
     DYNMAP = 5
+    RELOAD = 6
+    DASHBOARD = 7
+    METRICS = 8
 
 
 permissions = {
@@ -22,7 +23,10 @@ permissions = {
         Action.STATUS,
         Action.ISSUE,
         Action.VIEW_PLAYERS,
-        Action.DYNMAP
+        Action.DYNMAP,
+        Action.RELOAD,
+        Action.DASHBOARD,
+        Action.METRICS
     ],
     'trusted': [
         Action.START,
@@ -36,60 +40,151 @@ command_requirements = {
     'help': [],
     'start': [Action.START],
     'stop': [Action.STOP],
+    'stay': [Action.START],
     'status': [Action.STATUS],
     'issue': [Action.ISSUE],
+    'macro': [Action.ISSUE],
     'players': [Action.VIEW_PLAYERS],
-    'dynmap': [Action.DYNMAP]
+    'seen': [Action.VIEW_PLAYERS],
+    'playtime': [Action.VIEW_PLAYERS],
+    'dynmap': [Action.DYNMAP],
+    'reload': [Action.RELOAD],
+    'dashboard': [Action.DASHBOARD],
+    'metrics': [Action.METRICS]
 }
 
-def get_actions(member, guild):
-    roles = settings.roles.items()
-    member_actions = set()
 
-    for (role_identifier, role_name) in roles:
+# Convert a list of actions into a bitmask with one bit per action.
+def to_mask(actions) -> int:
+    mask = 0
+    for action in actions:
+        mask |= 1 << action
+    return mask
+
+
+# Convert a bitmask back into a set of actions.
+def from_mask(mask: int) -> set:
+    return {action for action in range(mask.bit_length()) if mask & (1 << action)}
+
+
+role_masks = {identifier: to_mask(actions) for identifier, actions in permissions.items()}
+command_masks = {command: to_mask(actions) for command, actions in command_requirements.items()}
+
+
+#
+# Index from role IDs to the actions they allow, built once per guild, plus an
+# optional cache of each member's effective actions. Both are kept as
+# bitmasks, so checking a permission is a single bit test.
+#
+# The bot rebuilds a guild's index when its roles change, and invalidates
+# cached members when they're updated.
+#
+class PermissionIndex:
+    def __init__(self, cache_members: bool = False):
+        self.cache_members = cache_members
+        self._roles = {}
+        self._members = {}
+
+    # Map each of the guild's roles to the actions its configured name allows.
+    def rebuild_guild(self, guild):
+        name_masks = {}
+        for identifier, role_name in config.settings().roles.items():
+            name_masks[role_name] = name_masks.get(role_name, 0) | role_masks[identifier]
+
+        index = {}
+        for role in guild.roles:
+            mask = name_masks.get(role.name, 0)
+            if mask != 0:
+                index[role.id] = mask
+
+        self._roles[guild.id] = index
+        self._members.pop(guild.id, None)
+
+    def clear(self):
+        self._roles.clear()
+        self._members.clear()
 
-        match = list(filter(lambda i: i.name == role_name, guild.roles))
+    def forget_guild(self, guild):
+        self._roles.pop(guild.id, None)
+        self._members.pop(guild.id, None)
 
-        if len(match) == 0:
-            continue
+    def invalidate_member(self, member):
+        guild_members = self._members.get(member.guild.id)
+        if guild_members is not None:
+            guild_members.pop(member.id, None)
 
-        role = match[0]
+    # Get the bitmask of actions allowed by a set of role IDs in a guild.
+    def roles_mask(self, guild, role_ids) -> int:
+        index = self._roles.get(guild.id)
+        if index is None:
+            self.rebuild_guild(guild)
+            index = self._roles[guild.id]
 
-        if role in member.roles:
-            member_actions = member_actions.union(set(permissions[role_identifier]))
+        mask = 0
+        for role_id in role_ids:
+            mask |= index.get(role_id, 0)
+        return mask
 
-    return member_actions
+    # Get the bitmask of actions the member can perform in the guild.
+    def member_mask(self, member, guild) -> int:
+        if guild is None:
+            return 0
+
+        mask = self._members.get(guild.id, {}).get(member.id)
+
+        if mask is None:
+            # Looking up the roles may rebuild the guild's index, which drops
+            # its cached members, so the cache is only fetched afterwards.
+            mask = self.roles_mask(guild, (role.id for role in getattr(member, 'roles', ())))
+            if self.cache_members:
+                self._members.setdefault(guild.id, {})[member.id] = mask
+
+        return mask
+
+
+index = PermissionIndex()
+
+
+def get_actions(member, guild):
+    return from_mask(index.member_mask(member, guild))
 
 def can_perform(action, member, guild):
-    if member.id == settings.owner:
+    if member.id == config.settings().owner:
         return True
 
-    if action in get_actions(member, guild):
+    if index.member_mask(member, guild) & (1 << action):
         return True
 
     return False
 
 def can_run(command, member, guild):
-    if member.id == settings.owner:
+    if member.id == config.settings().owner:
         return True
-        
-    member_actions = get_actions(member, guild)
 
-    if len(set(command_requirements[command]).difference(member_actions)) == 0:
+    required = command_masks[command]
+
+    if index.member_mask(member, guild) & required == required:
         return True
 
     return False
 
+# Whether the member is the owner or has every action the admin role allows.
+def is_admin(member, guild):
+    if member.id == config.settings().owner:
+        return True
+
+    admin_mask = role_masks['admin']
+    return index.member_mask(member, guild) & admin_mask == admin_mask
+
 def allowed_commands(member, guild):
-    if member.id == settings.owner:
+    if member.id == config.settings().owner:
         return command_requirements.keys()
 
     permitted = []
-    member_actions = get_actions(member, guild)
+    member_mask = index.member_mask(member, guild)
 
-    requirements_items = command_requirements.items()
-    for command, requirements in requirements_items:
-        if len(set(requirements).difference(member_actions)) == 0:
+    for command, required in command_masks.items():
+        if member_mask & required == required:
             permitted.append(command)
 
-    return permitted
\ No newline at end of file
+    return permitted
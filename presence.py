@@ -0,0 +1,199 @@
+import asyncio
+import sqlite3
+import time
+from typing import NamedTuple, Optional
+
+import discord
+
+import config
+from embeds import ChannelRateLimiter, EmbedColours, edit_limiter
+from hub import ServerState, cancel_tasks, follow
+from macaw_actions import valid_status
+
+STORE_FILE = 'presence.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    server TEXT NOT NULL,
+    player TEXT NOT NULL COLLATE NOCASE,
+    joined REAL NOT NULL,
+    left REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_player ON sessions (player, joined);
+CREATE INDEX IF NOT EXISTS sessions_open ON sessions (server, left);
+'''
+
+
+#
+# A player's time on a server. left is None while they're still online.
+#
+class Session(NamedTuple):
+    server: str
+    player: str
+    joined: float
+    left: Optional[float]
+
+
+#
+# Every play session on every server, kept in SQLite so that player queries
+# are answered locally rather than by asking the Macaw servers.
+#
+class PresenceStore:
+    def __init__(self, path: str = None):
+        self._connection = sqlite3.connect(path or config.data_path(STORE_FILE))
+        self._connection.executescript(SCHEMA)
+
+    def join(self, server: str, players: list, at: float):
+        with self._connection:
+            self._connection.executemany(
+                'INSERT INTO sessions (server, player, joined) VALUES (?, ?, ?)',
+                [(server, player, at) for player in players])
+
+    def leave(self, server: str, players: list, at: float):
+        with self._connection:
+            self._connection.executemany(
+                'UPDATE sessions SET left = ? WHERE server = ? AND player = ? AND left IS NULL',
+                [(at, server, player) for player in players])
+
+    # The players with a session open on the server.
+    def online(self, server: str) -> list:
+        rows = self._connection.execute(
+            'SELECT player FROM sessions WHERE server = ? AND left IS NULL ORDER BY joined', (server,))
+        return [row[0] for row in rows]
+
+    # The player's latest session on any server, or None if they've never played.
+    def last_session(self, player: str) -> Optional[Session]:
+        row = self._connection.execute(
+            'SELECT server, player, joined, left FROM sessions WHERE player = ? '
+            'ORDER BY left IS NOT NULL, COALESCE(left, joined) DESC LIMIT 1', (player,)).fetchone()
+        return Session(*row) if row is not None else None
+
+    # Seconds played by each player since the given time, longest first, as
+    # (player, seconds) tuples. Open sessions count up to now.
+    def playtime(self, since: float = 0, player: str = None, limit: int = 10) -> list:
+        now = time.time()
+        query = 'SELECT player, SUM(COALESCE(left, ?) - MAX(joined, ?)) AS played FROM sessions ' \
+                'WHERE COALESCE(left, ?) > ?'
+        params = [now, since, now, since]
+
+        if player is not None:
+            query += ' AND player = ?'
+            params.append(player)
+
+        query += ' GROUP BY player ORDER BY played DESC LIMIT ?'
+        params.append(limit)
+
+        return [(row[0], row[1]) for row in self._connection.execute(query, params)]
+
+    def close(self):
+        self._connection.close()
+
+
+# Format a number of seconds like `2h 5m`.
+def format_duration(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return 'less than a minute'
+
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+
+    parts = []
+    if days > 0:
+        parts.append('{}d'.format(days))
+    if hours > 0:
+        parts.append('{}h'.format(hours))
+    if minutes > 0 and days == 0:
+        parts.append('{}m'.format(minutes))
+    return ' '.join(parts)
+
+
+#
+# Follows the player lists in the StateHub's /status results and records who
+# joins and leaves each server. Joins and leaves are posted to the server's
+# presence channel, if it has one.
+#
+class PresenceTracker:
+    def __init__(self, client: discord.Client, hub, fleet, store: PresenceStore = None,
+                 limiter: ChannelRateLimiter = edit_limiter):
+        self._client = client
+        self._hub = hub
+        self._fleet = fleet
+        self._store = store or PresenceStore()
+        self._limiter = limiter
+        self._online = {}
+        self._tasks = []
+
+    @property
+    def store(self) -> PresenceStore:
+        return self._store
+
+    # Whether the server's players are known from tracking, rather than only
+    # from sessions left over from before the bot started.
+    def tracking(self, name: str) -> bool:
+        return name in self._online
+
+    def start(self):
+        for server in self._fleet:
+            self._tasks.append(asyncio.ensure_future(self._run(server.name)))
+
+    async def _run(self, name: str):
+        await follow(self._hub, name, lambda state: self._update(name, state))
+
+    async def _update(self, name: str, state: ServerState):
+        status = state.macaw
+        if status is None:
+            # The instance isn't running, so no-one can be online.
+            players = set()
+        elif not valid_status(status):
+            # Nothing is known about the players, keep the last list.
+            return
+        else:
+            players = set(status.json['players'])
+
+        # Start from the sessions in the store, so that sessions from before a
+        # restart carry on if the player is still online.
+        previous = self._online.get(name)
+        if previous is None:
+            previous = set(self._store.online(name))
+
+        joined = sorted(players - previous)
+        left = sorted(previous - players)
+        self._online[name] = players
+
+        now = time.time()
+        if len(joined) > 0:
+            self._store.join(name, joined, now)
+        if len(left) > 0:
+            self._store.leave(name, left, now)
+
+        if len(joined) > 0 or len(left) > 0:
+            await self._announce(name, joined, left)
+
+    async def _announce(self, name: str, joined: list, left: list):
+        channel_id = self._fleet.get(name).profile.presence_channel
+        if channel_id is None:
+            return
+
+        channel = self._client.get_channel(channel_id)
+        if channel is None:
+            return
+
+        lines = [':inbox_tray: {} joined'.format(player) for player in joined] + \
+                [':outbox_tray: {} left'.format(player) for player in left]
+
+        embed = discord.Embed(color=EmbedColours.SUCCESS, description='\n'.join(lines)[:2048])
+        if len(self._fleet) > 1:
+            embed.set_footer(text=name)
+
+        await self._limiter.wait(channel.id)
+        try:
+            await channel.send(embed=embed)
+        except discord.HTTPException as e:
+            print('Failed to announce players: {}'.format(e))
+
+    async def close(self):
+        await cancel_tasks(self._tasks)
+        self._tasks = []
+        self._store.close()
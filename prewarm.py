@@ -0,0 +1,210 @@
+import asyncio
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+import discord
+
+import config
+from aws_actions import InstanceState
+from embeds import ChannelRateLimiter, EmbedColours, edit_limiter
+from hub import ServerState, cancel_tasks
+from macaw_actions import valid_status
+
+STORE_FILE = 'usage.db'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS activity (
+    id INTEGER PRIMARY KEY,
+    server TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS activity_server ON activity (server, at);
+'''
+
+WEEK = 7 * 24 * 60 * 60
+
+# How often, in seconds, the player counts are looked at. Players are only
+# recorded once an hour, but looking more often catches shorter sessions.
+PLAYERS_CHECK_INTERVAL = 5 * 60
+
+
+# The kinds of activity that show a server is wanted.
+class Activity:
+    # Someone asked for the server to start.
+    start = 'start'
+    # Players were online, recorded at most once an hour.
+    players = 'players'
+
+
+#
+# When each server has been wanted, kept in SQLite so that the usage profile
+# survives restarts.
+#
+class UsageStore:
+    def __init__(self, path: str = None):
+        self._connection = sqlite3.connect(path or config.data_path(STORE_FILE))
+        self._connection.executescript(SCHEMA)
+
+    def record(self, server: str, kind: str, at: float):
+        with self._connection:
+            self._connection.execute('INSERT INTO activity (server, kind, at) VALUES (?, ?, ?)', (server, kind, at))
+
+    # The times the server was wanted since the given time, of any kind.
+    def times(self, server: str, since: float) -> list:
+        rows = self._connection.execute('SELECT at FROM activity WHERE server = ? AND at >= ?', (server, since))
+        return [row[0] for row in rows]
+
+    # Forget activity from before the given time.
+    def prune(self, before: float):
+        with self._connection:
+            self._connection.execute('DELETE FROM activity WHERE at < ?', (before,))
+
+    def close(self):
+        self._connection.close()
+
+
+# The fraction of the last weeks in which the server was wanted in each
+# (weekday, hour) slot of local time, with Monday as 0. Slots that were never
+# used are left out.
+def usage_profile(times: list, now: float, weeks: int) -> dict:
+    slot_weeks = {}
+    for at in times:
+        local = datetime.fromtimestamp(at)
+        slot_weeks.setdefault((local.weekday(), local.hour), set()).add(int((now - at) // WEEK))
+
+    return {slot: len(used) / weeks for slot, used in slot_weeks.items()}
+
+
+# The slot of a local time.
+def slot_of(moment: datetime) -> tuple:
+    return moment.weekday(), moment.hour
+
+
+#
+# Starts stopped servers shortly before the times they're usually wanted, so
+# they're playable by the time people turn up.
+#
+# Every start command is recorded, and so is every hour in which players were
+# online when the latest state was looked at, every PLAYERS_CHECK_INTERVAL
+# seconds. The usage profile of the last few weeks is worked out from them. A
+# server is started prewarm_lead seconds before an hour that was busy in at
+# least prewarm_threshold of those weeks, if the hour before it wasn't. Only servers
+# that are stopped when idle are started, so a start that nobody turns up for
+# is stopped again by the idle shutdown.
+#
+class Prewarmer:
+    # start is a coroutine function taking the server and a notice posted to
+    # its idle channel, which runs the usual start path and replies to it.
+    def __init__(self, client: discord.Client, hub, fleet, idle, start: Callable[..., Awaitable],
+                 store: UsageStore = None, limiter: ChannelRateLimiter = edit_limiter):
+        self._client = client
+        self._hub = hub
+        self._fleet = fleet
+        self._idle = idle
+        self._start = start
+        self._store = store or UsageStore()
+        self._limiter = limiter
+        self._recorded_hours = {}
+        self._tasks = []
+
+    @property
+    def store(self) -> UsageStore:
+        return self._store
+
+    # The servers that can be started ahead of time, which are the ones that
+    # will be stopped again if they're left idle.
+    def _servers(self) -> list:
+        if config.settings().idle_timeout <= 0:
+            return []
+        return [server.name for server in self._fleet if self._idle.watching(server.name)]
+
+    def start(self):
+        self._tasks.append(asyncio.ensure_future(self._record_players()))
+        self._tasks.append(asyncio.ensure_future(self._run()))
+
+    def record_start(self, name: str):
+        self._store.record(name, Activity.start, time.time())
+
+    # The state only changes when the players do, so the latest state is
+    # looked at on a timer rather than waiting for changes.
+    async def _record_players(self):
+        while True:
+            for server in self._fleet:
+                # The idle shutdown keeps its servers polled, so their latest state is up to date.
+                if self._idle.watching(server.name) and self._hub.polling(server.name):
+                    self._update(server.name, self._hub.latest(server.name))
+
+            await asyncio.sleep(PLAYERS_CHECK_INTERVAL)
+
+    def _update(self, name: str, state: ServerState):
+        status = state.macaw
+        if not valid_status(status):
+            return
+
+        if len(status.json['players']) == 0:
+            return
+
+        now = time.time()
+        hour = int(now // 3600)
+        if self._recorded_hours.get(name) != hour:
+            self._recorded_hours[name] = hour
+            self._store.record(name, Activity.players, now)
+
+    # Whether the server is expected to be wanted in a slot.
+    def predicted(self, name: str, slot: tuple) -> bool:
+        settings = config.settings()
+        now = time.time()
+        profile = usage_profile(self._store.times(name, now - settings.prewarm_weeks * WEEK),
+                                now, settings.prewarm_weeks)
+        return profile.get(slot, 0) >= settings.prewarm_threshold
+
+    async def _run(self):
+        checked = None
+        while True:
+            lead = timedelta(seconds=config.settings().prewarm_lead)
+
+            # Sleep until lead before the start of the next hour that's far
+            # enough away, then look at that hour.
+            hour = (datetime.now() + lead).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            if checked is not None and hour <= checked:
+                hour = checked + timedelta(hours=1)
+            checked = hour
+
+            await asyncio.sleep(max(0, (hour - lead - datetime.now()).total_seconds()))
+
+            self._store.prune(time.time() - config.settings().prewarm_weeks * WEEK)
+
+            for name in self._servers():
+                # Busy hours in a row only need the first one started early.
+                previous = slot_of(hour - timedelta(hours=1))
+                if self.predicted(name, slot_of(hour)) and not self.predicted(name, previous):
+                    try:
+                        await self._prewarm(name, hour)
+                    except Exception as e:
+                        print('Failed to prewarm {}: {}'.format(name, e))
+
+    async def _prewarm(self, name: str, hour: datetime):
+        snapshot = await self._hub.instance(name)
+        if snapshot.state_code != InstanceState.stopped:
+            return
+
+        channel = self._client.get_channel(self._fleet.get(name).profile.idle_channel)
+        if channel is None:
+            return
+
+        embed = discord.Embed(
+            title='Starting Early', color=EmbedColours.SUCCESS,
+            description='{} is usually busy from {}, so it\'s starting now. '
+                        'It will stop again if no-one joins.'.format(name, hour.strftime('%H:%M')))
+
+        await self._limiter.wait(channel.id)
+        notice = await channel.send(embed=embed)
+        await self._start(self._fleet.get(name), notice)
+
+    async def close(self):
+        await cancel_tasks(self._tasks)
+        self._tasks = []
+        self._store.close()
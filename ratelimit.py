@@ -0,0 +1,110 @@
+import time
+
+import config
+
+# The cost class of each command. Commands that don't touch EC2 or Macaw,
+# like the ones answered from the presence store, aren't limited, and anything
+# not listed here counts as a read.
+COMMAND_CLASSES = {
+    'help': None,
+    'reload': None,
+    'metrics': None,
+    'seen': None,
+    'playtime': None,
+    'stay': None,
+    'status': 'read',
+    'players': 'read',
+    'dynmap': 'read',
+    'dashboard': 'read',
+    'start': 'write',
+    'stop': 'write',
+    'issue': 'write',
+    'macro': 'write'
+}
+
+# Buckets that haven't been used for this many seconds are forgotten.
+IDLE_TIMEOUT = 600
+
+
+#
+# Allows bursts of up to capacity requests, refilling at capacity tokens
+# every period seconds.
+#
+class TokenBucket:
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.period = period
+        self.used_at = time.monotonic()
+
+        self._tokens = capacity
+        self._updated = self.used_at
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.capacity / self.period)
+        self._updated = now
+
+    # Seconds until there'll be a token to take, 0 if there's one now.
+    def wait_time(self) -> float:
+        self._refill()
+        return max(0, (1 - self._tokens) * self.period / self.capacity)
+
+    def take(self):
+        self._refill()
+        self._tokens -= 1
+        self.used_at = self._updated
+
+
+#
+# Token buckets per user and per guild for each cost class of command. A
+# command is only allowed if both its user's and its guild's buckets have a
+# token, and then takes one from each. Limits are read from the settings on
+# every check, so they change on reload.
+#
+class RateLimiter:
+    def __init__(self):
+        self._buckets = {}
+        self._pruned_at = time.monotonic()
+
+    def _bucket(self, scope: str, identifier: int, cost_class: str) -> TokenBucket:
+        capacity, period = config.settings().rate_limits['{}_{}'.format(scope, cost_class)]
+
+        key = (scope, identifier, cost_class)
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.capacity != capacity or bucket.period != period:
+            bucket = TokenBucket(capacity, period)
+            self._buckets[key] = bucket
+
+        return bucket
+
+    # Try to take a token for the command. Returns 0 if it's allowed, or how
+    # many seconds to wait until it would be.
+    def check(self, command: str, member, guild) -> float:
+        cost_class = COMMAND_CLASSES.get(command, 'read')
+        if cost_class is None:
+            return 0
+
+        self._prune()
+
+        buckets = [self._bucket('user', member.id, cost_class)]
+        if guild is not None:
+            buckets.append(self._bucket('guild', guild.id, cost_class))
+
+        wait = max(bucket.wait_time() for bucket in buckets)
+        if wait > 0:
+            return wait
+
+        for bucket in buckets:
+            bucket.take()
+        return 0
+
+    # Forget buckets that haven't been used for a while, which will have
+    # refilled anyway.
+    def _prune(self):
+        now = time.monotonic()
+        if now - self._pruned_at < IDLE_TIMEOUT:
+            return
+
+        self._pruned_at = now
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if now - bucket.used_at < max(IDLE_TIMEOUT, bucket.period)}
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+# The bot's modules live at the top of the repository.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from bench.harness import write_config
+
+
+# Point the config at a temporary directory written by the benchmark harness,
+# with a single server, and keep the data directory there too.
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    write_config(str(tmp_path), [('default', 'i-default', 8080)])
+    monkeypatch.setattr(config, 'registry', config.ConfigRegistry(str(tmp_path)))
+    monkeypatch.setattr(config, 'DATA_DIR', str(tmp_path / 'data'))
+    return config.settings()
+
+
+# A clock that only moves when it's told to, for code that reads time.monotonic.
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from aws_actions import AWSManager, InstanceState, describe_many
+from fakes.ec2 import FakeEC2
+
+
+def _manager(ec2: FakeEC2, cache_ttl: float = 0, instance_id: str = 'i-survival') -> AWSManager:
+    return AWSManager(instance_id, session=ec2.session('local'), cache_ttl=cache_ttl)
+
+
+# Call function from count threads at once and return their results.
+def _concurrently(function, count: int) -> list:
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(i):
+        barrier.wait()
+        results[i] = function()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_describes_share_one_call():
+    ec2 = FakeEC2({'i-survival': 'running'}, latency=0.2)
+    manager = _manager(ec2)
+
+    snapshots = _concurrently(manager.get_snapshot, 8)
+
+    # The first caller describes the instance, and the ones that arrived while
+    # it was in flight get the same snapshot.
+    assert ec2.calls['DescribeInstances'] == 1
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+    assert snapshots[0].state_code == InstanceState.running
+
+
+def test_later_describe_is_sent_again():
+    ec2 = FakeEC2({'i-survival': 'running'}, latency=0)
+    manager = _manager(ec2)
+
+    manager.get_snapshot()
+    manager.get_snapshot()
+    assert ec2.calls['DescribeInstances'] == 2
+
+
+def test_cache_ttl():
+    ec2 = FakeEC2({'i-survival': 'running'}, latency=0)
+    manager = _manager(ec2, cache_ttl=60)
+
+    assert manager.get_state() == InstanceState.running
+    assert manager.get_public_ip() == '127.0.0.1'
+    assert ec2.calls['DescribeInstances'] == 1
+
+    manager.invalidate()
+    manager.get_state()
+    assert ec2.calls['DescribeInstances'] == 2
+
+
+def test_start_describes_fresh():
+    ec2 = FakeEC2({'i-survival': 'stopped'}, latency=0, boot_time=60)
+    manager = _manager(ec2, cache_ttl=60)
+
+    assert manager.start() == (True, 'Starting instance...')
+    assert manager.start() == (False, 'The instance is already starting.')
+    assert ec2.calls['StartInstances'] == 1
+
+
+def test_describe_many_leaves_out_missing_instances():
+    ec2 = FakeEC2({'i-survival': 'running', 'i-creative': 'stopped'}, latency=0)
+    managers = [_manager(ec2, cache_ttl=60, instance_id=instance_id)
+                for instance_id in ('i-survival', 'i-creative', 'i-deleted')]
+
+    snapshots = describe_many(managers)
+    assert ec2.calls['DescribeInstances'] == 1
+    assert sorted(snapshots) == ['i-creative', 'i-survival']
+    assert snapshots['i-creative'].state_code == InstanceState.stopped
+
+    # The managers that were found are primed with their snapshot.
+    assert managers[0].get_snapshot() is snapshots['i-survival']
+    assert ec2.calls['DescribeInstances'] == 1
+
+
+def test_describing_a_missing_instance_fails():
+    ec2 = FakeEC2({'i-survival': 'running'}, latency=0)
+    with pytest.raises(ClientError) as error:
+        _manager(ec2, instance_id='i-deleted').get_snapshot()
+    assert error.value.response['Error']['Code'] == 'InvalidInstanceID.NotFound'
@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from commands import MAX_BATCH, CommandError, CommandRouter, optional_player, optional_target, split_commands, \
+    targeted_commands, words
+from fakes.discord_objects import FakeChannel, FakeGuild, FakeMember
+
+
+def test_split_commands():
+    assert split_commands('save-all; say Saved!') == ['save-all', 'say Saved!']
+
+
+def test_split_commands_escaped_semicolon():
+    assert split_commands(r'say a\; b; list') == ['say a; b', 'list']
+
+
+def test_split_commands_skips_empty():
+    assert split_commands(' ; list ;; ') == ['list']
+
+
+def test_split_commands_none_given():
+    with pytest.raises(CommandError):
+        split_commands(' ; ')
+
+
+def test_split_commands_too_many():
+    assert len(split_commands(';'.join(['list'] * MAX_BATCH))) == MAX_BATCH
+    with pytest.raises(CommandError):
+        split_commands(';'.join(['list'] * (MAX_BATCH + 1)))
+
+
+def test_targeted_commands():
+    assert targeted_commands('@creative time set day; say hi') == ('creative', ['time set day', 'say hi'])
+    assert targeted_commands('list') == (None, ['list'])
+
+
+def test_optional_player():
+    assert optional_player('') == (None,)
+    assert optional_player('Steve') == ('Steve',)
+    with pytest.raises(CommandError, match='Only one player can be given.'):
+        optional_player('Steve x')
+
+
+def test_words_unbalanced_quotes():
+    with pytest.raises(CommandError):
+        words('"unclosed')
+
+
+#
+# Records what the router does with each message.
+#
+class _Recorder:
+    def __init__(self, allowed: bool = True, wait: float = 0):
+        self.allowed = allowed
+        self.wait = wait
+        self.checked = []
+        self.handled = []
+        self.errors = []
+        self.limited = []
+
+    def check(self, name, member, guild) -> bool:
+        self.checked.append(name)
+        return self.allowed
+
+    def limit(self, name, member, guild) -> float:
+        return self.wait
+
+    async def on_error(self, message, command, error):
+        self.errors.append((command.name, str(error)))
+
+    async def on_limited(self, message, command, args, wait):
+        self.limited.append((command.name, args, wait))
+
+    def router(self) -> CommandRouter:
+        router = CommandRouter(self.check, self.on_error, limit=self.limit, on_limited=self.on_limited)
+
+        async def start(message, target):
+            self.handled.append(('start', target))
+
+        async def issue(message, target, commands):
+            self.handled.append(('issue', target, commands))
+
+        router.register('start', start, 'Start a server.', optional_target)
+        router.register('issue', issue, 'Issue commands.', targeted_commands)
+        return router
+
+
+def _message(content: str):
+    return FakeChannel().receive(FakeMember(FakeGuild([])), content)
+
+
+def _dispatch(router: CommandRouter, content: str) -> bool:
+    return asyncio.run(router.dispatch(_message(content)))
+
+
+def test_router_runs_handler():
+    recorder = _Recorder()
+    assert _dispatch(recorder.router(), '>issue @creative save-all; say hi')
+    assert recorder.handled == [('issue', 'creative', ['save-all', 'say hi'])]
+
+
+def test_router_ignores_other_messages():
+    recorder = _Recorder()
+    router = recorder.router()
+
+    for content in ('hello', '>', '> ', '>unknown', '!start'):
+        assert not _dispatch(router, content)
+
+    # Unknown commands are dropped before any permission check.
+    assert recorder.checked == []
+    assert recorder.handled == []
+
+
+def test_router_checks_permission():
+    recorder = _Recorder(allowed=False)
+    assert not _dispatch(recorder.router(), '>start')
+    assert recorder.checked == ['start']
+    assert recorder.handled == []
+
+
+def test_router_reports_bad_arguments():
+    recorder = _Recorder()
+    assert not _dispatch(recorder.router(), '>issue ;')
+    assert recorder.errors == [('issue', 'No command was given.')]
+    assert recorder.handled == []
+
+
+def test_router_rate_limits():
+    recorder = _Recorder(wait=5)
+    assert not _dispatch(recorder.router(), '>start creative')
+    assert recorder.limited == [('start', ('creative',), 5)]
+    assert recorder.handled == []
+
+
+def test_router_get():
+    router = _Recorder().router()
+    assert router.get('start').help == 'Start a server.'
+    assert router.get('missing') is None
@@ -0,0 +1,139 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+
+from embeds import MAX_EDIT_ATTEMPTS, LiveEmbed
+from fakes.discord_objects import FakeChannel
+
+
+# Lets every edit through straight away.
+class _NoLimit:
+    async def wait(self, channel_id: int):
+        await asyncio.sleep(0)
+
+
+# A message whose next edits fail with the given exceptions, recording every
+# embed it's edited to.
+class _Message:
+    def __init__(self, failures: list = None):
+        self.channel = FakeChannel()
+        self.embeds = []
+        self.edits = []
+        self.failures = list(failures or [])
+
+    async def edit(self, embed=None):
+        if len(self.failures) > 0:
+            raise self.failures.pop(0)
+        self.edits.append(embed.title)
+        self.embeds = [embed]
+
+
+def _error(status: int = 500) -> discord.HTTPException:
+    response = SimpleNamespace(status=status, reason='Error')
+    return (discord.NotFound if status == 404 else discord.HTTPException)(response, 'Error')
+
+
+def _embed(title: str) -> discord.Embed:
+    return discord.Embed(title=title)
+
+
+def _live(message: _Message) -> LiveEmbed:
+    return LiveEmbed(message, limiter=_NoLimit())
+
+
+def test_updates_are_coalesced():
+    async def test():
+        message = _Message()
+        live = _live(message)
+
+        for title in ('Starting', 'Pending', 'Running'):
+            live.update(_embed(title))
+        await live.flush()
+
+        assert message.edits == ['Running']
+
+    asyncio.run(test())
+
+
+def test_unchanged_updates_are_skipped():
+    async def test():
+        message = _Message()
+        live = _live(message)
+
+        live.update(_embed('Running'))
+        await live.flush()
+        live.update(_embed('Running'))
+        await live.flush()
+
+        assert message.edits == ['Running']
+
+    asyncio.run(test())
+
+
+def test_failed_edit_is_retried():
+    async def test():
+        message = _Message([_error(), _error()])
+        live = _live(message)
+
+        live.update(_embed('Started!'))
+        await live.flush()
+
+        assert message.edits == ['Started!']
+
+    asyncio.run(test())
+
+
+def test_failed_edit_is_given_up_on():
+    async def test():
+        message = _Message([_error()] * MAX_EDIT_ATTEMPTS)
+        live = _live(message)
+
+        live.update(_embed('Started!'))
+        await live.flush()
+        assert message.edits == []
+
+        # Later updates are still sent.
+        live.update(_embed('Stopped!'))
+        await live.flush()
+        assert message.edits == ['Stopped!']
+
+    asyncio.run(test())
+
+
+def test_newer_update_replaces_failed_edit():
+    async def test():
+        message = _Message()
+        live = _live(message)
+
+        async def edit(embed=None):
+            # The newer update arrives while the edit is in flight, then the edit fails.
+            live.update(_embed('Running'))
+            message.edit = original
+            raise _error()
+
+        original = message.edit
+        message.edit = edit
+
+        live.update(_embed('Starting'))
+        await live.flush()
+
+        assert message.edits == ['Running']
+
+    asyncio.run(test())
+
+
+def test_deleted_message_is_given_up_on():
+    async def test():
+        message = _Message([_error(404)])
+        live = _live(message)
+
+        live.update(_embed('Starting'))
+        await live.flush()
+        assert live.gone
+
+        live.update(_embed('Running'))
+        await live.flush()
+        assert message.edits == []
+
+    asyncio.run(test())
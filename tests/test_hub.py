@@ -0,0 +1,148 @@
+import asyncio
+import dataclasses
+from collections import Counter
+
+import pytest
+
+import config
+import hub
+from aws_actions import InstanceSnapshot, InstanceState
+from hub import SEED_MAX_AGE, StateHub
+from macaw_actions import MacawStatus
+
+
+def _snapshot(state_code: int = InstanceState.running, taken_at: float = 0) -> InstanceSnapshot:
+    return InstanceSnapshot(state_code=state_code, state_name='', state_reason='', ip_address='127.0.0.1',
+                            taken_at=taken_at)
+
+
+# A server whose instance and Macaw server are set by the test, counting how
+# often each is polled.
+class _Server:
+    def __init__(self, name: str):
+        self.name = name
+        self.snapshot = _snapshot()
+        self.players = []
+        self.calls = Counter()
+
+        self.aws = self
+        self.macaw = self
+
+    async def get_snapshot(self) -> InstanceSnapshot:
+        self.calls['instance'] += 1
+        return self.snapshot
+
+    async def probe(self, snapshot: InstanceSnapshot = None) -> MacawStatus:
+        self.calls['macaw'] += 1
+        if snapshot is None or snapshot.state_code != InstanceState.running:
+            return None
+        return MacawStatus(status_code=200, json={'status': 'running', 'players': list(self.players)})
+
+
+class _Fleet(list):
+    def get(self, name: str) -> _Server:
+        return next(server for server in self if server.name == name)
+
+
+# Poll once and then wait for a wake, so the number of polls is predictable.
+@pytest.fixture
+def slow_polls(settings, monkeypatch):
+    slow = dataclasses.replace(settings, check_delay=60, poll_min_delay=60, poll_max_delay=60)
+    monkeypatch.setattr(config, 'settings', lambda: slow)
+
+
+def test_subscribers_share_the_pollers(slow_polls):
+    async def test():
+        server = _Server('survival')
+        state_hub = StateHub(_Fleet([server]))
+
+        subscriptions = [state_hub.subscribe('survival') for _ in range(3)]
+        states = [await subscription.next() for subscription in subscriptions]
+
+        assert all(state == states[0] for state in states)
+        assert states[0].macaw.json['players'] == []
+        assert server.calls == Counter(instance=1, macaw=1)
+
+        # A late subscriber is given the current state without polling again.
+        late = state_hub.subscribe('survival')
+        assert await asyncio.wait_for(late.next(), 1) == states[0]
+        assert server.calls == Counter(instance=1, macaw=1)
+
+        await state_hub.close()
+
+    asyncio.run(test())
+
+
+def test_pollers_stop_without_subscribers(slow_polls):
+    async def test():
+        state_hub = StateHub(_Fleet([_Server('survival')]))
+
+        subscription = state_hub.subscribe('survival')
+        await subscription.next()
+        assert state_hub.polling('survival')
+
+        subscription.close()
+        assert not state_hub.polling('survival')
+        await state_hub.close()
+
+    asyncio.run(test())
+
+
+def test_wake_publishes_changes(slow_polls):
+    async def test():
+        server = _Server('survival')
+        state_hub = StateHub(_Fleet([server]))
+
+        subscription = state_hub.subscribe('survival')
+        await subscription.next()
+
+        server.players = ['alice']
+        state_hub.wake('survival')
+
+        state = await asyncio.wait_for(subscription.next(), 1)
+        assert state.macaw.json['players'] == ['alice']
+        assert (await state_hub.macaw('survival')).json['players'] == ['alice']
+
+        await state_hub.close()
+
+    asyncio.run(test())
+
+
+def test_reads_without_pollers(settings):
+    async def test():
+        server = _Server('survival')
+        state_hub = StateHub(_Fleet([server]))
+
+        assert await state_hub.instance('survival') == server.snapshot
+        assert (await state_hub.macaw('survival')).json['players'] == []
+        assert server.calls == Counter(instance=2, macaw=1)
+
+        server.snapshot = _snapshot(InstanceState.stopped)
+        assert await state_hub.macaw('survival') is None
+
+    asyncio.run(test())
+
+
+def test_seeded_snapshot(settings, clock, monkeypatch):
+    monkeypatch.setattr(hub, 'time', clock)
+
+    async def test():
+        server = _Server('survival')
+        state_hub = StateHub(_Fleet([server]))
+
+        seeded = _snapshot(InstanceState.stopped, taken_at=clock.now)
+        state_hub.seed('survival', seeded)
+        assert state_hub.latest('survival').instance == seeded
+        assert await state_hub.instance('survival') == seeded
+        assert server.calls['instance'] == 0
+
+        # Once it's too old the instance is described again.
+        clock.advance(SEED_MAX_AGE + 1)
+        assert await state_hub.instance('survival') == server.snapshot
+        assert server.calls['instance'] == 1
+
+        # A snapshot isn't seeded over one that's already known.
+        state_hub.seed('survival', seeded)
+        assert state_hub.latest('survival').instance == server.snapshot
+
+    asyncio.run(test())
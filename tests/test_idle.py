@@ -0,0 +1,142 @@
+import asyncio
+import dataclasses
+from types import SimpleNamespace
+
+import pytest
+
+import config
+from fakes.discord_objects import FakeChannel
+from hub import ServerState
+from idle import IdleShutdown, is_idle
+from macaw_actions import MacawError, MacawStatus
+
+
+def _state(players: list = None, status: str = 'running', **kwargs) -> ServerState:
+    if players is None and len(kwargs) == 0:
+        return ServerState(None, None)
+    macaw = MacawStatus(**kwargs) if len(kwargs) > 0 else \
+        MacawStatus(status_code=200, json={'status': status, 'players': players})
+    return ServerState(None, macaw)
+
+
+def test_is_idle():
+    assert is_idle(_state([])) is True
+    assert is_idle(_state(['alice'])) is False
+
+    # The instance isn't running, so there's nothing to stop.
+    assert is_idle(_state()) is False
+
+    # Nothing is known about the players.
+    assert is_idle(_state(error=MacawError.timeout)) is None
+    assert is_idle(_state(status_code=401, json={'error': 'unauthorised'})) is None
+    assert is_idle(_state(status_code=200, json={'status': 'running'})) is None
+    assert is_idle(_state([], status='stopping')) is None
+
+
+class _NoLimit:
+    async def wait(self, channel_id: int):
+        pass
+
+
+# A channel whose sends wait until the test lets them through.
+class _SlowChannel(FakeChannel):
+    def __init__(self):
+        super().__init__()
+        self.sending = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def send(self, content: str = None, embed=None):
+        self.sending.set()
+        await self.release.wait()
+        return await super().send(content, embed=embed)
+
+
+@pytest.fixture
+def short_idle(settings, monkeypatch):
+    short = dataclasses.replace(settings, idle_timeout=0.2, idle_warning=0.1)
+    monkeypatch.setattr(config, 'settings', lambda: short)
+
+
+def _idle(channel: FakeChannel, stopped: list) -> IdleShutdown:
+    client = SimpleNamespace(get_channel=lambda channel_id: channel)
+    fleet = SimpleNamespace(get=lambda name: SimpleNamespace(name=name, profile=SimpleNamespace(idle_channel=1)))
+
+    async def stop(server, warning):
+        stopped.append((server.name, warning))
+
+    return IdleShutdown(client, None, fleet, stop, limiter=_NoLimit())
+
+
+def _titles(channel: FakeChannel) -> list:
+    return [message.embeds[0].title for message in channel.messages.values()]
+
+
+def test_idle_server_is_stopped(short_idle):
+    async def test():
+        channel = FakeChannel()
+        stopped = []
+        idle = _idle(channel, stopped)
+
+        await idle._update('survival', _state([]))
+        assert idle.pending('survival')
+        await asyncio.sleep(0.4)
+
+        assert not idle.pending('survival')
+        assert _titles(channel) == ['Stopping Soon']
+        assert [(name, warning.embeds[0].title) for name, warning in stopped] == [('survival', 'Stopping Soon')]
+
+    asyncio.run(test())
+
+
+def test_join_cancels_shutdown(short_idle):
+    async def test():
+        channel = FakeChannel()
+        stopped = []
+        idle = _idle(channel, stopped)
+
+        await idle._update('survival', _state([]))
+        await asyncio.sleep(0.15)
+        await idle._update('survival', _state(['alice']))
+        await asyncio.sleep(0.3)
+
+        assert not idle.pending('survival')
+        assert stopped == []
+        assert _titles(channel) == ['Shutdown Cancelled']
+        assert list(channel.messages.values())[0].embeds[0].description == 'Someone joined the server.'
+
+    asyncio.run(test())
+
+
+def test_cancel_while_warning_is_sent(short_idle):
+    async def test():
+        channel = _SlowChannel()
+        stopped = []
+        idle = _idle(channel, stopped)
+
+        await idle._update('survival', _state([]))
+        await channel.sending.wait()
+
+        # Cancel while the warning is on its way, then let it arrive.
+        cancelling = asyncio.ensure_future(idle.cancel('survival', 'Someone joined the server.'))
+        await asyncio.sleep(0.05)
+        channel.release.set()
+        assert await cancelling
+
+        await asyncio.sleep(0.2)
+        assert stopped == []
+        assert _titles(channel) == ['Shutdown Cancelled']
+
+    asyncio.run(test())
+
+
+def test_unknown_players_leave_countdown_running(short_idle):
+    async def test():
+        channel = FakeChannel()
+        idle = _idle(channel, [])
+
+        await idle._update('survival', _state([]))
+        await idle._update('survival', _state(error=MacawError.unreachable))
+        assert idle.pending('survival')
+        await idle.close()
+
+    asyncio.run(test())
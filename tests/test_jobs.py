@@ -0,0 +1,150 @@
+import asyncio
+
+from jobs import JobScheduler, JobState
+
+
+#
+# Stands in for the ObservationScheduler, waiting on each observer until the
+# test lets it finish.
+#
+class _Observations:
+    def __init__(self):
+        self.scheduled = []
+
+    async def schedule(self, observer, timeout: float):
+        self.scheduled.append((observer, timeout))
+        await observer.wait()
+
+
+# An operation that records each run and hands back an observer, which is an
+# event the test sets to finish the observation.
+def _operation(runs: list, kind: str):
+    async def run():
+        runs.append(kind)
+        return asyncio.Event()
+    return run
+
+
+def _scheduler():
+    observations = _Observations()
+    return JobScheduler(observations, lambda: 60), observations
+
+
+def test_same_operation_is_merged():
+    async def test():
+        scheduler, observations = _scheduler()
+        runs = []
+
+        state, job = scheduler.submit('survival', 'start', _operation(runs, 'start'))
+        assert state == JobState.started
+        await job.observing.wait()
+
+        merged_state, merged = scheduler.submit('survival', 'start', _operation(runs, 'start'))
+        assert merged_state == JobState.merged
+        assert merged is job
+
+        job.observer.set()
+        await scheduler.join()
+        assert runs == ['start']
+        assert observations.scheduled == [(job.observer, 60)]
+
+    asyncio.run(test())
+
+
+def test_different_operation_is_queued():
+    async def test():
+        scheduler, _ = _scheduler()
+        runs = []
+
+        _, start = scheduler.submit('survival', 'start', _operation(runs, 'start'))
+        await start.observing.wait()
+
+        state, stop = scheduler.submit('survival', 'stop', _operation(runs, 'stop'))
+        assert state == JobState.queued
+        assert scheduler.submit('survival', 'stop', _operation(runs, 'stop')) == (JobState.merged, stop)
+
+        # The queued job only runs once the running one has finished.
+        await asyncio.sleep(0)
+        assert runs == ['start']
+        assert scheduler.running('survival') is start
+
+        start.observer.set()
+        await stop.observing.wait()
+        assert runs == ['start', 'stop']
+        assert scheduler.running('survival') is stop
+
+        stop.observer.set()
+        await scheduler.join()
+        assert scheduler.running('survival') is None
+
+    asyncio.run(test())
+
+
+def test_busy_when_something_is_queued():
+    async def test():
+        scheduler, _ = _scheduler()
+        runs = []
+
+        _, start = scheduler.submit('survival', 'start', _operation(runs, 'start'))
+        await start.observing.wait()
+        _, stop = scheduler.submit('survival', 'stop', _operation(runs, 'stop'))
+
+        state, job = scheduler.submit('survival', 'start', _operation(runs, 'start'))
+        assert state == JobState.busy
+        assert job is stop
+
+        await scheduler.close()
+        assert runs == ['start']
+
+    asyncio.run(test())
+
+
+def test_servers_run_independently():
+    async def test():
+        scheduler, _ = _scheduler()
+        runs = []
+
+        first_state, first = scheduler.submit('survival', 'start', _operation(runs, 'start'))
+        second_state, second = scheduler.submit('creative', 'stop', _operation(runs, 'stop'))
+        assert (first_state, second_state) == (JobState.started, JobState.started)
+
+        await first.observing.wait()
+        await second.observing.wait()
+        assert sorted(runs) == ['start', 'stop']
+        await scheduler.close()
+
+    asyncio.run(test())
+
+
+def test_failed_operation_runs_the_queued_one():
+    async def test():
+        scheduler, _ = _scheduler()
+        runs = []
+
+        async def fail():
+            raise RuntimeError('EC2 is down')
+
+        _, failed = scheduler.submit('survival', 'start', fail)
+        _, stop = scheduler.submit('survival', 'stop', _operation(runs, 'stop'))
+
+        await stop.observing.wait()
+        assert failed.observer is None
+        assert runs == ['stop']
+        await scheduler.close()
+
+    asyncio.run(test())
+
+
+def test_operation_without_observer():
+    async def test():
+        scheduler, observations = _scheduler()
+
+        async def nothing():
+            return None
+
+        _, job = scheduler.submit('survival', 'start', nothing, timeout=5)
+        await scheduler.join()
+        assert job.observing.is_set()
+        assert observations.scheduled == []
+
+    asyncio.run(test())
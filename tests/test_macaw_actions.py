@@ -0,0 +1,156 @@
+import asyncio
+
+import macaw_actions
+from aws_actions import InstanceSnapshot, InstanceState
+from bench.harness import MACAW_KEY
+from fakes.macaw import FakeMacawServer
+from macaw_actions import MacawError, MacawManager, MacawState, MacawStatus, players_from_status, state_from_status
+
+
+def _status(status_code: int = 200, json=None, error: str = None) -> MacawStatus:
+    return MacawStatus(status_code=status_code, json=json, error=error)
+
+
+def test_state_from_status():
+    assert state_from_status(None) == MacawState.instance_stopped
+    assert state_from_status(_status(json={'status': 'running', 'players': []})) == MacawState.running
+    assert state_from_status(_status(json={'status': 'stopping', 'players': []})) == MacawState.stopping
+
+
+def test_state_from_failed_request():
+    timeout = _status(status_code=None, error=MacawError.timeout)
+    assert state_from_status(timeout, starting=True) == MacawState.macaw_starting
+    assert state_from_status(timeout, starting=False) == MacawState.macaw_stopped
+
+    unreachable = _status(status_code=None, error=MacawError.unreachable)
+    assert state_from_status(unreachable, starting=False) == MacawState.macaw_stopping
+
+
+def test_state_from_unusable_response():
+    for status in (_status(status_code=401, json={'error': 'unauthorised'}),
+                   _status(status_code=500),
+                   _status(json=['running']),
+                   _status(json={'status': 'exploded', 'players': []}),
+                   _status(json={'status': 'running'})):
+        assert state_from_status(status, starting=True) == MacawState.macaw_starting
+        assert state_from_status(status, starting=False) == MacawState.macaw_stopping
+
+
+def test_players_from_status():
+    assert players_from_status(None) == (False, 'Instance is not running.')
+    assert players_from_status(_status(json={'status': 'running', 'players': []})) == \
+        (True, 'No-one is online :(')
+    assert players_from_status(_status(json={'status': 'running', 'players': ['alice', 'bob']})) == \
+        (True, 'alice\nbob')
+
+
+def test_players_from_unusable_response():
+    assert players_from_status(_status(status_code=401, json={'error': 'unauthorised'})) == \
+        (False, 'The Macaw API key is not correct, check the config.')
+
+    for status in (_status(status_code=500), _status(json={'status': 'running'}), _status(json='players')):
+        assert players_from_status(status) == (False, 'The Macaw server sent an unexpected response.')
+
+
+def _running(ip_address: str) -> InstanceSnapshot:
+    return InstanceSnapshot(state_code=InstanceState.running, state_name='running', state_reason='',
+                            ip_address=ip_address, taken_at=0)
+
+
+# Run test with a fake Macaw server and a manager pointed at its port.
+def _with_server(test, server: FakeMacawServer, status_ttl: float = 1):
+    async def run():
+        port = await server.start()
+        manager = MacawManager(None, status_ttl=status_ttl, port=port, scheme='http')
+        try:
+            await test(manager)
+        finally:
+            await manager.close()
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_status_is_cached(settings, clock, monkeypatch):
+    monkeypatch.setattr(macaw_actions, 'time', clock)
+    server = FakeMacawServer(MACAW_KEY, players=['alice'])
+
+    async def test(manager):
+        snapshot = _running('127.0.0.1')
+        assert await manager.get_state(snapshot=snapshot) == MacawState.running
+        assert (await manager.probe(snapshot)).json['players'] == ['alice']
+        assert server.requests['status'] == 1
+
+        clock.advance(2)
+        assert await manager.get_state(snapshot=snapshot) == MacawState.running
+        assert server.requests['status'] == 2
+
+    _with_server(test, server)
+
+
+def test_concurrent_callers_share_a_request(settings):
+    server = FakeMacawServer(MACAW_KEY, delay=0.2)
+
+    async def test(manager):
+        snapshot = _running('127.0.0.1')
+        statuses = await asyncio.gather(*[manager.probe(snapshot) for _ in range(5)])
+
+        assert server.requests['status'] == 1
+        assert all(status is statuses[0] for status in statuses)
+
+    _with_server(test, server, status_ttl=0)
+
+
+def test_cancelled_caller_leaves_the_request_running(settings):
+    server = FakeMacawServer(MACAW_KEY, delay=0.2)
+
+    async def test(manager):
+        snapshot = _running('127.0.0.1')
+        cancelled = asyncio.ensure_future(manager.probe(snapshot))
+        waiting = asyncio.ensure_future(manager.probe(snapshot))
+        await asyncio.sleep(0.05)
+
+        cancelled.cancel()
+        assert (await waiting).status_code == 200
+        assert server.requests['status'] == 1
+
+    _with_server(test, server, status_ttl=0)
+
+
+def test_session_is_rebuilt_for_a_new_address(settings):
+    server = FakeMacawServer(MACAW_KEY)
+
+    async def test(manager):
+        await manager.probe(_running('127.0.0.1'))
+        session = manager._session
+
+        # The cached status belongs to the old address, so it isn't reused.
+        assert (await manager.probe(_running('localhost'))).status_code == 200
+        assert manager._session is not session
+        assert session.closed
+        assert server.requests['status'] == 2
+
+    _with_server(test, server, status_ttl=60)
+
+
+def test_wrong_key(settings):
+    server = FakeMacawServer('not the key')
+
+    async def test(manager):
+        status = await manager.probe(_running('127.0.0.1'))
+        assert status.status_code == 401
+        assert players_from_status(status) == (False, 'The Macaw API key is not correct, check the config.')
+
+    _with_server(test, server)
+
+
+def test_unreachable_server(settings):
+    server = FakeMacawServer(MACAW_KEY)
+
+    async def test(manager):
+        await server.stop()
+        status = await manager.probe(_running('127.0.0.1'))
+        assert status.error == MacawError.unreachable
+        assert await manager.get_state(starting=False, snapshot=_running('127.0.0.1')) == MacawState.macaw_stopping
+
+    _with_server(test, server, status_ttl=0)
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from aws_actions import InstanceSnapshot, InstanceState
+from fakes.discord_objects import FakeChannel
+from observers import (GeneralState, ObservationScheduler, ObservationStore, Phase, StartObserver, StopObserver,
+                       observation_entry, restore_observer)
+
+
+# An observer that runs until the test lets it finish.
+class _Observer(StartObserver):
+    def __init__(self, message):
+        super().__init__(None, 'survival', message)
+        self.finish = asyncio.Event()
+
+    async def dispatch(self):
+        await self.finish.wait()
+
+
+def test_observation_is_restored(settings):
+    async def test():
+        channel, other_channel = FakeChannel(), FakeChannel()
+        message = await channel.send('Starting...')
+        other_message = await other_channel.send('Starting...')
+
+        observer = StartObserver(None, 'survival', message, 'survival')
+        observer.attach(other_message)
+        # Slash command responses can't be fetched again, so they aren't stored.
+        observer.attach(SimpleNamespace(id=None, channel=channel, embeds=[]))
+
+        observer.phase = Phase.macaw
+        observer.snapshot = InstanceSnapshot(state_code=InstanceState.running, state_name='running',
+                                             state_reason='', ip_address='10.0.0.1',
+                                             taken_at=time.monotonic() - 30)
+
+        entry = json.loads(json.dumps(observation_entry(observer)))
+        assert entry['messages'] == [[channel.id, message.id], [other_channel.id, other_message.id]]
+
+        entry['states'] = [GeneralState.running, GeneralState.starting, GeneralState.stopped]
+        restored = await restore_observer(None, observer.id, entry, [message, other_message])
+        await restored._flush()
+
+        assert restored.id == observer.id
+        assert restored.started_at == observer.started_at
+        assert restored.phase == Phase.macaw
+        assert restored.snapshot == observer.snapshot
+        assert abs(restored.snapshot.taken_at - observer.snapshot.taken_at) < 1
+
+        # The embeds show the state the observation was last seen in.
+        for shown in (message, other_message):
+            assert shown.embeds[0].title == 'Starting...'
+            assert shown.embeds[0].description == '10.0.0.1'
+
+    asyncio.run(test())
+
+
+def test_stop_observation_is_restored(settings):
+    async def test():
+        message = await FakeChannel().send('Stopping...')
+        observer = StopObserver(None, 'survival', message)
+
+        entry = json.loads(json.dumps(observation_entry(observer)))
+        assert entry['kind'] == 'stop'
+        assert entry['snapshot'] is None
+
+        restored = await restore_observer(None, 'restored', entry, [message])
+        assert isinstance(restored, StopObserver)
+        assert restored.snapshot is None
+
+    asyncio.run(test())
+
+
+def test_store(tmp_path):
+    store = ObservationStore(str(tmp_path / 'observations.json'))
+    assert store.load() == {}
+
+    store.save({'a': {'kind': 'start'}})
+    assert store.load() == {'a': {'kind': 'start'}}
+
+    # A broken file is treated as empty rather than stopping the bot.
+    (tmp_path / 'observations.json').write_text('{')
+    assert store.load() == {}
+
+
+def test_unfinished_observations_are_kept(settings, tmp_path):
+    path = str(tmp_path / 'observations.json')
+
+    async def test():
+        scheduler = ObservationScheduler(store=ObservationStore(path))
+        finished = _Observer(await FakeChannel().send('Starting...'))
+        unfinished = _Observer(await FakeChannel().send('Starting...'))
+
+        task = scheduler.schedule(finished)
+        scheduler.schedule(unfinished)
+        assert set(ObservationStore(path).load().keys()) == {finished.id, unfinished.id}
+
+        finished.finish.set()
+        await task
+        assert set(ObservationStore(path).load().keys()) == {unfinished.id}
+
+        # Closing the bot cancels the observation, which leaves it to be resumed.
+        await scheduler.close()
+        return unfinished.id
+
+    observation_id = asyncio.run(test())
+
+    scheduler = ObservationScheduler(store=ObservationStore(path))
+    assert list(scheduler.unfinished().keys()) == [observation_id]
+    assert scheduler.unfinished()[observation_id]['server'] == 'survival'
+
+    scheduler.forget(observation_id)
+    assert scheduler.unfinished() == {}
+    assert ObservationStore(path).load() == {}
@@ -0,0 +1,73 @@
+from fakes.discord_objects import FakeGuild, FakeMember, FakeRole
+from permissions import Action, PermissionIndex, command_masks, from_mask, role_masks, to_mask
+
+
+def _guild():
+    roles = {name: FakeRole(name) for name in ('macaw-starter', 'macaw-stopper', 'macaw-admin', 'other')}
+    return FakeGuild(list(roles.values())), roles
+
+
+def test_masks_round_trip():
+    actions = {Action.START, Action.STATUS, Action.METRICS}
+    assert from_mask(to_mask(actions)) == actions
+    assert from_mask(0) == set()
+
+
+def test_member_mask(settings):
+    guild, roles = _guild()
+    index = PermissionIndex()
+
+    starter = FakeMember(guild, [roles['macaw-starter']])
+    assert from_mask(index.member_mask(starter, guild)) == {Action.START}
+
+    both = FakeMember(guild, [roles['macaw-starter'], roles['macaw-stopper']])
+    assert from_mask(index.member_mask(both, guild)) == {Action.START, Action.STOP}
+
+    admin = FakeMember(guild, [roles['macaw-admin']])
+    assert index.member_mask(admin, guild) == role_masks['admin']
+    assert index.member_mask(admin, guild) & command_masks['issue'] == command_masks['issue']
+
+
+def test_unconfigured_roles_allow_nothing(settings):
+    guild, roles = _guild()
+    index = PermissionIndex()
+
+    assert index.member_mask(FakeMember(guild, [roles['other']]), guild) == 0
+    assert index.member_mask(FakeMember(guild), guild) == 0
+    assert index.member_mask(FakeMember(guild, [roles['macaw-admin']]), None) == 0
+
+
+def test_rebuild_after_roles_change(settings):
+    guild, roles = _guild()
+    index = PermissionIndex()
+    member = FakeMember(guild, [roles['other']])
+    assert index.member_mask(member, guild) == 0
+
+    # The role is renamed to one that's configured, which only counts once the index is rebuilt.
+    roles['other'].name = 'macaw-stopper'
+    assert index.member_mask(member, guild) == 0
+    index.rebuild_guild(guild)
+    assert from_mask(index.member_mask(member, guild)) == {Action.STOP}
+
+
+def test_cached_members(settings):
+    guild, roles = _guild()
+    index = PermissionIndex(cache_members=True)
+    member = FakeMember(guild, [roles['macaw-starter']])
+    assert from_mask(index.member_mask(member, guild)) == {Action.START}
+
+    # The cached mask is used until the member is invalidated.
+    member.roles = [roles['macaw-stopper']]
+    assert from_mask(index.member_mask(member, guild)) == {Action.START}
+    index.invalidate_member(member)
+    assert from_mask(index.member_mask(member, guild)) == {Action.STOP}
+
+
+def test_uncached_members_follow_their_roles(settings):
+    guild, roles = _guild()
+    index = PermissionIndex()
+    member = FakeMember(guild, [roles['macaw-starter']])
+    assert from_mask(index.member_mask(member, guild)) == {Action.START}
+
+    member.roles = [roles['macaw-stopper']]
+    assert from_mask(index.member_mask(member, guild)) == {Action.STOP}
@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from fakes.discord_objects import FakeChannel
+from hub import ServerState
+from macaw_actions import MacawError, MacawStatus
+from presence import PresenceStore, PresenceTracker, format_duration
+
+
+def _state(players: list = None, **kwargs) -> ServerState:
+    if players is None and len(kwargs) == 0:
+        return ServerState(None, None)
+    macaw = MacawStatus(**kwargs) if len(kwargs) > 0 else \
+        MacawStatus(status_code=200, json={'status': 'running', 'players': players})
+    return ServerState(None, macaw)
+
+
+class _NoLimit:
+    async def wait(self, channel_id: int):
+        pass
+
+
+class _Fleet(list):
+    def get(self, name: str):
+        return SimpleNamespace(name=name, profile=SimpleNamespace(presence_channel=1))
+
+
+@pytest.fixture
+def store(tmp_path) -> PresenceStore:
+    store = PresenceStore(str(tmp_path / 'presence.db'))
+    yield store
+    store.close()
+
+
+def _tracker(store: PresenceStore, channel: FakeChannel) -> PresenceTracker:
+    client = SimpleNamespace(get_channel=lambda channel_id: channel)
+    return PresenceTracker(client, None, _Fleet(['survival']), store=store, limiter=_NoLimit())
+
+
+def _announcements(channel: FakeChannel) -> list:
+    return [message.embeds[0].description for message in channel.messages.values()]
+
+
+def test_joins_and_leaves(store):
+    async def test():
+        channel = FakeChannel()
+        tracker = _tracker(store, channel)
+        assert not tracker.tracking('survival')
+
+        await tracker._update('survival', _state(['alice', 'bob']))
+        await tracker._update('survival', _state(['bob', 'alice']))
+        await tracker._update('survival', _state(['bob', 'carol']))
+
+        assert tracker.tracking('survival')
+        assert store.online('survival') == ['bob', 'carol']
+        assert _announcements(channel) == [
+            ':inbox_tray: alice joined\n:inbox_tray: bob joined',
+            ':inbox_tray: carol joined\n:outbox_tray: alice left'
+        ]
+
+        # Everyone leaves when the instance stops.
+        await tracker._update('survival', _state())
+        assert store.online('survival') == []
+        assert _announcements(channel)[-1] == ':outbox_tray: bob left\n:outbox_tray: carol left'
+
+    asyncio.run(test())
+
+
+def test_unusable_status_keeps_the_players(store):
+    async def test():
+        channel = FakeChannel()
+        tracker = _tracker(store, channel)
+
+        await tracker._update('survival', _state(['alice']))
+        await tracker._update('survival', _state(error=MacawError.timeout))
+        await tracker._update('survival', _state(status_code=401, json={'error': 'unauthorised'}))
+
+        assert store.online('survival') == ['alice']
+        assert len(channel.messages) == 1
+
+    asyncio.run(test())
+
+
+def test_sessions_carry_on_after_a_restart(store):
+    async def test():
+        await _tracker(store, FakeChannel())._update('survival', _state(['alice', 'bob']))
+        joined = store.last_session('alice').joined
+
+        # A new tracker picks up the open sessions rather than starting new ones.
+        channel = FakeChannel()
+        await _tracker(store, channel)._update('survival', _state(['alice']))
+
+        assert store.last_session('alice').joined == joined
+        assert store.last_session('alice').left is None
+        assert store.last_session('bob').left is not None
+        assert _announcements(channel) == [':outbox_tray: bob left']
+
+    asyncio.run(test())
+
+
+def test_playtime(store):
+    store.join('survival', ['alice', 'bob'], 100)
+    store.leave('survival', ['alice'], 700)
+    store.leave('survival', ['bob'], 400)
+    store.join('creative', ['alice'], 1000)
+    store.leave('creative', ['alice'], 1300)
+
+    assert store.playtime() == [('alice', 900), ('bob', 300)]
+    assert store.playtime(since=300) == [('alice', 700), ('bob', 100)]
+    assert store.playtime(player='ALICE') == [('alice', 900)]
+    assert store.last_session('alice').server == 'creative'
+    assert store.last_session('dave') is None
+
+
+def test_format_duration():
+    assert format_duration(30) == 'less than a minute'
+    assert format_duration(125 * 60) == '2h 5m'
+    assert format_duration(2 * 86400 + 3 * 3600 + 60) == '2d 3h'
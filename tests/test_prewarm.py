@@ -0,0 +1,94 @@
+import dataclasses
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import config
+import prewarm
+from hub import ServerState
+from macaw_actions import MacawError, MacawStatus
+from prewarm import PLAYERS_CHECK_INTERVAL, Activity, Prewarmer, UsageStore, slot_of, usage_profile
+
+# A Monday evening.
+MONDAY = datetime(2026, 10, 5, 18, 30)
+
+
+def _times(*moments: datetime) -> list:
+    return [moment.timestamp() for moment in moments]
+
+
+def test_usage_profile():
+    week = timedelta(weeks=1)
+    times = _times(MONDAY, MONDAY + week, MONDAY + week + timedelta(minutes=15), MONDAY + 2 * week,
+                   MONDAY + timedelta(days=2, hours=-9))
+    now = (MONDAY + 3 * week + timedelta(days=1)).timestamp()
+
+    # Activity twice in the same week only counts once.
+    assert usage_profile(times, now, 4) == {(0, 18): 0.75, (2, 9): 0.25}
+    assert usage_profile([], now, 4) == {}
+
+
+def test_slot_of():
+    assert slot_of(MONDAY) == (0, 18)
+    assert slot_of(MONDAY + timedelta(days=6, hours=5)) == (6, 23)
+
+
+@pytest.fixture
+def store(tmp_path) -> UsageStore:
+    store = UsageStore(str(tmp_path / 'usage.db'))
+    yield store
+    store.close()
+
+
+def test_store(store):
+    store.record('survival', Activity.start, 100)
+    store.record('survival', Activity.players, 200)
+    store.record('creative', Activity.start, 300)
+
+    assert sorted(store.times('survival', 0)) == [100, 200]
+    assert store.times('survival', 150) == [200]
+
+    store.prune(250)
+    assert store.times('survival', 0) == []
+    assert store.times('creative', 0) == [300]
+
+
+def _state(players: list = None, **kwargs) -> ServerState:
+    macaw = MacawStatus(**kwargs) if len(kwargs) > 0 else \
+        MacawStatus(status_code=200, json={'status': 'running', 'players': players})
+    return ServerState(None, macaw)
+
+
+def test_players_are_recorded_once_an_hour(store, clock, monkeypatch):
+    monkeypatch.setattr(prewarm, 'time', SimpleNamespace(time=clock.monotonic))
+    prewarmer = Prewarmer(None, None, None, None, None, store=store)
+
+    prewarmer._update('survival', _state(['alice']))
+    clock.advance(PLAYERS_CHECK_INTERVAL)
+    prewarmer._update('survival', _state(['alice', 'bob']))
+    assert store.times('survival', 0) == [1000.0]
+
+    # Empty and unusable statuses aren't activity.
+    clock.advance(3600)
+    prewarmer._update('survival', _state([]))
+    prewarmer._update('survival', _state(error=MacawError.timeout))
+    assert len(store.times('survival', 0)) == 1
+
+    clock.advance(PLAYERS_CHECK_INTERVAL)
+    prewarmer._update('survival', _state(['alice']))
+    assert len(store.times('survival', 0)) == 2
+
+
+def test_predicted(settings, store, monkeypatch):
+    monkeypatch.setattr(config, 'settings', lambda: dataclasses.replace(
+        settings, prewarm_weeks=4, prewarm_threshold=0.5))
+    prewarmer = Prewarmer(None, None, None, None, None, store=store)
+
+    now = datetime.now()
+    for weeks in (1, 2):
+        store.record('survival', Activity.start, (now - timedelta(weeks=weeks)).timestamp())
+
+    assert prewarmer.predicted('survival', slot_of(now))
+    assert not prewarmer.predicted('survival', slot_of(now + timedelta(hours=1)))
+    assert not prewarmer.predicted('creative', slot_of(now))
@@ -0,0 +1,88 @@
+import pytest
+
+import config
+import ratelimit
+from fakes.discord_objects import FakeGuild, FakeMember
+from ratelimit import RateLimiter, TokenBucket
+
+
+@pytest.fixture
+def limiter(settings, clock, monkeypatch) -> RateLimiter:
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    return RateLimiter()
+
+
+def test_token_bucket(clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    bucket = TokenBucket(2, 10)
+
+    for _ in range(2):
+        assert bucket.wait_time() == 0
+        bucket.take()
+    assert bucket.wait_time() == pytest.approx(5)
+
+    # Tokens come back at capacity every period, one every 5 seconds here.
+    clock.advance(4)
+    assert bucket.wait_time() == pytest.approx(1)
+    clock.advance(1)
+    assert bucket.wait_time() == 0
+
+
+def test_user_limit(limiter, clock):
+    guild = FakeGuild([])
+    member = FakeMember(guild)
+    requests, period = config.settings().rate_limits['user_write']
+
+    for _ in range(requests):
+        assert limiter.check('start', member, guild) == 0
+    assert limiter.check('start', member, guild) == pytest.approx(period / requests)
+
+    # Other members and other cost classes have their own buckets.
+    assert limiter.check('start', FakeMember(guild), guild) == 0
+    assert limiter.check('status', member, guild) == 0
+
+    clock.advance(period / requests)
+    assert limiter.check('start', member, guild) == 0
+
+
+def test_guild_limit(limiter):
+    guild = FakeGuild([])
+    requests, period = config.settings().rate_limits['guild_read']
+    user_requests, _ = config.settings().rate_limits['user_read']
+
+    members = [FakeMember(guild) for _ in range(requests // user_requests + 1)]
+    allowed = sum(1 for member in members for _ in range(user_requests) if limiter.check('status', member, guild) == 0)
+    assert allowed == requests
+
+    # Members of other guilds and direct messages aren't held back by it.
+    other = FakeGuild([])
+    assert limiter.check('status', FakeMember(other), other) == 0
+    assert limiter.check('status', FakeMember(other), None) == 0
+
+
+def test_denied_check_takes_nothing(limiter, clock):
+    guild = FakeGuild([])
+    member = FakeMember(guild)
+    requests, period = config.settings().rate_limits['user_write']
+
+    for _ in range(requests + 5):
+        limiter.check('issue', member, guild)
+
+    # Only the allowed checks took tokens, so one comes back after the usual wait.
+    clock.advance(period / requests)
+    assert limiter.check('issue', member, guild) == 0
+
+
+def test_unlimited_commands(limiter):
+    guild = FakeGuild([])
+    member = FakeMember(guild)
+    for _ in range(100):
+        assert limiter.check('help', member, guild) == 0
+
+
+def test_parse_rate_limit():
+    assert config.parse_rate_limit('user_read', '5/10') == (5, 10.0)
+
+    for text in ('0/60', '3/0', '3/-1', '5', 'five/10'):
+        with pytest.raises(ValueError):
+            config.parse_rate_limit('user_read', text)
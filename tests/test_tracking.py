@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+import tracking
+from tracking import AdaptiveDelay, StateTracker
+
+
+def test_delay_backs_off():
+    delay = AdaptiveDelay(1, 5)
+    assert [delay.next() for _ in range(5)] == [1, 2, 4, 5, 5]
+
+    delay.reset()
+    assert delay.next() == 1
+
+    # The maximum is never below the initial delay.
+    assert AdaptiveDelay(10, 5).next() == 10
+
+
+# A poll that returns states in order, repeating the last one.
+def _poll(states: list):
+    states = list(states)
+
+    async def poll():
+        return states.pop(0) if len(states) > 1 else states[0]
+
+    return poll
+
+
+@pytest.fixture
+def tracker(settings, clock, monkeypatch) -> StateTracker:
+    monkeypatch.setattr(tracking, 'time', clock)
+    return StateTracker(_poll(['steady']), {'pending': 30}, initial=10, minimum=1, maximum=60)
+
+
+def test_steady_state_backs_off(tracker, clock):
+    assert [tracker._next_delay('steady', clock.now) for _ in range(5)] == [10, 20, 40, 60, 60]
+
+
+def test_transition_is_polled_quickly(tracker, clock):
+    changed_at = clock.now
+    assert tracker._next_delay('pending', changed_at) == 10
+
+    # Don't sleep past the expected transition.
+    clock.advance(25)
+    assert tracker._next_delay('pending', changed_at) == 5
+
+    # The transition is due.
+    clock.advance(15)
+    assert tracker._next_delay('pending', changed_at) == 1
+
+    # It's so overdue that polling backs off again.
+    clock.advance(30)
+    assert tracker._next_delay('pending', changed_at) == 60
+
+
+def test_wait_for(settings):
+    async def test():
+        tracker = StateTracker(_poll(['pending', 'pending', 'running']), initial=0, minimum=0, maximum=0)
+        changes = []
+
+        async def on_change(state):
+            changes.append(state)
+
+        assert await tracker.wait_for(lambda state: state == 'running', on_change) == 'running'
+        assert changes == ['pending', 'running']
+        assert tracker.polls == 3
+
+    asyncio.run(test())
+
+
+def test_wake_polls_straight_away(settings):
+    async def test():
+        tracker = StateTracker(_poll(['pending', 'running']), initial=60, minimum=60, maximum=60)
+        waiting = asyncio.ensure_future(tracker.wait_for(lambda state: state == 'running'))
+
+        await asyncio.sleep(0.05)
+        assert tracker.polls == 1
+
+        tracker.wake()
+        assert await asyncio.wait_for(waiting, 1) == 'running'
+        assert tracker.polls == 2
+
+    asyncio.run(test())
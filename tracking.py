@@ -0,0 +1,113 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+import config
+
+
+#
+# Works out how long to wait between polls. The delay starts at the initial
+# value after each change and grows exponentially up to the maximum while the
+# state stays the same.
+#
+class AdaptiveDelay:
+    def __init__(self, initial: float, maximum: float, factor: float = 2):
+        self._initial = initial
+        self._maximum = max(initial, maximum)
+        self._factor = factor
+        self._current = initial
+
+    def reset(self):
+        self._current = self._initial
+
+    def next(self) -> float:
+        delay = self._current
+        self._current = min(self._current * self._factor, self._maximum)
+        return delay
+
+
+#
+# Tracks a state by polling it adaptively. Polls back off while the state is
+# steady and speed up to the minimum delay around the time a transition is
+# expected, given how long each state usually lasts.
+#
+# Anything that learns about a change some other way (a push source) can call
+# wake() to make the tracker poll straight away.
+#
+class StateTracker:
+    # poll is a coroutine function returning the current state. expected maps
+    # states to the number of seconds they usually last. If the states are
+    # richer than the keys of expected, phase maps a state to its key.
+    def __init__(self, poll: Callable[[], Awaitable], expected: dict = None, phase: Callable = None,
+                 initial: float = None, minimum: float = None, maximum: float = None):
+        settings = config.settings()
+
+        self._poll = poll
+        self._expected = expected or {}
+        self._phase = phase or (lambda state: state)
+        self._minimum = settings.poll_min_delay if minimum is None else minimum
+        self._delay = AdaptiveDelay(
+            settings.check_delay if initial is None else initial,
+            settings.poll_max_delay if maximum is None else maximum)
+
+        self._wake = asyncio.Event()
+        self.polls = 0
+
+    # Poll straight away rather than waiting for the current delay to pass.
+    def wake(self):
+        self._wake.set()
+
+    async def _sleep(self, delay: float):
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    # How long to wait before the next poll, given how long ago the state changed.
+    def _next_delay(self, state, changed_at: float) -> float:
+        delay = self._delay.next()
+        expected = self._expected.get(self._phase(state))
+
+        if expected is not None:
+            remaining = changed_at + expected - time.monotonic()
+            if remaining > 0:
+                # Don't sleep past the point the transition is expected.
+                delay = min(delay, max(remaining, self._minimum))
+            elif -remaining < expected:
+                # The transition is due, so poll quickly until it happens or
+                # it's so overdue that backing off is more sensible.
+                delay = self._minimum
+
+        return delay
+
+    # Poll until predicate(state) is true and return the final state.
+    # on_change is awaited with every new state, including the first.
+    async def wait_for(self, predicate: Callable, on_change: Callable = None):
+        state = await self._poll()
+        self.polls += 1
+        changed_at = time.monotonic()
+        self._delay.reset()
+
+        if on_change is not None:
+            await on_change(state)
+
+        while not predicate(state):
+            await self._sleep(self._next_delay(state, changed_at))
+
+            new_state = await self._poll()
+            self.polls += 1
+
+            if new_state != state:
+                state = new_state
+                changed_at = time.monotonic()
+                self._delay.reset()
+
+                if on_change is not None:
+                    await on_change(state)
+
+        return state
+
+    # Poll forever, awaiting on_change with every new state.
+    async def run(self, on_change: Callable):
+        await self.wait_for(lambda state: False, on_change)